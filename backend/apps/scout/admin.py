@@ -8,3 +8,4 @@ admin.site.register(models.DataSource)
 admin.site.register(models.UserFile)
 admin.site.register(models.UserProfile)
 admin.site.register(models.UserProject)
+admin.site.register(models.RecipeRun)
@@ -2,4 +2,11 @@ from django.apps import AppConfig
 
 
 class ScoutConfig(AppConfig):
-    name = 'scout'
+    name = 'apps.scout'
+    label = 'scout'
+
+    def ready(self):
+        # Connect the signal handlers that keep the caches in sync with the models
+        from . import signals  # noqa: F401
+        # Configure new database connections (e.g. WAL mode for SQLite)
+        from . import database  # noqa: F401
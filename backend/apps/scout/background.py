@@ -0,0 +1,55 @@
+"""
+Short background tasks of the web server, like converting an uploaded file. The tasks run in a small pool of threads, so
+the request that triggered them doesn't wait for them. A task is only started after the current transaction commits, so
+it sees the changes that triggered it. Running recipes on all data is longer work, which is done by the job workers
+instead (see the jobs module).
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+DEFAULT_BACKGROUND_THREADS = 2
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool(threads: int) -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="scout-background")
+    return _pool
+
+
+def _run(func, args: tuple, close_connection: bool):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception(f"Background task {func.__name__} failed")
+    finally:
+        # Every thread of the pool has its own database connection
+        if close_connection:
+            connection.close()
+
+
+def submit(func, *args):
+    """
+    Run a function in the background, once the current transaction is committed. Exceptions are logged. If
+    SCOUT_BACKGROUND_THREADS is 0, the function runs right away (after the commit) in the current thread.
+
+    :param func: The function to run
+    :param args: The arguments of the function
+    :return:
+    """
+    threads = getattr(settings, "SCOUT_BACKGROUND_THREADS", DEFAULT_BACKGROUND_THREADS)
+    if threads <= 0:
+        transaction.on_commit(lambda: _run(func, args, False))
+    else:
+        transaction.on_commit(lambda: _get_pool(threads).submit(_run, func, args, True))
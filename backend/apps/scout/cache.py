@@ -0,0 +1,170 @@
+"""
+In-memory cache of intermediate pipeline results. Every entry holds the data after the first N transformations of a
+pipeline, keyed by a hash of everything that determines that data: the data source (including the identity of the
+uploaded files it reads), the sampling settings and the first N transformation steps. Because the key is derived from
+the content, a changed transformation simply leads to a different key. The tags stored with every entry are used to
+free the memory of entries that can no longer be reached. Only data read from uploaded files is cached, the key can't
+tell when the data in a database (e.g. SQL or BigQuery) changed.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import List, Optional, Tuple
+
+import cachetools
+from django.conf import settings
+
+DEFAULT_RESULT_CACHE_SIZE = 256 * 1024 * 1024
+
+
+def _sizeof(value) -> int:
+    df, _, _ = value
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def file_identity(value) -> list:
+    """
+    Get the identity (path, modification time and size) of all uploaded files a data source definition reads from. The
+    definition is searched recursively, so files used by joins and wrapped data sources are found as well.
+
+    :param value: The data source definition (or a part of it)
+    :return: A list of [path, mtime, size] lists
+    """
+    files = []
+    if isinstance(value, dict):
+        for item in value.values():
+            files.extend(file_identity(item))
+    elif isinstance(value, list):
+        for item in value:
+            files.extend(file_identity(item))
+    elif isinstance(value, str) and value.startswith(str(settings.MEDIA_ROOT)) and os.path.isfile(value):
+        stat = os.stat(value)
+        files.append([value, stat.st_mtime_ns, stat.st_size])
+    return files
+
+
+def is_cacheable(data_source: dict) -> bool:
+    """
+    Check whether the results of a data source definition can be cached, which is the case if all data is read from
+    uploaded files. Both inputs of a join have to be cacheable.
+
+    :param data_source: The data source definition (source and kwargs)
+    :return: True if the results can be cached
+    """
+    if data_source["source"] == "join":
+        return all(is_cacheable(data_source["kwargs"][side]["data_source"]) for side in ("left", "right"))
+    return len(file_identity(data_source)) > 0
+
+
+def prefix_keys(data_source: dict, pipeline: List[dict], use_sample: bool, sampling_technique: str,
+                column_types: bool) -> List[str]:
+    """
+    Generate the cache keys for every prefix of a pipeline. The key at position N identifies the data after the first N
+    transformations (so position 0 is the raw data source).
+
+    :param data_source: The data source definition (source and kwargs)
+    :param pipeline: The list of transformation steps
+    :param use_sample: Whether the data is sampled
+    :param sampling_technique: The (effective) sampling technique
+    :param column_types: Whether the column types of every step are collected
+    :return: A list of len(pipeline) + 1 keys
+    """
+    digest = hashlib.sha256(json.dumps({
+        "data_source": data_source,
+        "files": file_identity(data_source),
+        "use_sample": use_sample,
+        "sampling_technique": sampling_technique,
+        "column_types": column_types,
+    }, sort_keys=True, default=str).encode("utf-8"))
+    keys = [digest.hexdigest()]
+    for step in pipeline:
+        digest.update(json.dumps(step, sort_keys=True, default=str).encode("utf-8"))
+        keys.append(digest.hexdigest())
+    return keys
+
+
+class _TaggedLRUCache(cachetools.LRUCache):
+    """
+    LRU cache that keeps an index of tag -> keys up to date, also when entries are evicted.
+    """
+
+    def __init__(self, maxsize):
+        super().__init__(maxsize, getsizeof=_sizeof)
+        self.tag_index = {}
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        for tag in value[2]:
+            self.tag_index.setdefault(tag, set()).add(key)
+
+    def __delitem__(self, key):
+        _, _, tags = super().__getitem__(key)
+        super().__delitem__(key)
+        for tag in tags:
+            keys = self.tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if len(keys) == 0:
+                    del self.tag_index[tag]
+
+
+class ResultCache:
+    """
+    A size bounded (in bytes) LRU cache of intermediate results. The cache is safe to use from multiple threads.
+    """
+
+    def __init__(self, max_size: int):
+        self._cache = _TaggedLRUCache(max_size)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple["pandas.DataFrame", list]]:
+        """
+        Get an intermediate result. A copy is returned, so the caller is free to modify it.
+
+        :param key: The key, as generated by prefix_keys
+        :return: A tuple of the data frame and the column types of the steps so far, or None if it isn't cached
+        """
+        with self._lock:
+            value = self._cache.get(key)
+        if value is None:
+            return None
+        df, columns, _ = value
+        return df.copy(), [dict(step_columns) for step_columns in columns]
+
+    def set(self, key: str, df, columns: list, tags: List[str]):
+        """
+        Store an intermediate result. The data frame is stored as-is, so the caller shouldn't modify it afterwards.
+
+        :param key: The key, as generated by prefix_keys
+        :param df: The data frame containing the data
+        :param columns: The column types of all steps so far
+        :param tags: The objects (e.g. "transformation:1") this result depends on
+        :return:
+        """
+        value = (df, list(columns), frozenset(tags))
+        with self._lock:
+            try:
+                self._cache[key] = value
+            except ValueError:
+                # The value is larger than the cache itself, so we won't store it
+                pass
+
+    def invalidate(self, tag: str):
+        """
+        Remove all results that depend on the given object.
+
+        :param tag: The tag of the object, e.g. "data_source:1"
+        :return:
+        """
+        with self._lock:
+            for key in list(self._cache.tag_index.get(tag, ())):
+                self._cache.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+result_cache = ResultCache(getattr(settings, "SCOUT_RESULT_CACHE_SIZE", DEFAULT_RESULT_CACHE_SIZE))
@@ -0,0 +1,101 @@
+"""
+Connectors that are only used internally, they aren't shown as data source types to users. These are kept out of the
+modules that are imported at startup, because importing data scout (and with it pandas) is slow.
+"""
+
+import json
+import logging
+import os
+from typing import List
+
+from data_scout.connectors import Connector, DATA_SOURCE_MAP
+
+from .snapshots import SNAPSHOT_SOURCE, read_snapshot, snapshot_dir, snapshot_fingerprint, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotConnector(Connector):
+    """
+    Connector that wraps another connector. Samples are read from (and, if needed, written to) a snapshot, loading all
+    data is passed on to the wrapped connector.
+    """
+
+    def __init__(self, arguments: dict):
+        """
+        :param arguments: A dict containing the data_source (id), source and kwargs of the wrapped data source
+        """
+        super().__init__(arguments)
+        self.data_source_id = arguments["data_source"]
+        self.data_source = {"source": arguments["source"], "kwargs": arguments["kwargs"]}
+        self.connector = DATA_SOURCE_MAP[arguments["source"]](arguments["kwargs"])
+        self.SAMPLING_TECHNIQUES = self.connector.SAMPLING_TECHNIQUES
+
+    def __call__(self, sample: bool = False, sampling_technique: str = "top", column_types: bool = False) -> List[dict]:
+        if not sample:
+            return self.connector(sample, sampling_technique, column_types)
+
+        directory = snapshot_dir(self.data_source_id)
+        file_name = f"{sampling_technique}-{snapshot_fingerprint(self.data_source, sampling_technique)}.parquet"
+        path = os.path.join(directory, file_name)
+        if os.path.exists(path):
+            return read_snapshot(path)
+
+        records = self.connector(sample, sampling_technique, column_types)
+        os.makedirs(directory, exist_ok=True)
+        try:
+            write_snapshot(path, records)
+        except Exception as e:
+            # Not every sample fits a columnar format (e.g. columns with mixed types), those are never snapshotted
+            logger.info(f"Couldn't create a snapshot of data source {self.data_source_id}: {e}")
+            return records
+
+        # Snapshots with the same sampling technique but a different fingerprint are outdated
+        for other_file_name in os.listdir(directory):
+            if other_file_name.startswith(f"{sampling_technique}-") and other_file_name.endswith(".parquet") and \
+                    other_file_name != file_name:
+                try:
+                    os.remove(os.path.join(directory, other_file_name))
+                except FileNotFoundError:
+                    pass
+        # We read the snapshot we've just written, to make sure the data is exactly the same as in later calls
+        return read_snapshot(path)
+
+
+class IngestedConnector(Connector):
+    """
+    Connector that wraps another connector. Loading all data reads the Parquet files of an ingested user file (see the
+    ingest module), samples are taken by the wrapped connector.
+    """
+
+    def __init__(self, arguments: dict):
+        """
+        :param arguments: A dict containing the path of the ingested data and the source and kwargs of the wrapped data
+        source (which may be a snapshot)
+        """
+        super().__init__(arguments)
+        self.path = arguments["path"]
+        connectors = dict(DATA_SOURCE_MAP, **{SNAPSHOT_SOURCE: SnapshotConnector})
+        self.connector = connectors[arguments["source"]](arguments["kwargs"])
+        self.SAMPLING_TECHNIQUES = self.connector.SAMPLING_TECHNIQUES
+
+    def __call__(self, sample: bool = False, sampling_technique: str = "top", column_types: bool = False) -> List[dict]:
+        if sample:
+            return self.connector(sample, sampling_technique, column_types)
+
+        import numpy as np
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        tables = [pq.read_table(os.path.join(self.path, file_name), memory_map=True)
+                  for file_name in sorted(os.listdir(self.path)) if file_name.endswith(".parquet")]
+        if len(tables) == 0:
+            return []
+        table = pa.concat_tables(tables)
+
+        # The records have to be the same as those of the wrapped connector, which reads the file with pandas: integer
+        # columns with missing values become float and missing values are NaN (instead of None)
+        df = table.to_pandas()
+        df.columns = json.loads(table.schema.metadata[b"column_names"])
+        for name in df.columns[df.dtypes == object]:
+            df[name] = df[name].where(df[name].notna(), np.nan)
+        return df.to_dict(orient="records")
@@ -0,0 +1,18 @@
+"""
+Set up database connections. SQLite is switched to write-ahead logging (WAL), so reading doesn't block writing (and vice
+versa) when the web server and the run workers use the database at the same time.
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" or not getattr(settings, "SCOUT_SQLITE_WAL", True):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # With WAL, this is still safe against corruption and saves a sync on every commit
+        cursor.execute("PRAGMA synchronous=NORMAL")
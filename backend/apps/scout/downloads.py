@@ -0,0 +1,129 @@
+"""
+Downloads of stored files (uploaded files, results of runs). Responses support conditional requests (ETag and
+Last-Modified) and single byte ranges, so clients can resume downloads. Optionally, the bytes are sent by the reverse
+proxy instead of a Python worker (SCOUT_SENDFILE):
+- "x-accel-redirect" for nginx, which needs an internal location that serves the media root, e.g.:
+      location /protected-media/ { internal; alias /path/to/media/root/; }
+- "x-sendfile" for Apache (mod_xsendfile) and lighttpd, which receive the path of the file
+"""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+DEFAULT_SENDFILE_PREFIX = "/protected-media/"
+RANGE_BLOCK_SIZE = 64 * 1024
+
+_range_re = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header: str, size: int):
+    """
+    Parse a Range header. Only a single range is supported, other headers are ignored (which is allowed by RFC 7233).
+
+    :param header: The value of the Range header
+    :param size: The size of the file
+    :return: None if the whole file should be sent, (start, end) (inclusive) for a range or False if the range can't
+    be satisfied
+    """
+    match = _range_re.match(header.strip())
+    if match is None or match.group(1) == match.group(2) == "":
+        return None
+    if match.group(1) == "":
+        # A suffix range: the last n bytes
+        length = int(match.group(2))
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(match.group(1))
+    end = min(int(match.group(2)), size - 1) if match.group(2) != "" else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def _read_range(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(RANGE_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def _content_disposition(download_name: str) -> str:
+    try:
+        download_name.encode("ascii")
+        return 'attachment; filename="{}"'.format(download_name.replace("\\", "\\\\").replace('"', r'\"'))
+    except UnicodeEncodeError:
+        return "attachment; filename*=utf-8''{}".format(quote(download_name))
+
+
+def file_response(request, file_name: str, download_name: str, content_type: str = None, etag: str = None):
+    """
+    Create a response that sends a stored file as an attachment.
+
+    :param request: The request
+    :param file_name: The name of the file in the default storage
+    :param download_name: The name of the file for the client
+    :param content_type: The content type, guessed from the download name if not given
+    :param etag: The ETag of the file (e.g. based on its checksum), if not given it's based on the modification time
+    and size
+    :return: The response
+    """
+    try:
+        path = default_storage.path(file_name)
+        stat = os.stat(path)
+    except (FileNotFoundError, TypeError):
+        raise Http404("The file doesn't exist (anymore)")
+    size, last_modified = stat.st_size, int(stat.st_mtime)
+    if etag is None:
+        etag = f'"{last_modified:x}-{size:x}"'
+    if content_type is None:
+        content_type = mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    sendfile = getattr(settings, "SCOUT_SENDFILE", None)
+    if sendfile == "x-accel-redirect":
+        # nginx takes care of ranges and conditional requests itself
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, "SCOUT_SENDFILE_PREFIX", DEFAULT_SENDFILE_PREFIX)
+        response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(file_name.replace(os.sep, "/"))
+    elif sendfile == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = path
+    else:
+        byte_range = None
+        if_range = request.META.get("HTTP_IF_RANGE")
+        if "HTTP_RANGE" in request.META and (if_range is None or if_range in (etag, http_date(last_modified))):
+            byte_range = _parse_range(request.META["HTTP_RANGE"], size)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+        elif byte_range is not None:
+            start, end = byte_range
+            response = StreamingHttpResponse(_read_range(path, start, end - start + 1), status=206,
+                                             content_type=content_type)
+            response["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response["Content-Length"] = str(end - start + 1)
+        else:
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+        response["Accept-Ranges"] = "bytes"
+
+    response["Content-Disposition"] = _content_disposition(download_name)
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
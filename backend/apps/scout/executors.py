@@ -0,0 +1,250 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Tuple
+
+import pandas as pd
+from django.conf import settings
+from data_scout.connectors.join import Join
+from data_scout.exceptions import IndexFilterException, PipelineException, TransformationUnavailableException
+from data_scout.executor import PandasExecutor
+from data_scout.scout import Scout
+
+from .cache import ResultCache, is_cacheable, prefix_keys
+
+DEFAULT_JOIN_PARALLELISM = 4
+
+_join_pool = None
+_join_slots = None
+_join_pool_lock = threading.Lock()
+
+
+def _get_join_pool() -> Tuple[ThreadPoolExecutor, threading.Semaphore]:
+    """
+    Get the thread pool that executes join inputs, together with a semaphore that counts its free threads. The pool is
+    started on first use.
+
+    :return: The pool and the semaphore, or (None, None) if join inputs shouldn't run in parallel
+    """
+    global _join_pool, _join_slots
+    threads = getattr(settings, "SCOUT_JOIN_PARALLELISM", DEFAULT_JOIN_PARALLELISM) - 1
+    if threads <= 0:
+        return None, None
+    with _join_pool_lock:
+        if _join_pool is None:
+            _join_pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="scout-join")
+            _join_slots = threading.Semaphore(threads)
+    return _join_pool, _join_slots
+
+
+class RunMemo:
+    """
+    The results of the (join inputs of a) run, shared by all executors of the run. Every result is computed by the
+    first executor that asks for it, executors that need it at the same time wait for that one.
+    """
+
+    def __init__(self):
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: str) -> Tuple[Future, bool]:
+        """
+        Get the future of a result.
+
+        :param key: The key of the result, as generated by prefix_keys
+        :return: The future and whether the caller is the one that should compute the result
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                return future, False
+            future = self._futures[key] = Future()
+            return future, True
+
+
+class ParallelJoin(Join):
+    """
+    Join connector that executes its left input in the join thread pool (if there's a free thread), while the right
+    input is executed in the current thread. Joins in the inputs do the same, so independent branches of a join tree
+    run concurrently. The inputs are taken as data frames, without converting them to records first.
+    """
+
+    def __call__(self, sample: bool = False, sampling_technique: str = "top", column_types: bool = False) -> List[dict]:
+        pool, slots = _get_join_pool()
+        if slots is not None and slots.acquire(blocking=False):
+            # A slot is only taken when a thread is free, so the submitted input never waits for a queued input
+            def run_left():
+                try:
+                    return self.left.execute(sample, sampling_technique, False)
+                finally:
+                    slots.release()
+            future_left = pool.submit(run_left)
+        else:
+            future_left = Future()
+            try:
+                future_left.set_result(self.left.execute(sample, sampling_technique, False))
+            except BaseException as e:
+                future_left.set_exception(e)
+        df_right, _ = self.right.execute(sample, sampling_technique, False)
+        df_left, _ = future_left.result()
+        data = df_left.merge(df_right, left_on=self.on_left, right_on=self.on_right, how=self.how)
+        return data.to_dict(orient="records")
+
+
+class CachingPandasExecutor(PandasExecutor):
+    """
+    Pandas executor that stores the result of every step in a ResultCache. When (part of) the pipeline was executed
+    before, execution resumes from the longest cached prefix instead of reloading the data source.
+
+    The inputs of joins are executed by executors that share a memo with the executor of the recipe itself. Every
+    distinct input (a data source or recipe that's used multiple times in the join tree) is only executed once per run.
+    The left and right inputs of a join are executed in parallel (see ParallelJoin).
+    """
+
+    def __init__(self, data_source: dict, pipeline: List[dict], scout: Scout, cache: ResultCache = None,
+                 source_tags: List[str] = None, step_tags: List[str] = None,
+                 progress: Callable[[int, int], None] = None, memo: RunMemo = None):
+        """
+        :param data_source: The data source definition
+        :param pipeline: The list of transformation steps
+        :param scout: An initialized data scout Scout object
+        :param cache: The cache to use, if None nothing is cached (this is the case for the sides of a join). Data that
+        isn't read from uploaded files is never cached (see is_cacheable).
+        :param source_tags: The objects the data source depends on (e.g. "data_source:1")
+        :param step_tags: One tag per transformation step (e.g. "transformation:1")
+        :param progress: Called with the number of executed steps and the total number of steps after every step
+        :param memo: The results of the join inputs executed so far in this run (shared by all executors of a run)
+        """
+        self.memo = RunMemo() if memo is None else memo
+        if data_source["source"] == "join":
+            self.scout = scout
+            self.pipeline = pipeline
+            self.data_source = ParallelJoin({
+                "left": self._join_input(data_source["kwargs"]["left"]),
+                "right": self._join_input(data_source["kwargs"]["right"]),
+                "on_left": data_source["kwargs"]["on_left"],
+                "on_right": data_source["kwargs"]["on_right"],
+                "how": data_source["kwargs"]["how"],
+            })
+        else:
+            super().__init__(data_source, pipeline, scout)
+        self.data_source_definition = data_source
+        self.cache = cache if cache is not None and is_cacheable(data_source) else None
+        self.source_tags = source_tags or []
+        self.step_tags = step_tags or []
+        self.progress = progress
+
+    def _join_input(self, definition: dict) -> "CachingPandasExecutor":
+        return self.__class__(data_source=definition["data_source"], pipeline=definition["pipeline"],
+                              scout=self.scout, memo=self.memo)
+
+    def _tags(self, steps: int) -> List[str]:
+        return self.source_tags + self.step_tags[:steps]
+
+    def _store(self, keys: List[str], steps: int, df_records: pd.DataFrame, columns: list):
+        self.cache.set(keys[steps], df_records.copy(), columns, self._tags(steps))
+
+    def execute(self, use_sample: bool = True, sampling_technique: str = 'top',
+                column_types: bool = False) -> Tuple[pd.DataFrame, list]:
+        """
+        Execute the pipeline that this executor was initialized with. This mirrors PandasExecutor.__call__, but skips
+        the steps that are already in the cache and returns the result as a data frame.
+
+        :param use_sample: Should the data be sampled?
+        :param sampling_technique: What sampling technique to use (only if use_sample is true)?
+        :param column_types: Should the column types of all steps be returned? If not, an empty list is returned
+        :return: A data frame containing the data and a list of dicts representing the columns and column types.
+        """
+        transformation_list = self._get_transformations()
+        if use_sample:
+            sampling_technique = self._get_sampling_technique(sampling_technique, transformation_list)
+
+        keys = prefix_keys(self.data_source_definition, self.pipeline, use_sample, sampling_technique, column_types)
+        # The same input might be used multiple times in a join tree, it's only executed once
+        future, owner = self.memo.claim(keys[-1])
+        if not owner:
+            df_records, columns = future.result()
+            return df_records.copy(), list(columns)
+        try:
+            df_records, columns = self._execute(transformation_list, keys, use_sample, sampling_technique, column_types)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result((df_records, list(columns)))
+        return df_records, columns
+
+    def _execute(self, transformation_list: list, keys: List[str], use_sample: bool, sampling_technique: str,
+                 column_types: bool) -> Tuple[pd.DataFrame, list]:
+        # Find the longest prefix of the pipeline that has already been executed. Every cached result includes the
+        # column types of its own step.
+        start, cached = 0, None
+        if self.cache is not None:
+            for start in range(len(keys) - 1, -1, -1):
+                cached = self.cache.get(keys[start])
+                if cached is not None:
+                    break
+
+        if cached is None:
+            df_records, columns = None, []
+            records = self.load_data(use_sample, sampling_technique)
+        elif start == len(transformation_list):
+            # The whole pipeline was executed before
+            return cached
+        else:
+            df_records, columns = cached
+            records = df_records.to_dict(orient="records")
+
+        for t, step, t_class in transformation_list[start:]:
+            try:
+                sample_size = len(records)
+                # Before each step we create a list of columns and column types that are available (unless the data
+                # before this step came from the cache)
+                if t - 1 > start or cached is None:
+                    if column_types:
+                        step_columns, df_records = self._get_columns(records)
+                        columns.append(step_columns)
+                    elif self.cache is not None or t_class.is_global:
+                        df_records = self._make_dataframe(records)
+                    if self.cache is not None:
+                        self._store(keys, t - 1, df_records, columns)
+
+                t_func = t_class(step["kwargs"], sample_size, records[0])
+                # If it's a global transformation, we'll call it on all records, if it isn't, we call it one-at-a-time
+                if t_func.is_global:
+                    records = self._apply_global(df_records, t_func)
+                elif t_func.is_flatten:
+                    records = self._apply_flatten(records, t_func)
+                else:
+                    records = self._apply(records, t_func)
+                if t_func.filter:
+                    records = self._filter(records)
+            except IndexFilterException as e:
+                self.scout.log.warning(f"Transformation {t}: {e}")
+            except TransformationUnavailableException as e:
+                self.scout.log.warning(f"Transformation {t}: {e}")
+            except Exception as e:
+                raise PipelineException(transformation=t, original_exception=e)
+            if self.progress is not None:
+                self.progress(t, len(transformation_list))
+
+        if column_types:
+            step_columns, df_records = self._get_columns(records)
+            columns.append(step_columns)
+        else:
+            df_records = self._make_dataframe(records)
+        if self.cache is not None:
+            self._store(keys, len(transformation_list), df_records, columns)
+
+        return df_records, columns
+
+    def __call__(self, use_sample: bool = True, sampling_technique: str = 'top', column_types: bool = False):
+        """
+        Execute the pipeline that this executor was initialized with.
+
+        :param use_sample: Should the data be sampled?
+        :param sampling_technique: What sampling technique to use (only if use_sample is true)?
+        :param column_types: Should the column types of all steps be returned? If not, an empty list is returned
+        :return: A list of dictionary objects representing the data and a list of dicts representing the columns and
+        column types.
+        """
+        df_records, columns = self.execute(use_sample, sampling_technique, column_types)
+        return df_records.to_dict(orient="records"), columns
@@ -0,0 +1,74 @@
+"""
+Content fingerprints of recipes. A fingerprint is a hash of the complete pipeline definition (data source, joins, nested
+recipes and transformations) and the checksums of all uploaded files it reads. If the fingerprint didn't change, neither
+did the result, which allows clients to skip fetching it again (see the ETag handling in views.wrangler).
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import cachetools
+from django.conf import settings
+
+from .cache import file_identity
+from .models import UserFile
+
+CHECKSUM_BLOCK_SIZE = 1024 * 1024
+
+# Checksums of files that weren't stored at upload time, keyed by (path, modification time, size)
+_checksums = cachetools.LRUCache(maxsize=1024)
+_checksums_lock = threading.Lock()
+
+
+def compute_checksum(file_obj) -> str:
+    """
+    Calculate the SHA-256 checksum of a file, reading it block by block.
+
+    :param file_obj: A file object opened in binary mode
+    :return: The hexadecimal checksum
+    """
+    digest = hashlib.sha256()
+    for block in iter(lambda: file_obj.read(CHECKSUM_BLOCK_SIZE), b""):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def file_checksums(definition: dict) -> dict:
+    """
+    Get the checksums of all uploaded files a pipeline definition reads. Checksums stored on the UserFile objects are
+    used where possible, the others are calculated (and remembered as long as the file isn't modified).
+
+    :param definition: The pipeline definition (or data source definition)
+    :return: A dict of path -> checksum
+    """
+    files = file_identity(definition)
+    file_names = {os.path.relpath(path, settings.MEDIA_ROOT): path for path, _, _ in files}
+    checksums = {file_names[file_name]: checksum for file_name, checksum in UserFile.objects.filter(
+        file_name__in=list(file_names), checksum__isnull=False).values_list("file_name", "checksum")}
+    for path, mtime, size in files:
+        if path in checksums:
+            continue
+        with _checksums_lock:
+            checksum = _checksums.get((path, mtime, size))
+        if checksum is None:
+            with open(path, "rb") as file_obj:
+                checksum = compute_checksum(file_obj)
+            with _checksums_lock:
+                _checksums[(path, mtime, size)] = checksum
+        checksums[path] = checksum
+    return checksums
+
+
+def definition_fingerprint(definition: dict) -> str:
+    """
+    Calculate the fingerprint of a pipeline definition.
+
+    :param definition: The pipeline definition, as generated by _recipe_to_pipeline
+    :return: The hexadecimal fingerprint
+    """
+    return hashlib.sha256(json.dumps({
+        "definition": definition,
+        "files": file_checksums(definition),
+    }, sort_keys=True, default=str).encode("utf-8")).hexdigest()
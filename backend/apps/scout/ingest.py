@@ -0,0 +1,312 @@
+"""
+Uploaded files are parsed once, after they're uploaded (or the settings of their data source change), and stored as
+Parquet files in the media directory. Running a recipe on all data reads those instead of parsing the original file
+(e.g. a CSV or Excel file) again. Saving a user file or data source queues the file, the workers that execute recipe
+runs (see the jobs module) claim and ingest it, so the web server never parses a complete file.
+
+CSV files are streamed: they're read in blocks by the Arrow CSV reader and written part by part, so memory use doesn't
+depend on the size of the file. Columns with dates and times are kept as text, like the CSV connector does. Other
+sources (e.g. Excel files) are loaded by the connector of their data source.
+
+The Parquet files of a user file are stored in a directory named after a fingerprint of the file's checksum and the
+settings of the data source, so a copy that's outdated is never used. Only data sources with a single file are
+ingested, the copy of a data source with more files would depend on all of them.
+"""
+
+import csv
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+
+from django.conf import settings
+
+from .models import UserFile
+from .snapshots import records_to_table
+
+INGESTED_DIR = "ingested"
+INGESTED_SOURCE = "Ingested"
+DEFAULT_INGEST_PART_ROWS = 1000000
+
+logger = logging.getLogger(__name__)
+
+
+def _ingested_dir(user_file_id: int) -> str:
+    return os.path.join(settings.MEDIA_ROOT, INGESTED_DIR, str(user_file_id))
+
+
+def ingest_fingerprint(user_file: UserFile, source: str, kwargs: dict) -> str:
+    """
+    Get the fingerprint of everything that determines the ingested data of a user file.
+
+    :param user_file: The user file
+    :param source: The type of the data source that uses the file
+    :param kwargs: The settings of the data source (as stored, so with the ids of the user files)
+    :return: The fingerprint
+    """
+    return hashlib.sha256(json.dumps({
+        "checksum": user_file.checksum,
+        "source": source,
+        "kwargs": {key: value for key, value in kwargs.items() if key != user_file.field_name},
+    }, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def ingested_path(user_file: UserFile, source: str, kwargs: dict):
+    """
+    Get the directory with the ingested data of a user file, if it's up to date.
+
+    :param user_file: The user file
+    :param source: The type of the data source that uses the file
+    :param kwargs: The settings of the data source (as stored, so with the ids of the user files)
+    :return: The absolute path of the directory, or None if there's no (up to date) ingested copy
+    """
+    if user_file.ingested_path is None or user_file.ingest_fingerprint != ingest_fingerprint(user_file, source, kwargs):
+        return None
+    path = os.path.join(settings.MEDIA_ROOT, user_file.ingested_path)
+    return path if os.path.isdir(path) else None
+
+
+def ingested_definition(path: str, data_source: dict) -> dict:
+    """
+    Wrap a data source definition, so all data is read from the ingested copy of its file.
+
+    :param path: The directory with the ingested data (see ingested_path)
+    :param data_source: The data source definition (source and kwargs)
+    :return: The wrapped data source definition
+    """
+    return {"source": INGESTED_SOURCE, "kwargs": {"path": path, **data_source}}
+
+
+def reset_ingested(user_file: UserFile):
+    """
+    Clear everything that was derived from the previous file of a user file, when a new file is attached to it. This
+    only changes the object, the caller saves it (which queues the new file to be ingested).
+
+    :param user_file: The user file
+    :return:
+    """
+    user_file.ingest_status = None
+    user_file.ingest_worker = None
+    user_file.ingested_path = None
+    user_file.ingest_fingerprint = None
+    user_file.row_count = None
+    user_file.schema = None
+    user_file.ingested_bytes = None
+
+
+def queue_ingest(user_files):
+    """
+    Queue user files to be ingested by a worker. Files without an uploaded file are skipped.
+
+    :param user_files: A queryset of user files
+    :return:
+    """
+    if getattr(settings, "SCOUT_INGEST", True):
+        # The status isn't data, so this doesn't need to send the signals of the user files
+        user_files.filter(file_name__isnull=False).update(ingest_status="queued", ingest_worker=None)
+
+
+def claim_next_user_file(worker: str):
+    """
+    Claim the user file that has been queued for ingestion the longest. Like runs, files are claimed with a
+    conditional update, so two workers can never claim the same file.
+
+    :param worker: The name of the worker claiming the file
+    :return: The claimed user file, or None if there's nothing to ingest
+    """
+    for user_file_id in UserFile.objects.filter(ingest_status="queued").order_by("id") \
+            .values_list("id", flat=True)[:10]:
+        claimed = UserFile.objects.filter(pk=user_file_id, ingest_status="queued") \
+            .update(ingest_status="running", ingest_worker=worker)
+        if claimed == 1:
+            return UserFile.objects.select_related("data_source").get(pk=user_file_id)
+    return None
+
+
+def _column_names(header: list, has_header: bool) -> list:
+    """
+    Get the column names of a CSV file, like pandas (and so the CSV connector) names them: numbers if there's no header
+    and a suffix (".1", ".2", ...) for repeated names.
+    """
+    if not has_header:
+        return list(range(len(header)))
+    names, seen = [], {}
+    for name in header:
+        if name in seen:
+            seen[name] += 1
+            while f"{name}.{seen[name]}" in seen:
+                seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+
+def _csv_batches(kwargs: dict):
+    """
+    Open a CSV file for streaming.
+
+    :param kwargs: The settings of the CSV data source (with the path of the file)
+    :return: The original column names and a record batch reader, with the columns numbered
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    with open(kwargs["filename"], encoding=kwargs["encoding"], newline="") as f:
+        header = next(csv.reader(f, delimiter=kwargs["delimiter"]), [])
+    column_names = _column_names(header, kwargs["has_header"])
+
+    def open_csv(column_types: dict = None):
+        return pa_csv.open_csv(
+            kwargs["filename"],
+            read_options=pa_csv.ReadOptions(encoding=kwargs["encoding"], skip_rows=1 if kwargs["has_header"] else 0,
+                                            column_names=[str(i) for i in range(len(column_names))]),
+            parse_options=pa_csv.ParseOptions(delimiter=kwargs["delimiter"]),
+            convert_options=pa_csv.ConvertOptions(strings_can_be_null=True, column_types=column_types))
+
+    # The types are inferred from the first block, dates and times are read as text again
+    reader = open_csv()
+    temporal = {field.name: pa.string() for field in reader.schema if pa.types.is_temporal(field.type)}
+    if len(temporal) > 0:
+        reader = open_csv(temporal)
+    return column_names, reader
+
+
+def _write_parts(directory: str, schema, batches, column_names: list):
+    """
+    Write record batches to numbered Parquet files of at most SCOUT_INGEST_PART_ROWS rows each.
+
+    :param directory: The (existing) directory to write to
+    :param schema: The schema of the batches (with numbered columns)
+    :param batches: An iterable of record batches
+    :param column_names: The original column names, stored as metadata
+    :return: The schema that was written and the number of rows
+    """
+    import pyarrow.parquet as pq
+
+    schema = schema.with_metadata({"column_names": json.dumps(column_names)})
+    part_rows = max(getattr(settings, "SCOUT_INGEST_PART_ROWS", DEFAULT_INGEST_PART_ROWS), 1)
+    writer, part, part_size, num_rows = None, 0, 0, 0
+    try:
+        for batch in batches:
+            offset = 0
+            while offset < batch.num_rows:
+                if writer is None:
+                    writer = pq.ParquetWriter(os.path.join(directory, f"part-{part:05d}.parquet"), schema)
+                length = min(part_rows - part_size, batch.num_rows - offset)
+                writer.write_batch(batch.slice(offset, length))
+                offset += length
+                part_size += length
+                num_rows += length
+                if part_size == part_rows:
+                    writer.close()
+                    writer, part, part_size = None, part + 1, 0
+        if num_rows == 0:
+            # An empty file still has columns
+            writer = pq.ParquetWriter(os.path.join(directory, f"part-{part:05d}.parquet"), schema)
+    finally:
+        if writer is not None:
+            writer.close()
+    return schema, num_rows
+
+
+def ingest_user_file(user_file: UserFile):
+    """
+    Parse a claimed user file and store the data as Parquet files, unless there already is an up to date copy. The
+    status is set to ready if the data was ingested, failed if that wasn't possible (the file is then read from the
+    original) and is cleared if the file isn't used (e.g. because it's uploaded before its data source is saved).
+
+    :param user_file: The user file (see claim_next_user_file)
+    :return:
+    """
+    status = "failed"
+    try:
+        status = _ingest(user_file)
+    finally:
+        UserFile.objects.filter(pk=user_file.pk, ingest_status="running").update(ingest_status=status,
+                                                                               ingest_worker=None)
+
+
+def _ingest(user_file: UserFile):
+    from .registry import registry
+    from .views.datasources import _data_source_to_dict
+
+    if user_file.file_name is None or user_file.checksum is None:
+        return None
+    data_source = user_file.data_source
+    kwargs = json.loads(data_source.kwargs)
+    scout = registry.scout()
+    file_fields = [name for name, field in scout.get_data_source(data_source.source).fields.items()
+                   if field["type"] == "file"]
+    if file_fields != [user_file.field_name] or str(kwargs.get(user_file.field_name)) != str(user_file.pk):
+        # The data source doesn't use (only) this file
+        return None
+    fingerprint = ingest_fingerprint(user_file, data_source.source, kwargs)
+    if ingested_path(user_file, data_source.source, kwargs) is not None:
+        return "ready"
+
+    definition = _data_source_to_dict(data_source, scout)
+    directory = _ingested_dir(user_file.pk)
+    target = os.path.join(directory, fingerprint)
+    tmp_directory = os.path.join(directory, f"{uuid.uuid4()}.tmp")
+    os.makedirs(tmp_directory)
+    try:
+        if definition["source"] == "CSV":
+            column_names, reader = _csv_batches(definition["kwargs"])
+            schema, num_rows = _write_parts(tmp_directory, reader.schema, reader, column_names)
+        else:
+            records = scout.get_data_source(definition["source"])(definition["kwargs"])(False)
+            table = records_to_table(records, from_pandas=True)
+            del records
+            column_names = json.loads(table.schema.metadata[b"column_names"])
+            schema, num_rows = _write_parts(tmp_directory, table.schema, table.to_batches(), column_names)
+        size = sum(os.path.getsize(os.path.join(tmp_directory, name)) for name in os.listdir(tmp_directory))
+        if os.path.isdir(target):
+            # Another worker ingested the same file in the meantime
+            shutil.rmtree(target, ignore_errors=True)
+        os.replace(tmp_directory, target)
+    except Exception as e:
+        # E.g. a CSV column with values that don't match the type inferred from the first rows, or data that doesn't
+        # fit a columnar format (columns with mixed types)
+        logger.info(f"Couldn't ingest user file {user_file.pk}: {e}")
+        return "failed"
+    finally:
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+
+    types = [{"name": name, "type": str(field.type)} for name, field in zip(column_names, schema)]
+    # Only store the result if the file hasn't been replaced while it was being parsed
+    updated = UserFile.objects.filter(pk=user_file.pk, file_name=user_file.file_name, checksum=user_file.checksum) \
+        .update(ingested_path=os.path.relpath(target, settings.MEDIA_ROOT), ingest_fingerprint=fingerprint,
+                row_count=num_rows, schema=json.dumps(types, default=str), ingested_bytes=size)
+    if updated == 0:
+        shutil.rmtree(target, ignore_errors=True)
+        return None
+    # Remove the outdated copies, but not the ones that are still being written
+    for name in os.listdir(directory):
+        if name != fingerprint and not name.endswith(".tmp"):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return "ready"
+
+
+def remove_ingested(user_file_id: int):
+    """
+    Remove the ingested data of a user file.
+
+    :param user_file_id: The id of the user file
+    :return:
+    """
+    shutil.rmtree(_ingested_dir(user_file_id), ignore_errors=True)
+
+
+def install(scout):
+    """
+    Make the connector that reads ingested data available to a Scout object. Like the snapshot connector, it isn't
+    added to the global list of data sources.
+
+    :param scout: An initialized data scout Scout object
+    :return:
+    """
+    from .connectors import IngestedConnector
+    scout.data_sources = dict(scout.data_sources, **{INGESTED_SOURCE: IngestedConnector})
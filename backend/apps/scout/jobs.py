@@ -0,0 +1,200 @@
+"""
+A simple job queue for recipe runs. The queue lives in the database (the RecipeRun table), so no external broker is
+required. Workers (see the run_worker management command) poll the table and claim queued runs one at a time. When no
+run is queued, the workers ingest uploaded files (see the ingest module).
+"""
+
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import ingest
+from .models import RecipeRun, UserFile
+from .variable_logger import VariableLogger
+
+RESULTS_DIR = "runs"
+DEFAULT_RUN_TIMEOUT = 24 * 60 * 60
+
+
+def claim_next_run(worker: str):
+    """
+    Claim the oldest queued run. Claiming is done with a conditional update, so two workers can never claim the same
+    run.
+
+    :param worker: The name of the worker claiming the run
+    :return: The claimed run, or None if the queue is empty
+    """
+    for run_id in RecipeRun.objects.filter(status="queued").order_by("created", "id").values_list("id", flat=True)[:10]:
+        claimed = RecipeRun.objects.filter(pk=run_id, status="queued").update(status="running", worker=worker,
+                                                                              started=timezone.now())
+        if claimed == 1:
+            return RecipeRun.objects.select_related("recipe").get(pk=run_id)
+    return None
+
+
+def execute_run(run: RecipeRun):
+    """
+    Execute a recipe on all of its data and store the result as a CSV file in the media root.
+
+    :param run: The run to execute (it should already be claimed)
+    :return:
+    """
+    import data_scout
+    from .executors import CachingPandasExecutor
+    from .registry import registry
+    from .views.wrangler import _recipe_to_pipeline
+
+    logger = logging.getLogger(__name__)
+    variable_logger = VariableLogger(100)
+    logger.addHandler(variable_logger.log_handler)
+    logger.setLevel(logging.INFO)
+
+    def progress(step: int, steps: int):
+        RecipeRun.objects.filter(pk=run.pk, status="running").update(progress=step / steps)
+
+    try:
+        scout = registry.scout(logger)
+        # All data is read from the ingested copies of the uploaded files
+        ingest.install(scout)
+        definition = _recipe_to_pipeline(run.recipe, scout, use_sample=False, column_types=False)
+        executor = CachingPandasExecutor(data_source=definition["data_source"], pipeline=definition["pipeline"],
+                                         scout=scout, progress=progress)
+        df_records, _ = executor.execute(use_sample=False, column_types=False)
+
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, RESULTS_DIR), exist_ok=True)
+        result_file = os.path.join(RESULTS_DIR, f"{run.pk}-{uuid.uuid4()}.csv")
+        tmp_path = os.path.join(settings.MEDIA_ROOT, f"{result_file}.tmp")
+        df_records.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(settings.MEDIA_ROOT, result_file))
+
+        run.status = "succeeded"
+        run.progress = 1
+        run.result_file = result_file
+        run.row_count = len(df_records)
+    except data_scout.exceptions.PipelineException as e:
+        logger.error(f"Transformation: {e.transformation}: {type(e.original_exception).__name__} "
+                     f"{e.original_exception}")
+        run.status = "failed"
+    except (data_scout.exceptions.TransformationUnavailableException,
+            data_scout.exceptions.DataSourceConnectorUnavailableException) as e:
+        logger.error(str(e))
+        run.status = "failed"
+    except Exception as e:
+        logger.error(f"{type(e).__name__} {e}")
+        run.status = "failed"
+    finally:
+        logger.removeHandler(variable_logger.log_handler)
+
+    values = {"status": run.status, "messages": json.dumps(variable_logger.contents()), "finished": timezone.now()}
+    if run.status == "succeeded":
+        values.update(progress=run.progress, result_file=run.result_file, row_count=run.row_count)
+    # The run might have been deleted or failed by fail_stale_jobs (e.g. because it took too long) while it was
+    # executing, then nobody will ever download the result
+    if RecipeRun.objects.filter(pk=run.pk, status="running").update(**values) == 0 and run.status == "succeeded":
+        remove_result_file(run.result_file)
+
+
+def remove_result_file(result_file: str):
+    """
+    Remove the result file of a run (if it still exists).
+
+    :param result_file: The name of the file in the media root
+    :return:
+    """
+    try:
+        os.remove(os.path.join(settings.MEDIA_ROOT, result_file))
+    except FileNotFoundError:
+        pass
+
+
+def _worker_alive(worker: str) -> bool:
+    """
+    Check whether a worker (on this host) is still running.
+
+    :param worker: The name of the worker ("host:pid")
+    :return: False if the worker runs on this host and its process doesn't exist anymore, True otherwise
+    """
+    host, _, pid = (worker or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fail_stale_jobs():
+    """
+    Mark the runs and ingestions that will never finish as failed: the ones claimed by a worker (on this host) that
+    stopped, e.g. because it crashed or was killed, and the ones that have been running longer than SCOUT_RUN_TIMEOUT
+    seconds on any host. They aren't queued again, because the job itself might be what took the worker down.
+
+    :return: The number of runs and user files that were marked as failed
+    """
+    timeout = getattr(settings, "SCOUT_RUN_TIMEOUT", DEFAULT_RUN_TIMEOUT)
+    running = RecipeRun.objects.filter(status="running")
+    stale = [run_id for run_id, worker in running.values_list("id", "worker") if not _worker_alive(worker)]
+    messages = json.dumps([{"code": logging.ERROR, "type": "error",
+                            "message": "The worker stopped before the run finished"}])
+    failed = running.filter(pk__in=stale).update(status="failed", messages=messages, finished=timezone.now())
+    if timeout:
+        messages = json.dumps([{"code": logging.ERROR, "type": "error",
+                                "message": f"The run didn't finish within {timeout} seconds"}])
+        failed += running.filter(started__lt=timezone.now() - timedelta(seconds=timeout)) \
+            .update(status="failed", messages=messages, finished=timezone.now())
+
+    # Ingestion is much shorter than a run, so only stopped workers are checked
+    ingesting = UserFile.objects.filter(ingest_status="running")
+    stale = [user_file_id for user_file_id, worker in ingesting.values_list("id", "ingest_worker")
+             if not _worker_alive(worker)]
+    failed += ingesting.filter(pk__in=stale).update(ingest_status="failed", ingest_worker=None)
+    return failed
+
+
+def work(poll_interval: float = 1.0, once: bool = False):
+    """
+    Keep executing queued runs.
+
+    :param poll_interval: The number of seconds to wait before checking the queue again when it's empty
+    :param once: If True, stop as soon as the queue is empty
+    :return:
+    """
+    logger = logging.getLogger(__name__)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    fail_stale_jobs()
+    while True:
+        close_old_connections()
+        run = claim_next_run(worker)
+        if run is not None:
+            try:
+                execute_run(run)
+            except Exception as e:
+                # E.g. a database error while storing the result, this shouldn't stop the worker
+                logger.exception(f"Run {run.pk} failed")
+                messages = json.dumps([{"code": logging.ERROR, "type": "error", "message": f"{type(e).__name__} {e}"}])
+                RecipeRun.objects.filter(pk=run.pk, status="running").update(status="failed", messages=messages,
+                                                                             finished=timezone.now())
+            continue
+
+        user_file = ingest.claim_next_user_file(worker)
+        if user_file is not None:
+            try:
+                ingest.ingest_user_file(user_file)
+            except Exception:
+                logger.exception(f"Ingesting user file {user_file.pk} failed")
+        elif once:
+            break
+        else:
+            fail_stale_jobs()
+            time.sleep(poll_interval)
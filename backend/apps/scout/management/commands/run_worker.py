@@ -0,0 +1,49 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _work(poll_interval: float, once: bool):
+    """
+    The entry point of a worker process.
+    """
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        # Processes that are spawned (instead of forked) need to set up Django themselves
+        django.setup()
+
+    from ...jobs import work
+    work(poll_interval, once)
+
+
+class Command(BaseCommand):
+    help = "Start a pool of worker processes that execute queued recipe runs."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=getattr(settings, "SCOUT_WORKER_PROCESSES", 2),
+                            help="The number of worker processes")
+        parser.add_argument("--poll-interval", type=float, default=1.0,
+                            help="The number of seconds to wait before checking an empty queue again")
+        parser.add_argument("--once", action="store_true", help="Stop as soon as the queue is empty")
+
+    def handle(self, *args, **options):
+        if options["processes"] <= 1:
+            _work(options["poll_interval"], options["once"])
+            return
+
+        # The worker processes should open their own database connections
+        connections.close_all()
+        processes = [multiprocessing.Process(target=_work, args=(options["poll_interval"], options["once"]))
+                     for _ in range(options["processes"])]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} workers")
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
@@ -0,0 +1,34 @@
+# Generated by Django 3.0.4 on 2026-10-18 07:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('scout', '0019_auto_20210411_1456'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=64)),
+                ('progress', models.FloatField(default=0)),
+                ('messages', models.TextField(blank=True, null=True)),
+                ('result_file', models.CharField(blank=True, max_length=1024, null=True)),
+                ('row_count', models.IntegerField(blank=True, null=True)),
+                ('worker', models.CharField(blank=True, max_length=512, null=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(blank=True, null=True)),
+                ('finished', models.DateTimeField(blank=True, null=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recipe_runs', to='scout.Project')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='scout.Recipe')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recipe_runs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
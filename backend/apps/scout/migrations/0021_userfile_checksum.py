@@ -0,0 +1,18 @@
+# Generated by Django 3.0.4 on 2026-10-18 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scout', '0020_reciperun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
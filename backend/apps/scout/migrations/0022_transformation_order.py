@@ -0,0 +1,18 @@
+# Generated by Django 3.0.4 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scout', '0021_userfile_checksum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transformation',
+            name='order',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.0.4 on 2026-10-18 08:12
+
+from django.db import migrations
+
+ORDER_STEP = 1024.0
+
+
+def chain_to_order(apps, schema_editor):
+    """
+    Give every transformation an order key, following the chain of "previous" links of its recipe. Transformations that
+    can't be reached from the start of the chain (because the chain is broken) are placed at the end, ordered by id.
+    """
+    Transformation = apps.get_model('scout', 'Transformation')
+    recipes = {}
+    for transformation_id, recipe_id, previous_id in Transformation.objects.order_by('id') \
+            .values_list('id', 'recipe_id', 'previous_id'):
+        recipes.setdefault(recipe_id, []).append((transformation_id, previous_id))
+
+    transformations = []
+    for steps in recipes.values():
+        next_ids = {}
+        for transformation_id, previous_id in steps:
+            next_ids.setdefault(previous_id, transformation_id)
+        ordered = []
+        transformation_id = next_ids.get(None)
+        while transformation_id is not None and len(ordered) < len(steps):
+            ordered.append(transformation_id)
+            transformation_id = next_ids.get(transformation_id)
+        chained = set(ordered)
+        ordered += [transformation_id for transformation_id, _ in steps if transformation_id not in chained]
+        transformations += [Transformation(id=transformation_id, order=i * ORDER_STEP)
+                            for i, transformation_id in enumerate(ordered)]
+    Transformation.objects.bulk_update(transformations, ['order'], batch_size=500)
+
+
+def order_to_chain(apps, schema_editor):
+    """
+    Rebuild the chain of "previous" links from the order keys, so the migration can be reversed.
+    """
+    Transformation = apps.get_model('scout', 'Transformation')
+    previous = {}
+    transformations = []
+    for transformation_id, recipe_id in Transformation.objects.order_by('recipe_id', 'order', 'id') \
+            .values_list('id', 'recipe_id'):
+        transformations.append(Transformation(id=transformation_id, previous_id=previous.get(recipe_id)))
+        previous[recipe_id] = transformation_id
+    Transformation.objects.bulk_update(transformations, ['previous'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scout', '0022_transformation_order'),
+    ]
+
+    operations = [
+        migrations.RunPython(chain_to_order, order_to_chain),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.0.4 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scout', '0023_transformation_order_data'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='transformation',
+            options={'ordering': ['order', 'id']},
+        ),
+        migrations.RemoveField(
+            model_name='transformation',
+            name='previous',
+        ),
+        migrations.AddIndex(
+            model_name='transformation',
+            index=models.Index(fields=['recipe', 'order'], name='scout_trans_recipe__dbe570_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.0.4 on 2026-10-18 08:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scout', '0024_remove_transformation_previous'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='datasource',
+            index=models.Index(fields=['project', 'parent'], name='scout_datas_project_07dd7f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='datasourcefolder',
+            index=models.Index(fields=['project', 'parent'], name='scout_datas_project_58ecf7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='join',
+            index=models.Index(fields=['project', 'parent'], name='scout_join_project_5ec192_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['project', 'parent'], name='scout_recip_project_925e14_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipefolder',
+            index=models.Index(fields=['project', 'parent'], name='scout_recip_project_bd2db1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperun',
+            index=models.Index(fields=['status', 'created'], name='scout_recip_status_d8957e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reciperun',
+            index=models.Index(fields=['recipe', 'created'], name='scout_recip_recipe__8e3519_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.4 on 2026-10-18 08:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scout', '0025_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FileUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('original_file_name', models.CharField(max_length=1024)),
+                ('size', models.BigIntegerField()),
+                ('chunk_size', models.IntegerField()),
+                ('received', models.BigIntegerField(default=0)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='file_uploads', to='scout.Project')),
+                ('user_file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='scout.UserFile')),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.0.4 on 2026-10-18 08:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scout', '0026_fileupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='ingest_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='ingested_bytes',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='ingested_path',
+            field=models.CharField(blank=True, max_length=1024, null=True),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='row_count',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='schema',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
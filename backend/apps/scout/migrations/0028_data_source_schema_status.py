@@ -0,0 +1,37 @@
+# Generated by Django 3.0.4 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+def mark_schemas_ready(apps, schema_editor):
+    """
+    The schemas of existing data sources were inferred when they were saved.
+    """
+    DataSource = apps.get_model('scout', 'DataSource')
+    DataSource.objects.filter(schema__isnull=False).update(schema_status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scout', '0027_user_file_ingest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datasource',
+            name='schema_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='schema_messages',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='datasource',
+            name='schema_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=16, null=True),
+        ),
+        migrations.RunPython(mark_schemas_ready, migrations.RunPython.noop),
+    ]
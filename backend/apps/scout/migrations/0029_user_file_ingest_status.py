@@ -0,0 +1,23 @@
+# Generated by Django 3.0.4 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scout', '0028_data_source_schema_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userfile',
+            name='ingest_status',
+            field=models.CharField(blank=True, choices=[('queued', 'Queued'), ('running', 'Running'), ('ready', 'Ready'), ('failed', 'Failed')], max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='userfile',
+            name='ingest_worker',
+            field=models.CharField(blank=True, max_length=512, null=True),
+        ),
+    ]
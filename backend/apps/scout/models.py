@@ -1,3 +1,5 @@
+import uuid
+
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db import models
@@ -56,12 +58,23 @@ class DataSourceFolder(models.Model):
     parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="child_folders")
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="data_source_folders")
 
+    class Meta:
+        # The lists and folder trees select the (top level) objects of a project
+        indexes = [models.Index(fields=["project", "parent"])]
+
 
 class DataSource(models.Model):
     """
     A data source defines how data is loaded. This data source specific settings are stored as a JSON object in the
-    kwargs field. The schema of the data set (column names and types) are stored in the schema field.
+    kwargs field. The schema of the data set (column names and types) are stored in the schema field. The schema is
+    inferred in the background (see the schemas module), schema_status tells whether that has finished.
     """
+    SCHEMA_STATUSES = (
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+
     name = models.CharField(max_length=512)
     # We have the option to create a "tree" structure, where we can set the parent of a data source
     parent = models.ForeignKey(DataSourceFolder, on_delete=models.CASCADE, null=True, blank=True, related_name="children")
@@ -71,8 +84,17 @@ class DataSource(models.Model):
     kwargs = models.TextField()
 
     schema = models.TextField(null=True, blank=True)
+    # The status of the schema inference (null if it hasn't been inferred, e.g. because the files aren't uploaded yet),
+    # the error messages if it failed and the fingerprint of the settings and files it was inferred from
+    schema_status = models.CharField(max_length=16, choices=SCHEMA_STATUSES, null=True, blank=True)
+    schema_messages = models.TextField(null=True, blank=True)
+    schema_fingerprint = models.CharField(max_length=64, null=True, blank=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="data_sources")
 
+    class Meta:
+        # The lists and folder trees select the (top level) objects of a project
+        indexes = [models.Index(fields=["project", "parent"])]
+
     def __str__(self):
         return self.name
 
@@ -86,6 +108,10 @@ class RecipeFolder(models.Model):
     parent = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="child_folders")
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="recipe_folders")
 
+    class Meta:
+        # The lists and folder trees select the (top level) objects of a project
+        indexes = [models.Index(fields=["project", "parent"])]
+
 
 class Recipe(models.Model):
     """
@@ -112,24 +138,106 @@ class Recipe(models.Model):
     schema = models.TextField(null=True, blank=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="recipes")
 
+    class Meta:
+        # The lists and folder trees select the (top level) objects of a project
+        indexes = [models.Index(fields=["project", "parent"])]
+
     def __str__(self):
         return self.name
 
+    def clean(self):
+        super().clean()
+        if self.pk is not None and self.input_join_id is not None and \
+                has_join_cycle(self.project_id, recipes={self.pk: self.input_join_id}):
+            raise ValidationError('A recipe can\'t use a join that (indirectly) uses the recipe itself')
+
 
 class Transformation(models.Model):
     """
     A transformation defines a step in the flow. This can be any of the transformations that are available in the Data
     Scout package. Its parameters are stored as JSON in the kwargs field.
     """
+    # The distance between the order keys of transformations that are appended or renumbered
+    ORDER_STEP = 1024.0
+
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="transformations")
 
-    # We'll link the transformation steps together by defining a "previous", which links to another transformation
-    previous = models.ForeignKey("self", on_delete=models.CASCADE, null=True, blank=True, related_name="next")
+    # The transformation steps are executed in ascending order. A transformation that's inserted between two others
+    # gets the average of their order keys, so no other transformation has to be updated.
+    order = models.FloatField(default=0)
     # The name of the transformation to apply
     transformation = models.CharField(max_length=512)
     # The arguments to pass to the transformation, defined as a JSON string
     kwargs = models.TextField()
 
+    class Meta:
+        ordering = ["order", "id"]
+        indexes = [models.Index(fields=["recipe", "order"])]
+
+    def place_after(self, previous_id: int = None):
+        """
+        Set the order key, so this transformation directly follows another one. This takes a constant number of queries
+        (except for the rare case where the order keys need to be renumbered). The transformation isn't saved, call this
+        in a transaction in which the recipe is locked (see lock_recipe) and save it afterwards.
+
+        :param previous_id: The id of the transformation this one should follow, None to make it the first one
+        :return:
+        """
+        others = Transformation.objects.filter(recipe_id=self.recipe_id).exclude(pk=self.pk)
+        if previous_id is None:
+            first = others.values_list("order", flat=True).first()
+            self.order = 0 if first is None else first - self.ORDER_STEP
+            return
+
+        previous_order = others.values_list("order", flat=True).get(pk=previous_id)
+        following = others.filter(models.Q(order__gt=previous_order) |
+                                  models.Q(order=previous_order, id__gt=previous_id))
+        next_order = following.values_list("order", flat=True).first()
+        if next_order is None:
+            self.order = previous_order + self.ORDER_STEP
+            return
+
+        order = (previous_order + next_order) / 2
+        if not previous_order < order < next_order:
+            # There's no room left between the two (the keys are floats), so we spread all keys out again first
+            self.renumber(self.recipe_id)
+            return self.place_after(previous_id)
+        self.order = order
+
+    def place_last(self):
+        """
+        Set the order key, so this transformation is the last one of its recipe. Like place_after, the transformation
+        isn't saved.
+
+        :return:
+        """
+        last = Transformation.objects.filter(recipe_id=self.recipe_id).exclude(pk=self.pk) \
+            .order_by("-order", "-id").values_list("order", flat=True).first()
+        self.order = 0 if last is None else last + self.ORDER_STEP
+
+    @classmethod
+    def renumber(cls, recipe_id: int):
+        """
+        Give the transformations of a recipe evenly spaced order keys, keeping their current order.
+
+        :param recipe_id: The id of the recipe
+        :return:
+        """
+        transformations = list(cls.objects.filter(recipe_id=recipe_id).only("id", "order"))
+        for i, transformation in enumerate(transformations):
+            transformation.order = i * cls.ORDER_STEP
+        cls.objects.bulk_update(transformations, ["order"])
+
+    @staticmethod
+    def lock_recipe(recipe_id: int):
+        """
+        Lock a recipe until the end of the current transaction, so edits of its transformations don't interleave.
+
+        :param recipe_id: The id of the recipe
+        :return:
+        """
+        list(Recipe.objects.select_for_update().filter(pk=recipe_id).values_list("id", flat=True))
+
 
 class Join(models.Model):
     """
@@ -161,6 +269,10 @@ class Join(models.Model):
                                related_name="child_joins")
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="joins")
 
+    class Meta:
+        # The lists and folder trees select the (top level) objects of a project
+        indexes = [models.Index(fields=["project", "parent"])]
+
     def clean(self):
         super().clean()
         if (self.data_source_left is None and self.recipe_left is None) or \
@@ -170,17 +282,135 @@ class Join(models.Model):
                 (self.data_source_right is not None and self.recipe_right is not None):
             raise ValidationError('You need a data source OR a pipeline on the right')
 
-        # TODO: Add a check for recursion!
+        if self.pk is not None and has_join_cycle(self.project_id, joins={
+                self.pk: [recipe_id for recipe_id in (self.recipe_left_id, self.recipe_right_id) if recipe_id]}):
+            raise ValidationError('A join can\'t use a recipe that (indirectly) uses the join itself')
+
+
+def has_join_cycle(project_id: int, recipes: dict = None, joins: dict = None) -> bool:
+    """
+    Check whether the recipes and joins of a project depend on each other in a cycle. A recipe depends on its input join
+    and a join depends on its left and right recipes. The check visits every recipe and join once, so it runs in
+    O(V + E) time.
+
+    :param project_id: The id of the project
+    :param recipes: Input joins to check instead of the stored ones (recipe id -> join id or None)
+    :param joins: Recipes to check instead of the stored ones (join id -> list of recipe ids)
+    :return: True if there's a cycle
+    """
+    recipe_inputs = dict(Recipe.objects.filter(project_id=project_id, input_join__isnull=False)
+                         .values_list("id", "input_join_id"))
+    recipe_inputs.update(recipes or {})
+    join_inputs = {}
+    for join_id, recipe_left_id, recipe_right_id in Join.objects.filter(project_id=project_id) \
+            .values_list("id", "recipe_left_id", "recipe_right_id"):
+        join_inputs[join_id] = [recipe_id for recipe_id in (recipe_left_id, recipe_right_id) if recipe_id]
+    join_inputs.update(joins or {})
+
+    def dependencies(node):
+        kind, node_id = node
+        if kind == "recipe":
+            return [("join", recipe_inputs[node_id])] if recipe_inputs.get(node_id) else []
+        return [("recipe", recipe_id) for recipe_id in join_inputs.get(node_id, [])]
+
+    # Iterative depth-first search, a node that's found while it's still on the stack closes a cycle
+    done, on_stack = set(), set()
+    for root in [("recipe", recipe_id) for recipe_id in recipe_inputs]:
+        if root in done:
+            continue
+        stack = [(root, iter(dependencies(root)))]
+        on_stack.add(root)
+        while stack:
+            node, children = stack[-1]
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                on_stack.discard(node)
+                done.add(node)
+            elif child in on_stack:
+                return True
+            elif child not in done:
+                on_stack.add(child)
+                stack.append((child, iter(dependencies(child))))
+    return False
 
 
 class UserFile(models.Model):
     """
     Users are allowed to upload files. Those files are stored on disk, but a reference is store in a UserFile object.
     """
+    INGEST_STATUSES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    )
+
     data_source = models.ForeignKey(DataSource, on_delete=models.CASCADE, related_name="files")
     field_name = models.CharField(max_length=1024)
     file_name = models.CharField(max_length=1024, null=True)
     original_file_name = models.CharField(max_length=1024, null=True)
+    # The SHA-256 checksum of the file's contents
+    checksum = models.CharField(max_length=64, null=True, blank=True)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="user_files")
+    # The file parsed into Parquet by a worker (see the ingest module): the status and the worker that claimed it, the
+    # directory (relative to the media root), the fingerprint of the file and data source settings it was created from,
+    # and the number of rows, schema and size in bytes
+    ingest_status = models.CharField(max_length=16, choices=INGEST_STATUSES, null=True, blank=True)
+    ingest_worker = models.CharField(max_length=512, null=True, blank=True)
+    ingested_path = models.CharField(max_length=1024, null=True, blank=True)
+    ingest_fingerprint = models.CharField(max_length=64, null=True, blank=True)
+    row_count = models.BigIntegerField(null=True, blank=True)
+    schema = models.TextField(null=True, blank=True)
+    ingested_bytes = models.BigIntegerField(null=True, blank=True)
     # TODO: Add some sort of on delete
 
+
+class FileUpload(models.Model):
+    """
+    A chunked upload of a user file. The chunks are appended to a temporary file, which is moved into place when the
+    upload is finalized (see the uploads module). An interrupted upload can be resumed from the last received chunk.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_file = models.ForeignKey(UserFile, on_delete=models.CASCADE, related_name="uploads")
+    original_file_name = models.CharField(max_length=1024)
+    # The size of the complete file and of every chunk (except the last one), in bytes
+    size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    # The number of bytes that have been received and written to the temporary file
+    received = models.BigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="file_uploads")
+
+
+class RecipeRun(models.Model):
+    """
+    A run executes a recipe on all data (instead of a sample). Runs are queued in the database and picked up by a worker
+    process (see the run_worker management command), so they don't block the web server.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    )
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="runs")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="recipe_runs")
+    status = models.CharField(max_length=64, choices=STATUS_CHOICES, default="queued")
+    # The fraction of the transformation steps that has been executed
+    progress = models.FloatField(default=0)
+    # The log messages of the run, stored as a JSON list
+    messages = models.TextField(null=True, blank=True)
+    # The name of the file (in the media root) that holds the result
+    result_file = models.CharField(max_length=1024, null=True, blank=True)
+    row_count = models.IntegerField(null=True, blank=True)
+    worker = models.CharField(max_length=512, null=True, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="recipe_runs")
+
+    class Meta:
+        # Workers select the oldest queued run, recipes show their last run
+        indexes = [models.Index(fields=["status", "created"]), models.Index(fields=["recipe", "created"])]
@@ -0,0 +1,24 @@
+"""
+Pagination of project resources. A cursor (keyset) pagination is used instead of page numbers, so every page is a single
+indexed query (no OFFSET scans and no COUNT of the whole project) and the size of a response stays bounded.
+"""
+
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+DEFAULT_PAGE_SIZE = 100
+DEFAULT_MAX_PAGE_SIZE = 1000
+
+
+class ProjectCursorPagination(CursorPagination):
+    """
+    Cursor pagination ordered by id. The page size defaults to SCOUT_PAGE_SIZE, clients can ask for larger pages (up to
+    SCOUT_MAX_PAGE_SIZE) using the "page_size" get parameter.
+    """
+    ordering = "id"
+    page_size_query_param = "page_size"
+
+    def get_page_size(self, request):
+        self.page_size = getattr(settings, "SCOUT_PAGE_SIZE", DEFAULT_PAGE_SIZE)
+        self.max_page_size = getattr(settings, "SCOUT_MAX_PAGE_SIZE", DEFAULT_MAX_PAGE_SIZE)
+        return super().get_page_size(request)
@@ -0,0 +1,287 @@
+"""
+Execution of recipe previews. Previews can either run in the web server process, or in a pool of worker processes. The
+latter makes sure a single heavy recipe can't block the web server: every preview gets a wall-clock timeout and a memory
+cap, and a preview is cancelled as soon as a newer preview of the same recipe is requested.
+
+Every worker process has its own result cache. Invalidations (see the signals module) aren't forwarded to the workers:
+cache keys are derived from the content (the data source, its files and the transformation steps), so a worker never
+returns a result of an outdated recipe, the outdated entries are simply evicted when the cache is full. To make the most
+of those caches, a preview is handed to the worker that executed the same recipe last, if it's idle.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from django.conf import settings
+
+from .variable_logger import VariableLogger
+
+DEFAULT_PREVIEW_PROCESSES = 2
+DEFAULT_PREVIEW_TIMEOUT = 60
+DEFAULT_PREVIEW_MEMORY_LIMIT = 4 * 1024 * 1024 * 1024
+
+
+class PreviewException(Exception):
+    """
+    Raised when a preview didn't finish (because it timed out, was cancelled or the worker died).
+    """
+    pass
+
+
+def _window(df_records, window: dict):
+    """
+    Select a window of rows and columns from a data frame.
+
+    :param df_records: The data frame
+    :param window: A dict containing the offset, limit (None for all rows) and columns (None for all columns)
+    :return: The selected part of the data frame
+    """
+    if window.get("columns") is not None:
+        selected = set(window["columns"])
+        df_records = df_records.loc[:, [str(name) in selected for name in df_records.columns]]
+    offset, limit = window.get("offset", 0), window.get("limit")
+    if offset > 0 or limit is not None:
+        df_records = df_records.iloc[offset:None if limit is None else offset + limit]
+    return df_records
+
+
+def execute_preview(task: dict) -> dict:
+    """
+    Execute a preview. This doesn't touch the database, so it can run in any process. If the task contains a window,
+    only that part of the result is returned. The complete result stays in the result cache, so requesting another
+    window doesn't execute the pipeline again.
+
+    :param task: A dict containing the pipeline definition, the source and step tags for the result cache and
+    (optionally) a window (see _window)
+    :return: A dict containing success, messages and (if successful) the resulting data frame, the total number of
+    rows and column types
+    """
+    import data_scout
+    from . import ingest, snapshots
+    from .cache import result_cache
+    from .executors import CachingPandasExecutor
+    from .registry import registry
+
+    logger = logging.getLogger(__name__)
+    variable_logger = VariableLogger(1)
+    logger.addHandler(variable_logger.log_handler)
+    logger.setLevel(logging.INFO)
+
+    definition = task["definition"]
+    try:
+        scout = registry.scout(logger)
+        snapshots.install(scout)
+        ingest.install(scout)
+        executor = CachingPandasExecutor(data_source=definition["data_source"], pipeline=definition["pipeline"],
+                                         scout=scout, cache=result_cache, source_tags=task["source_tags"],
+                                         step_tags=task["step_tags"])
+        df_records, columns = executor.execute(use_sample=definition["use_sample"],
+                                               sampling_technique=definition["sampling_technique"],
+                                               column_types=definition["column_types"])
+        return {"success": True, "messages": variable_logger.contents(),
+                "data": _window(df_records, task.get("window", {})), "total_rows": len(df_records), "columns": columns}
+    except data_scout.exceptions.PipelineException as e:
+        logger.error(f"Transformation: {e.transformation}: {type(e.original_exception).__name__} "
+                     f"{e.original_exception}")
+    except MemoryError:
+        logger.error("The preview ran out of memory")
+    except (data_scout.exceptions.TransformationUnavailableException,
+            data_scout.exceptions.DataSourceConnectorUnavailableException) as e:
+        logger.error(str(e))
+    except Exception as e:
+        # E.g. a transformation that isn't available, this shouldn't take the worker down
+        logger.error(f"{type(e).__name__} {e}")
+    finally:
+        logger.removeHandler(variable_logger.log_handler)
+    return {"success": False, "messages": variable_logger.contents()}
+
+
+def _serve(conn, memory_limit: int):
+    """
+    The main loop of a worker process: receive a task, execute it and send back the result.
+
+    :param conn: The worker's end of the pipe
+    :param memory_limit: The maximum size (in bytes) of the address space of this process, None for no limit
+    :return:
+    """
+    import django
+    django.setup()
+    # Make sure the heavy imports are done before the first preview is requested
+    import data_scout  # noqa: F401
+    import pandas  # noqa: F401
+    from . import executors  # noqa: F401
+    from .registry import registry
+    registry.scout()
+
+    if memory_limit:
+        try:
+            import resource
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        except (ImportError, ValueError):
+            # Not every platform supports limiting the memory of a process
+            pass
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        conn.send(execute_preview(task))
+
+
+class _Worker:
+    def __init__(self, context, memory_limit: int):
+        # The key of the last preview this worker executed, its cache holds the results of that recipe
+        self.last_key = None
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class _Ticket:
+    def __init__(self):
+        self.cancelled = threading.Event()
+
+
+class PreviewPool:
+    """
+    A pool of pre-started worker processes that execute previews. When a preview doesn't finish in time or is cancelled,
+    its worker is killed and replaced by a fresh one.
+    """
+
+    def __init__(self, processes: int, timeout: float, memory_limit: int = None):
+        """
+        :param processes: The number of worker processes
+        :param timeout: The maximum number of seconds a preview may take (including the time waiting for a worker)
+        :param memory_limit: The maximum size (in bytes) of the address space of a worker process
+        """
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if "forkserver" in methods:
+            self._context.set_forkserver_preload(["pandas", "data_scout"])
+        self._timeout = timeout
+        self._memory_limit = memory_limit
+        # The process that owns the pool, a forked process needs its own pool
+        self.pid = os.getpid()
+        # The idle workers, the least recently used first
+        self._idle = [_Worker(self._context, memory_limit) for _ in range(processes)]
+        self._idle_changed = threading.Condition()
+        self._tickets = {}
+        self._lock = threading.Lock()
+
+    def cancel(self, key):
+        """
+        Cancel the preview that is running for the given key (if any).
+
+        :param key: The key the preview was started with (e.g. the recipe id)
+        :return:
+        """
+        with self._lock:
+            ticket = self._tickets.get(key)
+        if ticket is not None:
+            ticket.cancelled.set()
+
+    def _get_worker(self, key, ticket: _Ticket, deadline: float) -> _Worker:
+        with self._idle_changed:
+            while True:
+                if ticket.cancelled.is_set():
+                    raise PreviewException("The preview was cancelled by a newer request")
+                if time.monotonic() > deadline:
+                    raise PreviewException("The preview timed out while waiting for a free worker")
+                if len(self._idle) > 0:
+                    # Prefer the worker that executed this recipe last, otherwise take the one that has been idle the
+                    # longest, so the workers that executed other recipes recently keep their affinity
+                    for i, worker in enumerate(self._idle):
+                        if worker.last_key == key:
+                            return self._idle.pop(i)
+                    return self._idle.pop(0)
+                self._idle_changed.wait(0.1)
+
+    def _release(self, worker: _Worker):
+        with self._idle_changed:
+            self._idle.append(worker)
+            self._idle_changed.notify()
+
+    def run(self, key, task: dict) -> dict:
+        """
+        Execute a preview in one of the workers. A running preview with the same key is cancelled.
+
+        :param key: The key identifying the preview (e.g. the recipe id)
+        :param task: The task, as accepted by execute_preview
+        :return: The result of execute_preview
+        """
+        ticket = _Ticket()
+        with self._lock:
+            previous = self._tickets.get(key)
+            self._tickets[key] = ticket
+        if previous is not None:
+            previous.cancelled.set()
+
+        deadline = time.monotonic() + self._timeout
+        try:
+            worker = self._get_worker(key, ticket, deadline)
+            try:
+                worker.conn.send(task)
+                while not worker.conn.poll(0.1):
+                    if ticket.cancelled.is_set():
+                        raise PreviewException("The preview was cancelled by a newer request")
+                    if time.monotonic() > deadline:
+                        raise PreviewException(f"The preview took longer than {self._timeout} seconds")
+                    if not worker.process.is_alive():
+                        raise PreviewException("The preview worker stopped unexpectedly")
+                result = worker.conn.recv()
+                worker.last_key = key
+                return result
+            except (PreviewException, EOFError, OSError):
+                # The worker might still be busy (or dead), so we'll replace it by a new one
+                worker.kill()
+                worker = _Worker(self._context, self._memory_limit)
+                raise
+            finally:
+                self._release(worker)
+        finally:
+            with self._lock:
+                if self._tickets.get(key) is ticket:
+                    del self._tickets[key]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Get the preview pool of this process. The pool is started on first use (or by warm_up).
+
+    :return: The pool or None if previews should run in the web server process (SCOUT_PREVIEW_PROCESSES = 0)
+    """
+    global _pool
+    processes = getattr(settings, "SCOUT_PREVIEW_PROCESSES", DEFAULT_PREVIEW_PROCESSES)
+    if processes <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = PreviewPool(processes, getattr(settings, "SCOUT_PREVIEW_TIMEOUT", DEFAULT_PREVIEW_TIMEOUT),
+                                getattr(settings, "SCOUT_PREVIEW_MEMORY_LIMIT", DEFAULT_PREVIEW_MEMORY_LIMIT))
+    return _pool
+
+
+def warm_up():
+    """
+    Start the preview pool of this process, so its workers have imported everything before the first preview is
+    requested. This is called when a web server loads the application (see wsgi.py and asgi.py), so management commands
+    don't start a pool. Disabled by setting SCOUT_PREVIEW_WARM_UP to False.
+
+    :return:
+    """
+    if getattr(settings, "SCOUT_PREVIEW_WARM_UP", True):
+        get_pool()
@@ -0,0 +1,91 @@
+"""
+The process-wide registry of transformations and data sources. Creating a data scout Scout object and serializing the
+available transformations and data sources used to happen on every request. Now this is done once per process (on first
+use, so management commands that never execute a pipeline don't pay for it). The metadata endpoints serve the
+pre-serialized bodies, together with an ETag.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import threading
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scout = None
+        self._metadata = {}
+
+    def _get_scout(self):
+        with self._lock:
+            if self._scout is None:
+                import data_scout
+                self._scout = data_scout.scout.Scout()
+            return self._scout
+
+    def scout(self, logger: logging.Logger = None):
+        """
+        Get a Scout object. Every caller gets its own (shallow) copy of the registry's Scout object, so it can be given
+        a different logger or extra data sources (see snapshots.install) without affecting other callers.
+
+        :param logger: The logger to use, if None the default data scout logger is used
+        :return: A data scout Scout object
+        """
+        scout = copy.copy(self._get_scout())
+        if logger is not None:
+            scout.log = logger
+        return scout
+
+    def metadata(self, name: str):
+        """
+        Get a pre-serialized metadata response body.
+
+        :param name: "transformation_types", "data_source_types" or "transformations"
+        :return: A tuple of the JSON body (as bytes) and its ETag
+        """
+        with self._lock:
+            body = self._metadata.get(name)
+        if body is None:
+            scout = self._get_scout()
+            if name == "transformation_types":
+                value = [{"name": transformation_type.__name__, "fields": transformation_type.fields}
+                         for transformation_type in scout.transformations.values()]
+            elif name == "data_source_types":
+                value = [{"name": data_source_type.__name__, "fields": data_source_type.fields}
+                         for data_source_type in scout.data_sources.values()]
+            elif name == "transformations":
+                value = {key: {"title": transformation.title, "key": transformation.key,
+                               "fields": transformation.fields}
+                         for key, transformation in scout.transformations.items()}
+            else:
+                raise KeyError(name)
+            content = json.dumps(value, cls=DjangoJSONEncoder).encode("utf-8")
+            body = (content, f'"{hashlib.sha256(content).hexdigest()}"')
+            with self._lock:
+                self._metadata[name] = body
+        return body
+
+
+registry = _Registry()
+
+
+def metadata_response(request, name: str) -> HttpResponse:
+    """
+    Respond with a pre-serialized metadata body, or with 304 Not Modified if the client already has it.
+
+    :param request:
+    :param name: The name of the metadata (see _Registry.metadata)
+    :return:
+    """
+    body, etag = registry.metadata(name)
+    res = get_conditional_response(request, etag=etag)
+    if res is None:
+        res = HttpResponse(body, content_type="application/json")
+    res["ETag"] = etag
+    return res
@@ -0,0 +1,127 @@
+"""
+Inference of the schemas (column names and types) of data sources. Saving a data source used to read a sample of it
+before responding, so a slow source could make the save time out. Now saving only marks the schema as pending and the
+schema is inferred in the background, from the same sample (and snapshot) as the previews use. When the preview pool is
+enabled, this runs in one of its workers, so it's bounded by SCOUT_PREVIEW_TIMEOUT and SCOUT_PREVIEW_MEMORY_LIMIT. The
+schema is only inferred again when the settings or the files of the data source change.
+
+The connectors don't accept a row or byte limit, but the "top" sample is already limited by their MAX_ROWS and MAX_SIZE.
+A smaller sample could infer other types than the previews show (which are based on the full sample), and it couldn't
+share the snapshot the previews read, so the sample isn't limited any further.
+"""
+
+import hashlib
+import json
+import logging
+
+from . import background
+from .models import DataSource, UserFile
+
+logger = logging.getLogger(__name__)
+
+
+def _is_int(val):
+    try:
+        int(val)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _schema_fingerprint(data_source: DataSource, fields: dict):
+    """
+    Get the fingerprint of the settings and files of a data source.
+
+    :param data_source: The data source
+    :param fields: The fields of the data source type
+    :return: The fingerprint, or None if the data source isn't ready to be read (e.g. because the files still need to be
+    uploaded)
+    """
+    kwargs = json.loads(data_source.kwargs)
+    files = {}
+    for field_name, field in fields.items():
+        if field["type"] == "file":
+            if not _is_int(kwargs.get(field_name)):
+                return None
+            user_file = UserFile.objects.filter(pk=kwargs[field_name]).first()
+            if user_file is None or user_file.file_name is None:
+                return None
+            files[field_name] = user_file.checksum or user_file.file_name
+    return hashlib.sha256(json.dumps({
+        "source": data_source.source,
+        "kwargs": kwargs,
+        "files": files,
+    }, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def request_schema(data_source: DataSource):
+    """
+    Start inferring the schema of a data source, unless it was (or is being) inferred from the same settings and files.
+    The status is set on the given object as well.
+
+    :param data_source: The data source
+    :return:
+    """
+    from .registry import registry
+
+    data_source_type = registry.scout().get_data_source(data_source.source)
+    if data_source_type is None:
+        _set_status(data_source, "failed", [{"code": logging.ERROR, "type": "error",
+                                             "message": f"The data source type {data_source.source} doesn't exist"}],
+                    None)
+        return
+    fingerprint = _schema_fingerprint(data_source, data_source_type.fields)
+    if fingerprint is None or (fingerprint == data_source.schema_fingerprint and
+                               data_source.schema_status in ("pending", "ready")):
+        return
+    _set_status(data_source, "pending", None, fingerprint)
+    background.submit(infer_schema, data_source.pk, fingerprint)
+
+
+def _set_status(data_source: DataSource, status: str, messages, fingerprint: str):
+    data_source.schema_status = status
+    data_source.schema_messages = None if messages is None else json.dumps(messages)
+    data_source.schema_fingerprint = fingerprint
+    # The status doesn't change the data, so the signals (which invalidate cached results) aren't needed
+    DataSource.objects.filter(pk=data_source.pk).update(schema_status=status,
+                                                        schema_messages=data_source.schema_messages,
+                                                        schema_fingerprint=fingerprint)
+
+
+def infer_schema(data_source_id: int, fingerprint: str):
+    """
+    Infer the schema of a data source from a sample. This is meant to run in the background (see request_schema).
+
+    :param data_source_id: The id of the data source
+    :param fingerprint: The fingerprint of the settings and files the inference was requested for, if the data source
+    changed in the meantime, the result is discarded
+    :return:
+    """
+    from . import previews
+    from .registry import registry
+    from .views.datasources import _data_source_to_dict
+
+    data_source = DataSource.objects.filter(pk=data_source_id, schema_fingerprint=fingerprint).first()
+    if data_source is None:
+        return
+    try:
+        definition = {"use_sample": True,
+                      "sampling_technique": "top",
+                      "column_types": True,
+                      "data_source": _data_source_to_dict(data_source, registry.scout(), snapshot=True),
+                      "pipeline": []}
+        # Only the column types are needed, not the data itself. The sample is limited by the connector (see above).
+        task = {"definition": definition, "source_tags": [f"data_source:{data_source_id}"], "step_tags": [],
+                "window": {"limit": 0}}
+        pool = previews.get_pool()
+        result = previews.execute_preview(task) if pool is None else pool.run(f"schema:{data_source_id}", task)
+    except Exception as e:
+        # E.g. a preview that timed out or a file that was removed
+        logger.info(f"Couldn't infer the schema of data source {data_source_id}: {e}")
+        result = {"success": False, "messages": [{"code": logging.ERROR, "type": "error", "message": str(e)}]}
+
+    queryset = DataSource.objects.filter(pk=data_source_id, schema_fingerprint=fingerprint)
+    if result["success"]:
+        queryset.update(schema=json.dumps(result["columns"][-1]), schema_status="ready", schema_messages=None)
+    else:
+        queryset.update(schema_status="failed", schema_messages=json.dumps(result["messages"]))
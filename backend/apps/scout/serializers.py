@@ -1,9 +1,27 @@
 from django.contrib.auth import password_validation
 from django.contrib.auth.models import User
+from django.db import models, transaction
 from rest_framework import serializers
 from django.utils.translation import gettext_lazy as _
 from .models import DataSource, Recipe, Transformation, Join, RecipeFolder, DataSourceFolder, UserFile, UserProject, \
-    Project, UserProfile
+    Project, UserProfile, RecipeRun, FileUpload, has_join_cycle
+
+
+class SparseFieldsMixin:
+    """
+    Allows the fields of a serializer to be limited, by passing a list of field names as "fields" when creating it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            unknown = [name for name in fields if name not in self.fields]
+            if len(unknown) > 0:
+                raise serializers.ValidationError({'fields': _("Unknown fields: {fields}.").format(
+                    fields=", ".join(unknown))})
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 
 class ProjectSerializer(serializers.ModelSerializer):
@@ -114,38 +132,156 @@ class UserProfileUpdateSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'project']
 
 
-class DataSourceSerializer(serializers.ModelSerializer):
+class DataSourceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = DataSource
-        fields = ['id', 'name', 'parent', 'source', 'kwargs', 'schema', 'project']
+        fields = ['id', 'name', 'parent', 'source', 'kwargs', 'schema', 'schema_status', 'schema_messages', 'project']
+        # The schema is inferred from the data (see the schemas module)
+        read_only_fields = ['schema', 'schema_status', 'schema_messages']
+
+
+class DataSourceSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = DataSource
+        fields = ['id', 'name', 'parent', 'source', 'schema_status']
 
 
 class UserFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserFile
-        fields = ['id', 'data_source', 'field_name', 'file_name', 'original_file_name', 'project']
+        fields = ['id', 'data_source', 'field_name', 'file_name', 'original_file_name', 'checksum', 'ingest_status',
+                  'row_count', 'schema', 'ingested_bytes', 'project']
+        read_only_fields = ['checksum', 'ingest_status', 'row_count', 'schema', 'ingested_bytes']
 
 
-class TransformationSerializer(serializers.ModelSerializer):
+class FileUploadSerializer(serializers.ModelSerializer):
+    """
+    The state of a chunked upload. "next_chunk" is the index of the chunk that should be sent next.
+    """
+    next_chunk = serializers.SerializerMethodField()
+
     class Meta:
-        model = Transformation
-        fields = ['id', 'recipe', 'transformation', 'previous', 'next', 'kwargs']
+        model = FileUpload
+        fields = ['id', 'user_file', 'original_file_name', 'size', 'chunk_size', 'received', 'next_chunk']
+        read_only_fields = fields
+
+    def get_next_chunk(self, instance):
+        return instance.received // instance.chunk_size
+
+
+class TransformationListSerializer(serializers.ListSerializer):
+    """
+    Serializes a list of transformations. The transformations are already in order, so the "previous" field of each of
+    them is taken from the list instead of being queried.
+    """
 
+    def to_representation(self, data):
+        transformations = data.all() if isinstance(data, models.Manager) else data
+        previous_ids = {}
+        for transformation in transformations:
+            transformation.previous_id = previous_ids.get(transformation.recipe_id)
+            previous_ids[transformation.recipe_id] = transformation.id
+        return [self.child.to_representation(transformation) for transformation in transformations]
+
+
+class TransformationSerializer(serializers.ModelSerializer):
+    """
+    Transformations are stored with an order key. For compatibility, the API represents the order by the id of the
+    previous transformation (null for the first one). Setting "previous" moves the transformation directly after the
+    given one, leaving it out when creating a transformation appends it to the recipe.
+    """
+    previous = serializers.IntegerField(allow_null=True, required=False, write_only=True)
 
-class TransformationSerializerUpdate(serializers.ModelSerializer):
     class Meta:
         model = Transformation
-        fields = ['id', 'recipe', 'transformation', 'previous', 'kwargs']
+        fields = ['id', 'recipe', 'transformation', 'previous', 'order', 'kwargs']
+        read_only_fields = ['order']
+        list_serializer_class = TransformationListSerializer
+
+    def validate(self, data):
+        recipe = data.get("recipe", getattr(self.instance, "recipe", None))
+        previous_id = data.get("previous")
+        if previous_id is not None:
+            if self.instance is not None and previous_id == self.instance.pk:
+                raise serializers.ValidationError({'previous': _("A transformation can't follow itself.")})
+            if not Transformation.objects.filter(pk=previous_id, recipe=recipe).exists():
+                raise serializers.ValidationError({'previous': _("The previous transformation should belong to the "
+                                                                 "same recipe.")})
+        return data
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if not hasattr(instance, "previous_id"):
+            instance.previous_id = Transformation.objects.filter(recipe_id=instance.recipe_id).filter(
+                models.Q(order__lt=instance.order) | models.Q(order=instance.order, id__lt=instance.id)
+            ).order_by("-order", "-id").values_list("id", flat=True).first()
+        data["previous"] = instance.previous_id
+        return data
 
-class RecipeSerializer(serializers.ModelSerializer):
+    def create(self, validated_data):
+        place = "previous" in validated_data
+        previous_id = validated_data.pop("previous", None)
+        with transaction.atomic():
+            Transformation.lock_recipe(validated_data["recipe"].pk)
+            instance = Transformation(**validated_data)
+            if place:
+                instance.place_after(previous_id)
+            else:
+                instance.place_last()
+            instance.save()
+        return instance
+
+    def update(self, instance, validated_data):
+        place = "previous" in validated_data
+        previous_id = validated_data.pop("previous", None)
+        with transaction.atomic():
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            if place:
+                Transformation.lock_recipe(instance.recipe_id)
+                instance.place_after(previous_id)
+            instance.save()
+        # The position might have changed
+        if hasattr(instance, "previous_id"):
+            del instance.previous_id
+        return instance
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     transformations = TransformationSerializer(many=True, read_only=True)
 
-    # TODO: Add the option to return a more limited set
     class Meta:
         model = Recipe
         fields = ['id', 'name', 'input', 'input_join', 'output', 'transformations', 'parent', 'schema', 'project']
 
+    def validate(self, data):
+        input_join = data.get("input_join", getattr(self.instance, "input_join", None))
+        project = data.get("project", getattr(self.instance, "project", None))
+        if self.instance is not None and input_join is not None and project is not None and \
+                has_join_cycle(project.id, recipes={self.instance.pk: input_join.pk}):
+            raise serializers.ValidationError({'input_join': _("A recipe can't use a join that (indirectly) uses the "
+                                                               "recipe itself.")})
+        return data
+
+
+class RecipeSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    A compact representation of a recipe, without its transformations and schema. The queryset should be annotated
+    with step_count and the id, status and finished time of the last run (see RecipeViewSet.get_queryset).
+    """
+    step_count = serializers.IntegerField(read_only=True)
+    last_run = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Recipe
+        fields = ['id', 'name', 'parent', 'step_count', 'last_run']
+
+    def get_last_run(self, instance):
+        if instance.last_run_id is None:
+            return None
+        return {"id": instance.last_run_id, "status": instance.last_run_status,
+                "finished": serializers.DateTimeField().to_representation(instance.last_run_finished)}
+
 
 class RecursiveField(serializers.Serializer):
     def to_representation(self, value):
@@ -162,7 +298,7 @@ class RecipeFolderSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'parent', 'child_folders', 'children', 'project']
 
 
-class JoinSerializer(serializers.ModelSerializer):
+class JoinSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     data_source_left = DataSourceSerializer(many=False, read_only=True)
     data_source_right = DataSourceSerializer(many=False, read_only=True)
     recipe_left = RecipeSerializer(many=False, read_only=True)
@@ -174,6 +310,12 @@ class JoinSerializer(serializers.ModelSerializer):
                   'field_left', 'field_right', 'parent', 'project']
 
 
+class JoinSummarySerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Join
+        fields = ['id', 'name', 'parent', 'method']
+
+
 class DataSourceFolderSerializer(serializers.ModelSerializer):
     child_folders = RecursiveField(many=True, read_only=True)
     children = DataSourceSerializer(many=True, read_only=True)
@@ -184,3 +326,16 @@ class DataSourceFolderSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'parent', 'child_folders', 'children', 'child_joins', 'project']
 
 
+class RecipeRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RecipeRun
+        fields = ['id', 'recipe', 'user', 'status', 'progress', 'messages', 'row_count', 'created', 'started',
+                  'finished', 'project']
+        read_only_fields = ['user', 'status', 'progress', 'messages', 'row_count', 'created', 'started', 'finished']
+
+    def validate_recipe(self, recipe):
+        # Runs read all data of the recipe, so only recipes of the user's current project can be run
+        request = self.context.get("request")
+        if request is not None and recipe.project_id != request.user.profile.project.project_id:
+            raise serializers.ValidationError(_("The recipe doesn't belong to the current project."))
+        return recipe
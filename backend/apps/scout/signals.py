@@ -0,0 +1,62 @@
+"""
+Signal handlers that invalidate cached results when the objects they were computed from change, and that (re)ingest
+uploaded files (see the ingest module).
+"""
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import ingest, jobs, snapshots, uploads
+from .cache import result_cache
+from .models import Transformation, DataSource, UserFile, Join, FileUpload, RecipeRun
+
+
+@receiver([post_save, post_delete], sender=Transformation)
+def invalidate_transformation(sender, instance, **kwargs):
+    result_cache.invalidate(f"transformation:{instance.pk}")
+
+
+@receiver([post_save, post_delete], sender=DataSource)
+def invalidate_data_source(sender, instance, **kwargs):
+    result_cache.invalidate(f"data_source:{instance.pk}")
+
+
+@receiver(post_delete, sender=DataSource)
+def remove_data_source_snapshots(sender, instance, **kwargs):
+    snapshots.remove_snapshots(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=UserFile)
+def invalidate_user_file(sender, instance, **kwargs):
+    result_cache.invalidate(f"data_source:{instance.data_source_id}")
+
+
+@receiver(post_save, sender=DataSource)
+def ingest_data_source_files(sender, instance, **kwargs):
+    ingest.queue_ingest(instance.files.all())
+
+
+@receiver(post_save, sender=UserFile)
+def ingest_user_file(sender, instance, **kwargs):
+    ingest.queue_ingest(UserFile.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=UserFile)
+def remove_ingested_user_file(sender, instance, **kwargs):
+    ingest.remove_ingested(instance.pk)
+
+
+@receiver(post_delete, sender=FileUpload)
+def remove_partial_upload(sender, instance, **kwargs):
+    uploads.remove_partial_upload(instance)
+
+
+@receiver([post_save, post_delete], sender=Join)
+def invalidate_join(sender, instance, **kwargs):
+    result_cache.invalidate(f"join:{instance.pk}")
+
+
+@receiver(post_delete, sender=RecipeRun)
+def remove_run_result(sender, instance, **kwargs):
+    if instance.result_file is not None:
+        jobs.remove_result_file(instance.result_file)
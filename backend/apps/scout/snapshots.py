@@ -0,0 +1,148 @@
+"""
+Materialized samples of data sources. The first time a sample of a data source is requested, the sampled rows are
+written to a Parquet file in the media directory. Subsequent requests read that file (memory-mapped) instead of parsing
+the source again. The file name contains a fingerprint of the source settings, the uploaded files and the sampling
+technique, so a snapshot is rebuilt as soon as any of those change. Only data sources that read uploaded files are
+snapshotted, sources that query a database read the current data for every sample.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from typing import List
+
+from django.conf import settings
+
+from .cache import file_identity
+
+SNAPSHOT_SOURCE = "Snapshot"
+
+logger = logging.getLogger(__name__)
+
+
+def snapshot_dir(data_source_id: int) -> str:
+    """
+    Get the directory with the snapshots of a data source.
+
+    :param data_source_id: The id of the data source
+    :return: The absolute path of the directory
+    """
+    return os.path.join(settings.MEDIA_ROOT, "snapshots", str(data_source_id))
+
+
+def snapshot_fingerprint(data_source: dict, sampling_technique: str) -> str:
+    """
+    Get the fingerprint of everything that determines a sample: the data source, the files it reads and the sampling
+    technique.
+
+    :param data_source: The data source definition (source and kwargs)
+    :param sampling_technique: The sampling technique
+    :return: The fingerprint
+    """
+    return hashlib.sha256(json.dumps({
+        "source": data_source["source"],
+        "kwargs": data_source["kwargs"],
+        "files": file_identity(data_source),
+        "sampling_technique": sampling_technique,
+    }, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def records_to_table(records: List[dict], from_pandas: bool = False):
+    """
+    Convert records to an Arrow table. Parquet only allows string column names, so the columns are numbered and the
+    original names (and their types) are stored as metadata.
+
+    :param records: The records to convert
+    :param from_pandas: If True, NaN values are stored as nulls (so a column of strings with missing values fits)
+    :return: The table
+    """
+    import pyarrow as pa
+
+    column_names = list(dict.fromkeys(key for record in records for key in record))
+    table = pa.table({str(i): pa.array([record.get(name) for record in records], from_pandas=from_pandas)
+                      for i, name in enumerate(column_names)})
+    return table.replace_schema_metadata({"column_names": json.dumps(column_names)})
+
+
+def table_to_records(table) -> List[dict]:
+    """
+    Convert an Arrow table created by records_to_table back to records, with the original column names.
+
+    :param table: The table
+    :return: The records
+    """
+    column_names = json.loads(table.schema.metadata[b"column_names"])
+    if all(isinstance(name, str) for name in column_names) and len(set(column_names)) == len(column_names):
+        # The common case: the records are built by Arrow itself
+        return table.rename_columns(column_names).to_pylist()
+    columns = table.to_pydict()
+    return [dict(zip(column_names, row)) for row in zip(*(columns[str(i)] for i in range(len(column_names))))]
+
+
+def write_snapshot(path: str, records: List[dict]):
+    """
+    Write the records to a Parquet file. The file is written under a temporary name and moved into place afterwards, so
+    readers never see a partially written snapshot.
+
+    :param path: The path of the snapshot
+    :param records: The records to write
+    :return:
+    """
+    import pyarrow.parquet as pq
+
+    table = records_to_table(records)
+    tmp_path = f"{path}.{uuid.uuid4()}.tmp"
+    try:
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_snapshot(path: str) -> List[dict]:
+    """
+    Read the records of a snapshot.
+
+    :param path: The path of the snapshot
+    :return: The records
+    """
+    import pyarrow.parquet as pq
+
+    return table_to_records(pq.read_table(path, memory_map=True))
+
+
+def remove_snapshots(data_source_id: int):
+    """
+    Remove all snapshots of a data source.
+
+    :param data_source_id: The id of the data source
+    :return:
+    """
+    shutil.rmtree(snapshot_dir(data_source_id), ignore_errors=True)
+
+
+def snapshot_definition(data_source_id: int, data_source: dict) -> dict:
+    """
+    Wrap a data source definition, so its samples are read from a snapshot.
+
+    :param data_source_id: The id of the data source object
+    :param data_source: The data source definition (source and kwargs)
+    :return: The wrapped data source definition
+    """
+    return {"source": SNAPSHOT_SOURCE, "kwargs": {"data_source": data_source_id, **data_source}}
+
+
+def install(scout):
+    """
+    Make the snapshot connector available to a Scout object. It isn't added to the global list of data sources, so it
+    doesn't show up as a data source type for users.
+
+    :param scout: An initialized data scout Scout object
+    :return:
+    """
+    from .connectors import SnapshotConnector
+    scout.data_sources = dict(scout.data_sources, **{SNAPSHOT_SOURCE: SnapshotConnector})
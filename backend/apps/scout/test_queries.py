@@ -0,0 +1,106 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from .models import Project, UserProject, UserProfile, DataSource, DataSourceFolder, Recipe, RecipeFolder, \
+    Transformation, Join, RecipeRun, UserFile
+
+# The number of objects of every type in the fixture
+FIXTURE_SIZE = 20
+
+
+class QueryBudgetTest(TestCase):
+    """
+    Check that the API endpoints use a fixed number of queries, no matter how many objects they return. Every budget is
+    checked against a project with many folders, data sources, recipes, transformations and joins, so a serializer
+    that queries its relations per object (N+1) makes the test fail.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("budget", password="budget")
+        cls.project = Project.objects.create(name="Budget")
+        user_project = UserProject.objects.create(user=cls.user, project=cls.project, role="owner")
+        UserProfile.objects.create(user=cls.user, project=user_project)
+        for i in range(FIXTURE_SIZE):
+            other = User.objects.create_user(f"member-{i}", password="member")
+            UserProject.objects.create(user=other, project=cls.project, role="viewer")
+
+        data_source_root = DataSourceFolder.objects.create(name="Data sources", project=cls.project)
+        recipe_root = RecipeFolder.objects.create(name="Recipes", project=cls.project)
+        for i in range(FIXTURE_SIZE):
+            data_source_folder = DataSourceFolder.objects.create(name=f"Folder {i}", parent=data_source_root,
+                                                                 project=cls.project)
+            recipe_folder = RecipeFolder.objects.create(name=f"Folder {i}", parent=recipe_root, project=cls.project)
+            data_source = DataSource.objects.create(name=f"Data source {i}", source="CSV", kwargs="{}",
+                                                    parent=data_source_folder, project=cls.project)
+            UserFile.objects.create(data_source=data_source, field_name="filename", file_name=f"{i}.csv",
+                                    original_file_name=f"{i}.csv", project=cls.project)
+            recipe = Recipe.objects.create(name=f"Recipe {i}", input=data_source, parent=recipe_folder,
+                                           project=cls.project)
+            for j in range(3):
+                Transformation.objects.create(recipe=recipe, transformation="format-uppercase",
+                                              kwargs=json.dumps({"fields": ["a"]}), order=j * Transformation.ORDER_STEP)
+            Join.objects.create(name=f"Join {i}", data_source_left=data_source, recipe_right=recipe, method="left",
+                                field_left="a", field_right="a", parent=data_source_folder, project=cls.project)
+            RecipeRun.objects.create(recipe=recipe, user=cls.user, project=cls.project)
+        cls.recipe = recipe
+        cls.recipe_folder = recipe_root
+        cls.data_source_folder = data_source_root
+
+    def assertQueryBudget(self, url: str, budget: int):
+        """
+        Check that a GET request uses at most the given number of queries.
+
+        :param url: The url to request
+        :param budget: The maximum number of queries
+        :return:
+        """
+        # A fresh user object, so nothing (like the profile) is cached from an earlier request
+        client = APIClient()
+        client.force_authenticate(User.objects.get(pk=self.user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertLessEqual(len(queries), budget, "\n".join(query["sql"] for query in queries.captured_queries))
+
+    def test_data_sources(self):
+        self.assertQueryBudget("/scout/api/datasource/", 4)
+        self.assertQueryBudget("/scout/api/datasource/?summary=1", 4)
+
+    def test_data_source_folders(self):
+        self.assertQueryBudget("/scout/api/datasourcefolder/", 8)
+        self.assertQueryBudget(f"/scout/api/datasourcefolder/{self.data_source_folder.pk}/", 8)
+
+    def test_data_source_files(self):
+        self.assertQueryBudget("/scout/api/datasource_file/", 4)
+
+    def test_joins(self):
+        self.assertQueryBudget("/scout/api/join/", 5)
+        self.assertQueryBudget("/scout/api/join/?summary=1", 4)
+
+    def test_recipes(self):
+        self.assertQueryBudget("/scout/api/recipe/", 5)
+        self.assertQueryBudget(f"/scout/api/recipe/{self.recipe.pk}/", 5)
+        self.assertQueryBudget("/scout/api/recipe/?summary=1", 4)
+        self.assertQueryBudget("/scout/api/recipe/?fields=id,name,parent", 4)
+
+    def test_recipe_folders(self):
+        self.assertQueryBudget("/scout/api/recipefolder/?orphans_only=1", 6)
+        self.assertQueryBudget(f"/scout/api/recipefolder/{self.recipe_folder.pk}/", 6)
+
+    def test_recipe_runs(self):
+        self.assertQueryBudget("/scout/api/recipe_run/", 4)
+
+    def test_transformations(self):
+        self.assertQueryBudget(f"/scout/api/transformation/{self.recipe.transformations.last().pk}/", 3)
+
+    def test_projects(self):
+        self.assertQueryBudget(f"/scout/api/project/{self.project.pk}/", 4)
+
+    def test_user_projects(self):
+        self.assertQueryBudget("/scout/api/user_project/", 2)
@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+# Packages that should only be imported when a pipeline is executed
+HEAVY_PACKAGES = ["data_scout", "numpy", "pandas", "pyarrow"]
+
+
+def _imported_modules(code: str) -> dict:
+    """
+    Run Python code in a fresh interpreter with -X importtime.
+
+    :param code: The code to run
+    :return: A dict of every imported module -> its cumulative import time (in microseconds)
+    """
+    env = dict(os.environ)
+    env.setdefault("DJANGO_SETTINGS_MODULE", "data_scout_server.settings")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=settings.BASE_DIR, env=env,
+                            stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, universal_newlines=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative)
+    return modules
+
+
+class StartupImportTest(SimpleTestCase):
+    """
+    Check that starting Django (as done by every management command and worker) doesn't import the data processing
+    stack. Those imports take more than a second and are only needed when a pipeline is executed.
+    """
+
+    def assertNoHeavyImports(self, modules: dict):
+        heavy = sorted(name for name in modules if name.split(".")[0] in HEAVY_PACKAGES)
+        self.assertEqual(heavy, [], "These modules should be imported lazily")
+
+    def test_setup(self):
+        self.assertNoHeavyImports(_imported_modules("import django; django.setup()"))
+
+    def test_urlconf(self):
+        self.assertNoHeavyImports(_imported_modules(
+            f"import django; django.setup(); import {settings.ROOT_URLCONF}"))
+
+    def test_worker_command(self):
+        self.assertNoHeavyImports(_imported_modules(
+            "import django; django.setup(); from apps.scout.management.commands import run_worker"))
@@ -1,7 +1,975 @@
-from django.test import TestCase
-from data_sources import CSV
-# Create your tests here.
+import hashlib
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
 
-csv = CSV({"filename": "test.csv", "delimiter": ",", "has_header": True, "encoding": "utf-8"})
-df = csv(True, "random")
-breakpoint()
+import pandas as pd
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient, APIRequestFactory
+
+from . import ingest, jobs, previews, snapshots, uploads
+from .cache import ResultCache, is_cacheable, result_cache
+from .executors import CachingPandasExecutor
+from .fingerprints import compute_checksum
+from .models import Project, UserProject, UserProfile, DataSource, Recipe, Transformation, Join, RecipeRun, UserFile, \
+    FileUpload, has_join_cycle
+from .registry import registry
+from .views.permissions import TransformationPermission, has_project_permission
+from .views.wrangler import ARROW_CONTENT_TYPE, _clean_json
+
+CSV_ROWS = 250
+
+
+class ScoutTestCase(TestCase):
+    """
+    A project with a CSV data source and a recipe that uppercases column "a". Every test gets its own media root and
+    previews run in the test process.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, SCOUT_PREVIEW_PROCESSES=0,
+                                              SCOUT_BACKGROUND_THREADS=0, SCOUT_INGEST_PART_ROWS=100)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, True)
+
+        self.user = User.objects.create_user("scout", password="scout")
+        self.project = Project.objects.create(name="Scout")
+        user_project = UserProject.objects.create(user=self.user, project=self.project, role="owner")
+        UserProfile.objects.create(user=self.user, project=user_project)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.data_source = DataSource.objects.create(name="Data source", source="CSV", kwargs="{}",
+                                                     project=self.project)
+        self.user_file = UserFile.objects.create(data_source=self.data_source, field_name="filename",
+                                                 file_name=self.write_csv("data.csv", CSV_ROWS),
+                                                 original_file_name="data.csv", project=self.project)
+        with open(os.path.join(self.media_root, "data.csv"), "rb") as f:
+            self.user_file.checksum = compute_checksum(f)
+        self.user_file.save()
+        self.data_source.kwargs = json.dumps({"filename": self.user_file.pk, "delimiter": ",", "has_header": True,
+                                              "encoding": "UTF-8"})
+        self.data_source.save()
+        self.recipe = Recipe.objects.create(name="Recipe", input=self.data_source, project=self.project)
+        self.transformation = Transformation.objects.create(recipe=self.recipe, transformation="format-uppercase",
+                                                            kwargs=json.dumps({"fields": ["a"]}))
+
+    def write_csv(self, file_name: str, rows: int) -> str:
+        """
+        Write a CSV file with a text, an integer and a float column (with missing values) to the media root.
+
+        :param file_name: The name of the file
+        :param rows: The number of rows
+        :return: The file name
+        """
+        with open(os.path.join(self.media_root, file_name), "w") as f:
+            f.write("a,b,c\n")
+            for i in range(rows):
+                f.write(f"x{i},{i},{i / 2 if i % 7 else ''}\n")
+        return file_name
+
+
+class JobQueueTest(ScoutTestCase):
+    """
+    Runs are queued through the API and executed by a worker.
+    """
+
+    def queue_run(self) -> RecipeRun:
+        response = self.client.post("/scout/api/recipe_run/", {"recipe": self.recipe.pk}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        return RecipeRun.objects.get(pk=response.json()["id"])
+
+    def result_files(self) -> list:
+        directory = os.path.join(self.media_root, jobs.RESULTS_DIR)
+        return os.listdir(directory) if os.path.isdir(directory) else []
+
+    def test_run(self):
+        run = self.queue_run()
+        self.assertEqual(run.status, "queued")
+        jobs.work(once=True)
+
+        run.refresh_from_db()
+        self.assertEqual(run.status, "succeeded", run.messages)
+        self.assertEqual(run.row_count, CSV_ROWS)
+        result = pd.read_csv(os.path.join(self.media_root, run.result_file))
+        self.assertEqual(result["a"].tolist(), [f"X{i}" for i in range(CSV_ROWS)])
+
+        response = self.client.get(f"/scout/api/recipe_run/{run.pk}/?output=file")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content).count(b"\n"), CSV_ROWS + 1)
+
+    def test_recipe_of_other_project(self):
+        other = Recipe.objects.create(name="Other", project=Project.objects.create(name="Other"))
+        response = self.client.post("/scout/api/recipe_run/", {"recipe": other.pk}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RecipeRun.objects.exists())
+
+    def test_run_deleted_while_running(self):
+        self.queue_run()
+        run = jobs.claim_next_run("test:1")
+        RecipeRun.objects.filter(pk=run.pk).delete()
+        # The result is stored for a run that no longer exists, which shouldn't raise or leave the file behind
+        jobs.execute_run(run)
+        self.assertEqual(self.result_files(), [])
+
+    def test_run_failed_while_running(self):
+        self.queue_run()
+        run = jobs.claim_next_run("test:1")
+        # E.g. the run took longer than SCOUT_RUN_TIMEOUT
+        RecipeRun.objects.filter(pk=run.pk).update(status="failed")
+        jobs.execute_run(run)
+        run.refresh_from_db()
+        self.assertEqual(run.status, "failed")
+        self.assertIsNone(run.result_file)
+        self.assertEqual(self.result_files(), [])
+
+    def test_delete_run_removes_result(self):
+        run = self.queue_run()
+        jobs.work(once=True)
+        self.assertEqual(len(self.result_files()), 1)
+        response = self.client.delete(f"/scout/api/recipe_run/{run.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.result_files(), [])
+
+    def test_worker_survives_errors(self):
+        run = self.queue_run()
+        with mock.patch("apps.scout.jobs.execute_run", side_effect=RuntimeError("boom")), \
+                self.assertLogs("apps.scout.jobs", level="ERROR"):
+            jobs.work(once=True)
+        run.refresh_from_db()
+        self.assertEqual(run.status, "failed")
+        self.assertIn("boom", run.messages)
+
+    def test_stale_runs(self):
+        # The id of a process that has stopped
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        dead = RecipeRun.objects.create(recipe=self.recipe, project=self.project, status="running",
+                                        worker=f"{socket.gethostname()}:{process.pid}")
+        alive = RecipeRun.objects.create(recipe=self.recipe, project=self.project, status="running",
+                                         worker=f"{socket.gethostname()}:{os.getpid()}")
+        self.assertEqual(jobs.fail_stale_jobs(), 1)
+        dead.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual(dead.status, "failed")
+        self.assertEqual(alive.status, "running")
+
+
+class ResultCacheTest(ScoutTestCase):
+    """
+    Intermediate results are freed when an object they were computed from changes.
+    """
+
+    def test_invalidate(self):
+        cache = ResultCache(1024 * 1024)
+        df = pd.DataFrame({"a": [1, 2, 3]})
+        cache.set("one", df, [], ["transformation:1", "data_source:1"])
+        cache.set("two", df, [], ["data_source:1"])
+        cache.invalidate("transformation:1")
+        self.assertIsNone(cache.get("one"))
+        self.assertEqual(cache.get("two")[0]["a"].tolist(), [1, 2, 3])
+        cache.invalidate("data_source:1")
+        self.assertIsNone(cache.get("two"))
+
+    def test_signals(self):
+        df = pd.DataFrame({"a": [1]})
+        result_cache.set("transformation", df, [], [f"transformation:{self.transformation.pk}"])
+        result_cache.set("data_source", df, [], [f"data_source:{self.data_source.pk}"])
+        self.transformation.save()
+        self.assertIsNone(result_cache.get("transformation"))
+        self.assertIsNotNone(result_cache.get("data_source"))
+        self.user_file.save()
+        self.assertIsNone(result_cache.get("data_source"))
+
+    def test_edited_recipe(self):
+        response = self.client.get(f"/scout/data/{self.recipe.pk}")
+        self.assertEqual(response.json()["data"]["records"][0][0], "X0")
+        response = self.client.patch(f"/scout/api/transformation/{self.transformation.pk}/",
+                                     {"transformation": "format-lowercase"}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        response = self.client.get(f"/scout/data/{self.recipe.pk}")
+        self.assertEqual(response.json()["data"]["records"][0][0], "x0")
+
+
+    def test_database_source(self):
+        path = os.path.join(self.media_root, "data.sqlite3")
+        with sqlite3.connect(path) as db:
+            db.execute("CREATE TABLE data (a TEXT)")
+            db.execute("INSERT INTO data VALUES ('x')")
+        data_source = DataSource.objects.create(name="Database", source="SQL", project=self.project, kwargs=json.dumps(
+            {"connection_string": f"sqlite:///{path}", "sql": "SELECT a FROM data"}))
+        Recipe.objects.filter(pk=self.recipe.pk).update(input=data_source)
+        self.assertFalse(is_cacheable({"source": "SQL", "kwargs": json.loads(data_source.kwargs)}))
+
+        response = self.client.get(f"/scout/data/{self.recipe.pk}")
+        self.assertEqual(response.json()["data"]["records"], [["X"]])
+        # The data in the database changed, which no signal can tell
+        with sqlite3.connect(path) as db:
+            db.execute("UPDATE data SET a = 'y'")
+        response = self.client.get(f"/scout/data/{self.recipe.pk}")
+        self.assertEqual(response.json()["data"]["records"], [["Y"]])
+
+
+class PreviewTest(ScoutTestCase):
+    """
+    Previews of recipes, as returned by the data endpoint.
+    """
+
+    def get_data(self, **params) -> dict:
+        response = self.client.get(f"/scout/data/{self.recipe.pk}", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["data"]
+
+    def test_cached_result(self):
+        data = self.get_data()
+        # A complete result is taken from the cache as-is
+        with mock.patch("apps.scout.executors.CachingPandasExecutor._get_columns",
+                        side_effect=AssertionError("The result was recomputed")):
+            self.assertEqual(self.get_data(offset=1)["column_types"], data["column_types"])
+
+    def test_resumed_result(self):
+        self.get_data()
+        Transformation.objects.create(recipe=self.recipe, transformation="format-lowercase", order=1,
+                                      kwargs=json.dumps({"fields": ["a"]}))
+        data = self.get_data()
+        result_cache.clear()
+        self.assertEqual(data, self.get_data())
+        self.assertEqual(len(data["column_types"]), 3)
+
+    def test_schema(self):
+        self.get_data()
+        self.recipe.refresh_from_db()
+        self.assertEqual(json.loads(self.recipe.schema), {"a": "str", "b": "str", "c": "str"})
+        # The recipe isn't written again while the schema stays the same
+        with CaptureQueriesContext(connection) as queries:
+            self.get_data(offset=10)
+        self.assertFalse(any(query["sql"].startswith("UPDATE") for query in queries))
+
+
+    def test_ndjson(self):
+        data = self.get_data()
+        response = self.client.get(f"/scout/data/{self.recipe.pk}", {"format": "ndjson"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        # The records are serialized in chunks
+        with mock.patch("apps.scout.views.wrangler.NDJSON_CHUNK_SIZE", 7):
+            lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        header = json.loads(lines[0])
+        self.assertTrue(header["success"])
+        self.assertEqual(header["column_names"], ["a", "b", "c"])
+        self.assertEqual(header["total_rows"], data["total_rows"])
+        self.assertEqual([json.loads(line) for line in lines[1:]], data["records"])
+
+    def test_columns_orient(self):
+        data = self.get_data()
+        columns = self.get_data(orient="columns")["columns"]
+        self.assertEqual(list(columns), data["column_names"])
+        self.assertEqual([list(record) for record in zip(*columns.values())], data["records"])
+
+    def test_arrow(self):
+        import pyarrow as pa
+
+        data = self.get_data()
+        for response in [self.client.get(f"/scout/data/{self.recipe.pk}", {"format": "arrow"}),
+                         self.client.get(f"/scout/data/{self.recipe.pk}", HTTP_ACCEPT=ARROW_CONTENT_TYPE)]:
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], ARROW_CONTENT_TYPE)
+            self.assertIn("Accept", response["Vary"])
+            table = pa.ipc.open_stream(b"".join(response.streaming_content)).read_all()
+            metadata = {key.decode("utf-8"): json.loads(value) for key, value in table.schema.metadata.items()}
+            self.assertTrue(metadata["success"])
+            self.assertEqual(metadata["total_rows"], data["total_rows"])
+            self.assertEqual(metadata["column_types"], data["column_types"])
+            self.assertEqual(table.column_names, data["column_names"])
+            self.assertEqual([list(row.values()) for row in table.to_pylist()], data["records"])
+
+    def test_not_modified(self):
+        url = f"/scout/data/{self.recipe.pk}"
+        etag = self.client.get(url)["ETag"]
+        with mock.patch("apps.scout.previews.execute_preview", side_effect=AssertionError("The recipe was executed")):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Every representation has its own tag
+        self.assertNotEqual(self.client.get(url, {"format": "ndjson"})["ETag"], etag)
+        self.assertNotEqual(self.client.get(url, {"offset": 10})["ETag"], etag)
+
+    def test_modified(self):
+        url = f"/scout/data/{self.recipe.pk}"
+        fingerprint_url = f"/scout/api/recipe/{self.recipe.pk}/fingerprint/"
+        etag, fingerprint = self.client.get(url)["ETag"], self.client.get(fingerprint_url).json()["fingerprint"]
+        self.transformation.transformation = "format-lowercase"
+        self.transformation.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertNotEqual(self.client.get(fingerprint_url).json()["fingerprint"], fingerprint)
+
+        # The file is replaced by one with other content
+        etag = response["ETag"]
+        self.write_csv("data.csv", 5)
+        self.user_file.checksum = None
+        self.user_file.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["data"]["total_rows"], 5)
+
+    def test_database_source(self):
+        data_source = DataSource.objects.create(name="Database", source="SQL", project=self.project, kwargs=json.dumps(
+            {"connection_string": "sqlite://", "sql": "SELECT 'x' AS a"}))
+        Recipe.objects.filter(pk=self.recipe.pk).update(input=data_source)
+        response = self.client.get(f"/scout/data/{self.recipe.pk}")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+
+class TransformationOrderTest(ScoutTestCase):
+    """
+    Transformations are ordered by their order key, the API represents the order by the previous transformation.
+    """
+
+    def steps(self) -> list:
+        return list(self.recipe.transformations.values_list("transformation", flat=True))
+
+    def create(self, transformation: str, **data) -> dict:
+        response = self.client.post("/scout/api/transformation/", {
+            "recipe": self.recipe.pk, "transformation": transformation, "kwargs": json.dumps({"fields": ["a"]}), **data
+        }, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()
+
+    def test_order_keys(self):
+        last = self.create("format-lowercase")
+        self.assertEqual(last["previous"], self.transformation.pk)
+        first = self.create("format-trim-whitespace", previous=None)
+        middle = self.create("format-propercase", previous=self.transformation.pk)
+        self.assertEqual(self.steps(), ["format-trim-whitespace", "format-uppercase", "format-propercase",
+                                        "format-lowercase"])
+        self.assertLess(first["order"], self.transformation.order)
+        self.assertTrue(self.transformation.order < middle["order"] < last["order"])
+
+        response = self.client.patch(f"/scout/api/transformation/{first['id']}/", {"previous": last["id"]},
+                                     format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.steps(), ["format-uppercase", "format-propercase", "format-lowercase",
+                                        "format-trim-whitespace"])
+
+    def test_renumber(self):
+        # Inserting directly after the first transformation again and again halves the gap every time
+        for _ in range(80):
+            self.create("format-lowercase", previous=self.transformation.pk)
+        orders = list(self.recipe.transformations.values_list("order", flat=True))
+        self.assertEqual(len(set(orders)), len(orders))
+        self.assertEqual(self.steps()[0], "format-uppercase")
+
+    def test_batch(self):
+        response = self.client.post(f"/scout/api/recipe/{self.recipe.pk}/transformations/", {"operations": [
+            {"op": "create", "transformation": "format-lowercase", "kwargs": "{}", "ref": "lower"},
+            {"op": "create", "transformation": "format-propercase", "kwargs": "{}", "previous": None},
+            {"op": "move", "id": self.transformation.pk, "previous": "lower"},
+            {"op": "update", "id": "lower", "kwargs": json.dumps({"fields": ["b"]})},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.steps(), ["format-propercase", "format-lowercase", "format-uppercase"])
+        self.assertEqual([step["transformation"] for step in response.json()["pipeline"]], self.steps())
+        self.assertIsNotNone(response.json()["fingerprint"])
+
+    def test_batch_is_atomic(self):
+        response = self.client.post(f"/scout/api/recipe/{self.recipe.pk}/transformations/", {"operations": [
+            {"op": "delete", "id": self.transformation.pk},
+            {"op": "update", "id": self.transformation.pk, "kwargs": "{}"},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["operation"], "1")
+        self.assertEqual(self.steps(), ["format-uppercase"])
+
+    def test_batch_malformed(self):
+        url = f"/scout/api/recipe/{self.recipe.pk}/transformations/"
+        response = self.client.post(url, {"operations": [{"op": "delete", "id": self.transformation.pk}, "delete"]},
+                                    format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["operation"], "1")
+        response = self.client.post(url, {"operations": [{"op": "delete", "id": [self.transformation.pk]}]},
+                                    format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(url, [], format="json").status_code, 400)
+        self.assertEqual(self.steps(), ["format-uppercase"])
+
+
+class JoinCycleTest(ScoutTestCase):
+    """
+    A recipe can't (indirectly) use its own output through a join.
+    """
+
+    def test_cycle(self):
+        join = Join.objects.create(name="Join", data_source_left=self.data_source, recipe_right=self.recipe,
+                                   method="left", field_left="a", field_right="a", project=self.project)
+        self.assertFalse(has_join_cycle(self.project.pk))
+        self.assertTrue(has_join_cycle(self.project.pk, recipes={self.recipe.pk: join.pk}))
+
+        response = self.client.patch(f"/scout/api/recipe/{self.recipe.pk}/", {"name": "Recipe", "input_join": join.pk},
+                                     format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("input_join", response.json())
+        self.recipe.refresh_from_db()
+        self.assertIsNone(self.recipe.input_join)
+
+    def test_chain(self):
+        # Recipe -> join -> other recipe is fine, as long as it doesn't lead back
+        other = Recipe.objects.create(name="Other", input=self.data_source, project=self.project)
+        join = Join.objects.create(name="Join", data_source_left=self.data_source, recipe_right=other,
+                                   method="left", field_left="a", field_right="a", project=self.project)
+        response = self.client.patch(f"/scout/api/recipe/{self.recipe.pk}/", {"name": "Recipe", "input_join": join.pk},
+                                     format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTrue(has_join_cycle(self.project.pk, recipes={other.pk: join.pk}))
+
+
+class ChunkedUploadTest(ScoutTestCase):
+    """
+    Files are uploaded in chunks, an interrupted upload continues from the first chunk that wasn't received.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.data = os.urandom(250000)
+        response = self.client.post(f"/scout/api/datasource_file/{self.user_file.pk}/uploads/", {
+            "size": len(self.data), "original_file_name": "new.csv", "chunk_size": 100000}, format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        self.url = f"/scout/api/datasource_file/{self.user_file.pk}/uploads/{response.json()['id']}/"
+
+    def put(self, index: int, data: bytes):
+        return self.client.generic("PUT", f"{self.url}{index}/", data, content_type="application/octet-stream")
+
+    def chunk(self, index: int) -> bytes:
+        return self.data[index * 100000:(index + 1) * 100000]
+
+    def test_upload(self):
+        self.assertEqual(self.put(0, self.chunk(0)).json()["next_chunk"], 1)
+        # A chunk that was already received (e.g. because the response got lost) is ignored
+        self.assertEqual(self.put(0, self.chunk(0)).json()["next_chunk"], 1)
+        # Resuming starts from the state of the upload
+        self.assertEqual(self.client.get(self.url).json()["received"], 100000)
+        self.assertEqual(self.put(2, self.chunk(2)).status_code, 409)
+        self.assertEqual(self.put(1, self.chunk(1)[:10]).status_code, 409)
+        self.assertEqual(self.put(1, self.chunk(1)).json()["next_chunk"], 2)
+        self.assertEqual(self.client.post(f"{self.url}finalize/", {}, format="json").status_code, 409)
+        self.assertEqual(self.put(2, self.chunk(2)).json()["received"], len(self.data))
+
+        self.assertEqual(self.client.post(f"{self.url}finalize/", {"checksum": "0" * 64}, format="json").status_code,
+                         409)
+        response = self.client.post(f"{self.url}finalize/", {"checksum": hashlib.sha256(self.data).hexdigest()},
+                                    format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.user_file.refresh_from_db()
+        self.assertEqual(self.user_file.original_file_name, "new.csv")
+        self.assertEqual(self.user_file.checksum, hashlib.sha256(self.data).hexdigest())
+        with open(os.path.join(self.media_root, self.user_file.file_name), "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(FileUpload.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "data.csv")))
+        self.assertEqual(os.listdir(os.path.join(self.media_root, uploads.PARTIAL_UPLOADS_DIR)), [])
+
+    def test_cancel(self):
+        self.put(0, self.chunk(0))
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertFalse(FileUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.media_root, uploads.PARTIAL_UPLOADS_DIR)), [])
+
+
+class DownloadTest(ScoutTestCase):
+    """
+    Downloads support conditional and range requests.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.url = f"/scout/api/datasource_file/{self.user_file.pk}/?output=file"
+        with open(os.path.join(self.media_root, "data.csv"), "rb") as f:
+            self.content = f.read()
+
+    def test_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn('filename="data.csv"', response["Content-Disposition"])
+
+    def test_conditional(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=6-15")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b"".join(response.streaming_content), self.content[6:16])
+        self.assertEqual(response["Content-Range"], f"bytes 6-15/{len(self.content)}")
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-10")
+        self.assertEqual(b"".join(response.streaming_content), self.content[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.content)}-")
+        self.assertEqual(response.status_code, 416)
+
+    def test_if_range(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag).status_code, 206)
+        # The file changed since the client received the first part, so the whole file is sent
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"old"').status_code, 200)
+
+
+class IngestTest(ScoutTestCase):
+    """
+    Uploaded files are ingested into Parquet by the workers, runs read the ingested copy.
+    """
+
+    def test_ingest(self):
+        self.user_file.refresh_from_db()
+        self.assertEqual(self.user_file.ingest_status, "queued")
+        jobs.work(once=True)
+
+        self.user_file.refresh_from_db()
+        self.assertEqual(self.user_file.ingest_status, "ready")
+        self.assertEqual(self.user_file.row_count, CSV_ROWS)
+        self.assertEqual([column["name"] for column in json.loads(self.user_file.schema)], ["a", "b", "c"])
+        path = os.path.join(self.media_root, self.user_file.ingested_path)
+        # The parts have at most SCOUT_INGEST_PART_ROWS rows
+        self.assertEqual(len(os.listdir(path)), 3)
+
+    def test_same_records(self):
+        from data_scout.connectors import CSV
+        from .connectors import IngestedConnector
+
+        jobs.work(once=True)
+        self.user_file.refresh_from_db()
+        kwargs = {"filename": os.path.join(self.media_root, "data.csv"), "delimiter": ",", "has_header": True,
+                  "encoding": "UTF-8"}
+        expected = CSV(kwargs)(False)
+        records = IngestedConnector({"path": os.path.join(self.media_root, self.user_file.ingested_path),
+                                     "source": "CSV", "kwargs": kwargs})(False)
+        self.assertEqual(len(records), len(expected))
+        for record, expected_record in zip(records, expected):
+            self.assertEqual(list(record), list(expected_record))
+            for key, value in expected_record.items():
+                # NaN isn't equal to itself, so missing values are compared by type
+                self.assertIs(type(record[key]), type(value), key)
+                if value == value:
+                    self.assertEqual(record[key], value)
+                else:
+                    self.assertNotEqual(record[key], record[key])
+
+    def test_run_with_missing_values(self):
+        jobs.work(once=True)
+        Transformation.objects.create(recipe=self.recipe, transformation="math-add", order=1,
+                                      kwargs=json.dumps({"fields": ["b", "c"], "output": "d"}))
+        self.client.post("/scout/api/recipe_run/", {"recipe": self.recipe.pk}, format="json")
+        jobs.work(once=True)
+        run = RecipeRun.objects.get()
+        self.assertEqual(run.status, "succeeded", run.messages)
+        self.assertEqual(run.row_count, CSV_ROWS)
+
+    def test_run_reads_ingested_copy(self):
+        jobs.work(once=True)
+        self.client.post("/scout/api/recipe_run/", {"recipe": self.recipe.pk}, format="json")
+        with mock.patch("data_scout.connectors.CSV.__call__", side_effect=AssertionError("The file was parsed")):
+            jobs.work(once=True)
+        run = RecipeRun.objects.get()
+        self.assertEqual(run.status, "succeeded", run.messages)
+        self.assertEqual(run.row_count, CSV_ROWS)
+
+    def test_replaced_file(self):
+        jobs.work(once=True)
+        self.user_file.refresh_from_db()
+        self.assertEqual(self.user_file.row_count, CSV_ROWS)
+
+        with open(os.path.join(self.media_root, self.write_csv("new.csv", 10)), "rb") as f:
+            response = self.client.put(f"/scout/api/datasource_file/{self.user_file.pk}/upload", f.read(),
+                                       content_type="text/csv", HTTP_CONTENT_DISPOSITION="attachment; filename=new.csv")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.user_file.refresh_from_db()
+        self.assertEqual(self.user_file.ingest_status, "queued")
+        self.assertIsNone(self.user_file.row_count)
+        self.assertIsNone(self.user_file.ingested_path)
+
+        jobs.work(once=True)
+        self.user_file.refresh_from_db()
+        self.assertEqual(self.user_file.row_count, 10)
+        # Only the copy of the current file is kept
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, ingest.INGESTED_DIR,
+                                                     str(self.user_file.pk)))), 1)
+
+    def test_stale_ingest(self):
+        process = subprocess.Popen([sys.executable, "-c", ""])
+        process.wait()
+        UserFile.objects.filter(pk=self.user_file.pk).update(ingest_status="running",
+                                                             ingest_worker=f"{socket.gethostname()}:{process.pid}")
+        jobs.fail_stale_jobs()
+        self.user_file.refresh_from_db()
+        self.assertEqual(self.user_file.ingest_status, "failed")
+
+
+class SnapshotTest(ScoutTestCase):
+    """
+    Samples of uploaded files are written to a snapshot once and read from it afterwards.
+    """
+
+    def snapshots(self) -> list:
+        directory = snapshots.snapshot_dir(self.data_source.pk)
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    def get_data(self) -> dict:
+        # Without the result cache every request reads the sample
+        result_cache.clear()
+        response = self.client.get(f"/scout/data/{self.recipe.pk}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["data"]
+
+    def test_snapshot(self):
+        data = self.get_data()
+        self.assertEqual(len(self.snapshots()), 1)
+        with mock.patch("data_scout.connectors.CSV.__call__", side_effect=AssertionError("The file was parsed")):
+            self.assertEqual(self.get_data(), data)
+
+    def test_changed_file(self):
+        self.get_data()
+        old_snapshots = self.snapshots()
+        self.write_csv("data.csv", 5)
+        self.assertEqual(self.get_data()["total_rows"], 5)
+        # The outdated snapshot is replaced
+        self.assertEqual(len(self.snapshots()), 1)
+        self.assertNotEqual(self.snapshots(), old_snapshots)
+
+    def test_deleted_data_source(self):
+        self.get_data()
+        self.data_source.delete()
+        self.assertEqual(self.snapshots(), [])
+
+
+# A query that keeps SQLite busy for much longer than any preview timeout
+SLOW_QUERY = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000000) " \
+             "SELECT count(*) AS n FROM c"
+
+
+class PreviewPoolTest(SimpleTestCase):
+    """
+    Previews executed by a pool of worker processes, which are replaced when a preview times out or is cancelled.
+    """
+
+    def start_pool(self, timeout: float) -> previews.PreviewPool:
+        pool = previews.PreviewPool(1, timeout)
+        self.addCleanup(lambda: [worker.kill() for worker in pool._idle])
+        return pool
+
+    def task(self, sql: str) -> dict:
+        return {"definition": {
+            "use_sample": True, "sampling_technique": "top", "column_types": True, "pipeline": [],
+            "data_source": {"source": "SQL", "kwargs": {"connection_string": "sqlite://", "sql": sql}},
+        }, "source_tags": [], "step_tags": []}
+
+    def test_timeout(self):
+        pool = self.start_pool(5)
+        with self.assertRaisesRegex(previews.PreviewException, "took longer than 5 seconds"):
+            pool.run(1, self.task(SLOW_QUERY))
+        # The worker was replaced
+        result = pool.run(1, self.task("SELECT 1 AS a"))
+        self.assertTrue(result["success"], result["messages"])
+        self.assertEqual(result["data"]["a"].tolist(), [1])
+
+    def test_cancel(self):
+        pool = self.start_pool(60)
+        errors = []
+
+        def run_slow():
+            try:
+                pool.run(1, self.task(SLOW_QUERY))
+            except previews.PreviewException as e:
+                errors.append(str(e))
+        thread = threading.Thread(target=run_slow)
+        thread.start()
+        while 1 not in pool._tickets:
+            time.sleep(0.01)
+        # A newer preview of the same recipe cancels the running one
+        result = pool.run(1, self.task("SELECT 1 AS a"))
+        thread.join()
+        self.assertEqual(errors, ["The preview was cancelled by a newer request"])
+        self.assertTrue(result["success"], result["messages"])
+
+        thread = threading.Thread(target=run_slow)
+        thread.start()
+        while 1 not in pool._tickets:
+            time.sleep(0.01)
+        pool.cancel(1)
+        thread.join()
+        self.assertEqual(len(errors), 2)
+
+
+class CleanJsonTest(SimpleTestCase):
+    """
+    NaN values are replaced column-wise before data is serialized as JSON.
+    """
+
+    def test_clean(self):
+        df = pd.DataFrame({0: [1.5, float("nan")], 1: pd.Series(["x", float("nan")], dtype=object),
+                           2: pd.Series([None, "y"], dtype=object), 3: [1, 2], 4: [float("nan"), None]})
+        df.columns = ["float", "object", "none", "int", "float"]
+        cleaned = _clean_json(df)
+        self.assertEqual(list(cleaned.columns), list(df.columns))
+        self.assertEqual(cleaned.to_dict(orient="split")["data"], [[1.5, "x", None, 1, "NaN"],
+                                                                   ["NaN", "NaN", "y", 2, "NaN"]])
+        self.assertEqual(cleaned["int"].dtype, df["int"].dtype)
+        # The original data frame isn't modified
+        self.assertTrue(pd.isna(df.iloc[1, 0]))
+
+    def test_nothing_to_clean(self):
+        df = pd.DataFrame({"a": [1, 2], "b": pd.Series(["x", None], dtype=object)})
+        self.assertIs(_clean_json(df), df)
+
+
+class ParallelJoinTest(ScoutTestCase):
+    """
+    The inputs of a join are executed in parallel.
+    """
+
+    def setUp(self):
+        super().setUp()
+        other = Recipe.objects.create(name="Other", input=self.data_source, project=self.project)
+        Transformation.objects.create(recipe=other, transformation="format-lowercase",
+                                      kwargs=json.dumps({"fields": ["a"]}))
+        join = Join.objects.create(name="Join", data_source_left=self.data_source, recipe_right=other, method="inner",
+                                   field_left="b", field_right="b", project=self.project)
+        self.joined = Recipe.objects.create(name="Joined", input_join=join, project=self.project)
+
+    def get_data(self) -> dict:
+        result_cache.clear()
+        response = self.client.get(f"/scout/data/{self.joined.pk}")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()["data"]
+
+    def test_parallel(self):
+        execute, threads = CachingPandasExecutor.execute, []
+
+        def record_thread(executor, *args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return execute(executor, *args, **kwargs)
+        with mock.patch.object(CachingPandasExecutor, "execute", autospec=True, side_effect=record_thread):
+            data = self.get_data()
+        self.assertTrue(any(name.startswith("scout-join") for name in threads), threads)
+        self.assertEqual(data["records"][0][:4], ["x0", "0", "", "x0"])
+
+        with self.settings(SCOUT_JOIN_PARALLELISM=1):
+            self.assertEqual(self.get_data(), data)
+
+
+class RegistryTest(ScoutTestCase):
+    """
+    The metadata of the available transformations and data sources is serialized once and served with an ETag.
+    """
+
+    def test_metadata(self):
+        for url in ["/scout/datasource_types/", "/scout/transformation_types_view/", "/scout/meta/transformations"]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "application/json")
+            self.assertIn("ETag", response)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+        names = [data_source["name"] for data_source in self.client.get("/scout/datasource_types/").json()]
+        self.assertIn("CSV", names)
+        self.assertIn("math-add", self.client.get("/scout/meta/transformations").json())
+
+    def test_scout(self):
+        scout = registry.scout(logging.getLogger("scout-test"))
+        # Every caller gets its own copy with its own logger, the transformations are shared
+        self.assertIsNot(scout, registry.scout())
+        self.assertNotEqual(registry.scout().log, scout.log)
+        self.assertIs(scout.transformations, registry.scout().transformations)
+
+
+class PermissionTest(ScoutTestCase):
+    """
+    Members of a project can read its objects, only owners, admins and editors can change them.
+    """
+
+    def client_for(self, role: str = None) -> APIClient:
+        user = User.objects.create_user(f"user-{role}", password="user")
+        if role is not None:
+            UserProject.objects.create(user=user, project=self.project, role=role)
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_roles(self):
+        url = f"/scout/api/transformation/{self.transformation.pk}/"
+        for role, read_status, write_status in [("viewer", 200, 403), ("editor", 200, 200), (None, 403, 403)]:
+            client = self.client_for(role)
+            self.assertEqual(client.get(url).status_code, read_status, role)
+            self.assertEqual(client.patch(url, {"transformation": "format-lowercase"}, format="json").status_code,
+                             write_status, role)
+
+    def test_roles_loaded_once(self):
+        request = APIRequestFactory().get("/")
+        request.user = self.user
+        with self.assertNumQueries(1):
+            self.assertTrue(has_project_permission(request, self.project.pk))
+            self.assertFalse(has_project_permission(request, self.project.pk + 1))
+            self.assertTrue(TransformationPermission().has_object_permission(request, None, self.transformation))
+
+
+class RecipeListTest(ScoutTestCase):
+    """
+    Recipe listings can be limited to some fields, or return the compact summary of every recipe.
+    """
+
+    def test_sparse_fields(self):
+        response = self.client.get("/scout/api/recipe/", {"fields": "id,name"})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["results"], [{"id": self.recipe.pk, "name": "Recipe"}])
+        response = self.client.get(f"/scout/api/recipe/{self.recipe.pk}/", {"fields": "transformations"})
+        self.assertEqual(list(response.json()), ["transformations"])
+        self.assertEqual(len(response.json()["transformations"]), 1)
+
+    def test_unknown_field(self):
+        response = self.client.get("/scout/api/recipe/", {"fields": "id,secret"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("fields", response.json())
+
+    def test_summary(self):
+        response = self.client.get("/scout/api/recipe/", {"summary": "1"})
+        self.assertEqual(response.json()["results"], [{"id": self.recipe.pk, "name": "Recipe", "parent": None,
+                                                       "step_count": 1, "last_run": None}])
+        run = RecipeRun.objects.create(recipe=self.recipe, user=self.user, project=self.project)
+        response = self.client.get("/scout/api/recipe/", {"summary": "1", "fields": "id,last_run"})
+        self.assertEqual(response.json()["results"], [{"id": self.recipe.pk, "last_run": {
+            "id": run.pk, "status": "queued", "finished": None}}])
+
+
+class PaginationTest(ScoutTestCase):
+    """
+    Lists are paginated with a cursor, ordered by id.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for i in range(9):
+            Recipe.objects.create(name=f"Recipe {i}", input=self.data_source, project=self.project)
+
+    def test_pages(self):
+        ids, url = [], "/scout/api/recipe/?page_size=4&fields=id"
+        while url is not None:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertLessEqual(len(response.json()["results"]), 4)
+            ids.extend(recipe["id"] for recipe in response.json()["results"])
+            url = response.json()["next"]
+            if len(ids) == 4:
+                # Objects created while paging don't shift the pages
+                Recipe.objects.create(name="New", input=self.data_source, project=self.project)
+        self.assertEqual(ids, sorted(Recipe.objects.values_list("id", flat=True)))
+
+    def test_page_size(self):
+        with self.settings(SCOUT_PAGE_SIZE=3, SCOUT_MAX_PAGE_SIZE=5):
+            self.assertEqual(len(self.client.get("/scout/api/recipe/").json()["results"]), 3)
+            self.assertEqual(len(self.client.get("/scout/api/recipe/?page_size=100").json()["results"]), 5)
+
+
+class DatabaseTest(SimpleTestCase):
+    """
+    SQLite connections use write-ahead logging and wait for locks held by other connections.
+    """
+
+    def connect(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        wrapper = SQLiteDatabaseWrapper({**connection.settings_dict, "NAME": os.path.join(directory, "db.sqlite3")})
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        return wrapper
+
+    def pragma(self, wrapper, name: str):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    @skipUnless(connection.vendor == "sqlite", "The database isn't SQLite")
+    def test_sqlite(self):
+        wrapper = self.connect()
+        self.assertEqual(self.pragma(wrapper, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(wrapper, "synchronous"), 1)
+        self.assertEqual(self.pragma(wrapper, "busy_timeout"),
+                         connection.settings_dict["OPTIONS"].get("timeout", 5) * 1000)
+        with self.settings(SCOUT_SQLITE_WAL=False):
+            self.assertEqual(self.pragma(self.connect(), "journal_mode"), "delete")
+
+
+class SchemaTest(ScoutTestCase):
+    """
+    The schema of a data source is inferred in the background after it's saved, clients poll its status.
+    """
+
+    def setUp(self):
+        super().setUp()
+        submit = mock.patch("apps.scout.background.submit")
+        self.submit = submit.start()
+        self.addCleanup(submit.stop)
+
+    def save(self, **kwargs):
+        response = self.client.patch(f"/scout/api/datasource/{self.data_source.pk}/", {
+            "name": "Data source", "source": "CSV",
+            "kwargs": json.dumps({"filename": self.user_file.pk, "delimiter": ",", "has_header": True,
+                                  "encoding": "UTF-8", **kwargs}),
+        }, format="json")
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def run_task(self, index: int = -1):
+        func, *args = self.submit.call_args_list[index][0]
+        func(*args)
+
+    def status(self) -> dict:
+        response = self.client.get(f"/scout/api/datasource/{self.data_source.pk}/schema/")
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_infer(self):
+        self.save()
+        self.assertEqual(self.status()["schema_status"], "pending")
+        self.run_task()
+        status = self.status()
+        self.assertEqual(status["schema_status"], "ready")
+        self.assertEqual(json.loads(status["schema"]), {"a": "str", "b": "str", "c": "str"})
+        # Saving the same settings doesn't infer the schema again
+        self.save()
+        self.assertEqual(self.submit.call_count, 1)
+
+    def test_changed_while_pending(self):
+        self.save()
+        self.save(delimiter=";")
+        self.assertEqual(self.submit.call_count, 2)
+        # The first inference is outdated, its result is discarded
+        self.run_task(0)
+        self.assertEqual(self.status()["schema_status"], "pending")
+        self.run_task(1)
+        self.assertEqual(self.status()["schema_status"], "ready")
+        self.assertEqual(json.loads(self.status()["schema"]), {"a,b,c": "str"})
+
+    def test_failed(self):
+        self.save()
+        os.remove(os.path.join(self.media_root, "data.csv"))
+        with self.assertLogs("apps.scout.previews", logging.ERROR):
+            self.run_task()
+        status = self.status()
+        self.assertEqual(status["schema_status"], "failed")
+        self.assertGreater(len(json.loads(status["schema_messages"])), 0)
@@ -0,0 +1,47 @@
+"""
+In-memory assembly of folder trees. Serializing a folder tree with nested serializers queries the child folders and
+contents of every folder separately. Instead, all folders and their contents are fetched at once and attached to the
+folders as prefetched related objects, so the (unchanged) serializers don't need to query anything.
+"""
+
+from typing import Dict, List, Tuple
+
+from django.db import models
+
+
+def _prefetched(model, objects: list) -> models.QuerySet:
+    # This is the same thing Django's prefetch_related stores
+    queryset = model._default_manager.all()
+    queryset._result_cache = objects
+    queryset._prefetch_done = True
+    return queryset
+
+
+def attach_folder_tree(objects: list, folders: list, contents: Dict[str, Tuple[type, list]]):
+    """
+    Attach the child folders and contents to a list of folders (and to all folders below them).
+
+    :param objects: The folders that will be serialized
+    :param folders: All folders of the project(s) of those folders
+    :param contents: The related name -> (model, objects) of everything folders can contain, e.g.
+    {"children": (Recipe, recipes)}. Every object should have a parent_id.
+    :return:
+    """
+    folder_model = type(folders[0]) if len(folders) > 0 else None
+    children = {}
+    for folder in folders:
+        children.setdefault(("child_folders", folder.parent_id), []).append(folder)
+    for related_name, (_, items) in contents.items():
+        for item in items:
+            children.setdefault((related_name, item.parent_id), []).append(item)
+
+    caches = {}
+    for folder in folders:
+        cache = {"child_folders": _prefetched(folder_model, children.get(("child_folders", folder.pk), []))}
+        for related_name, (model, _) in contents.items():
+            cache[related_name] = _prefetched(model, children.get((related_name, folder.pk), []))
+        folder._prefetched_objects_cache = caches[folder.pk] = cache
+
+    for obj in objects:
+        if obj.pk in caches:
+            obj._prefetched_objects_cache = caches[obj.pk]
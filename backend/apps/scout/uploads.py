@@ -0,0 +1,196 @@
+"""
+Chunked, resumable uploads of user files. An upload is started with the size of the file, after which the chunks are
+sent one by one (in order). Every chunk is streamed to a temporary file next to the media root, so memory use doesn't
+depend on the size of the file. The number of received bytes is stored with the upload, so an interrupted upload
+continues from the first chunk that wasn't acknowledged. Finalizing the upload moves the temporary file into place.
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+
+import cachetools
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import ingest
+from .fingerprints import CHECKSUM_BLOCK_SIZE, compute_checksum
+from .models import FileUpload, UserFile
+
+PARTIAL_UPLOADS_DIR = "partial_uploads"
+DEFAULT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# The running checksums of uploads handled by this process: upload id -> (received bytes, digest). If a chunk was
+# handled by another process (or the process restarted), the checksum is calculated from the file when finalizing.
+_digests = cachetools.LRUCache(maxsize=64)
+_digests_lock = threading.Lock()
+
+
+class UploadException(Exception):
+    """
+    Raised when a chunk or finalize request doesn't match the state of the upload.
+    """
+    pass
+
+
+def partial_path(upload: FileUpload) -> str:
+    return os.path.join(settings.MEDIA_ROOT, PARTIAL_UPLOADS_DIR, f"{upload.pk}.part")
+
+
+def start_upload(user_file: UserFile, original_file_name: str, size: int, chunk_size: int = None) -> FileUpload:
+    """
+    Start a chunked upload for a user file.
+
+    :param user_file: The user file the uploaded file will be attached to
+    :param original_file_name: The name of the file on the client
+    :param size: The size of the file in bytes
+    :param chunk_size: The requested size of the chunks (bounded by SCOUT_UPLOAD_MAX_CHUNK_SIZE)
+    :return: The upload
+    """
+    if size < 0:
+        raise UploadException("The size of a file can't be negative")
+    if chunk_size is None:
+        chunk_size = getattr(settings, "SCOUT_UPLOAD_CHUNK_SIZE", DEFAULT_UPLOAD_CHUNK_SIZE)
+    if chunk_size <= 0:
+        raise UploadException("The chunk size should be positive")
+    chunk_size = min(chunk_size, getattr(settings, "SCOUT_UPLOAD_MAX_CHUNK_SIZE", DEFAULT_UPLOAD_MAX_CHUNK_SIZE))
+
+    upload = FileUpload.objects.create(user_file=user_file, original_file_name=original_file_name, size=size,
+                                       chunk_size=chunk_size, project_id=user_file.project_id)
+    os.makedirs(os.path.dirname(partial_path(upload)), exist_ok=True)
+    open(partial_path(upload), "wb").close()
+    with _digests_lock:
+        _digests[upload.pk] = (0, hashlib.sha256())
+    return upload
+
+
+def write_chunk(upload_id, index: int, stream) -> FileUpload:
+    """
+    Write a chunk of an upload. Chunks should be sent in order, a chunk that was already received is ignored (e.g.
+    because the acknowledgement got lost), so sending it again is safe. The chunk is written to disk before the upload
+    is locked, so a slow client doesn't hold the lock, the received bytes are updated in a short transaction afterwards.
+
+    :param upload_id: The id of the upload
+    :param index: The (zero based) index of the chunk
+    :param stream: A file-like object to read the contents of the chunk from
+    :return: The updated upload
+    """
+    upload = FileUpload.objects.get(pk=upload_id)
+    offset = index * upload.chunk_size
+    if offset < upload.received:
+        return upload
+    if offset > upload.received:
+        raise UploadException(f"Chunk {index} was sent before chunk {upload.received // upload.chunk_size}")
+    length = min(upload.chunk_size, upload.size - offset)
+    if length <= 0:
+        raise UploadException("All chunks of this upload have been received")
+
+    # The running checksum is continued on a copy, which is only kept if the chunk is accepted
+    with _digests_lock:
+        received, digest = _digests.get(upload.pk, (None, None))
+    digest = digest.copy() if received == offset else None
+
+    # Every chunk has its own range of the file, so whatever is left of an interrupted attempt to write this chunk is
+    # overwritten by the next attempt
+    try:
+        with open(partial_path(upload), "r+b") as f:
+            f.seek(offset)
+            written = 0
+            while written < length:
+                block = stream.read(min(CHECKSUM_BLOCK_SIZE, length - written))
+                if not block:
+                    break
+                f.write(block)
+                written += len(block)
+                if digest is not None:
+                    digest.update(block)
+            if written != length or stream.read(1):
+                raise UploadException(f"Chunk {index} should contain {length} bytes")
+            f.flush()
+            os.fsync(f.fileno())
+    except FileNotFoundError:
+        raise UploadException("The upload was cancelled or finalized")
+
+    with transaction.atomic():
+        upload = FileUpload.objects.select_for_update().filter(pk=upload_id).first()
+        if upload is None:
+            raise UploadException("The upload was cancelled or finalized")
+        if upload.received != offset:
+            # Another attempt to send this chunk was accepted in the meantime
+            return upload
+        upload.received += length
+        upload.save(update_fields=["received"])
+    if digest is not None:
+        with _digests_lock:
+            _digests[upload.pk] = (upload.received, digest)
+    return upload
+
+
+def _store(path: str, file_name: str):
+    """
+    Move a file into the default storage. On a local file system, this is an atomic rename.
+    """
+    try:
+        target = default_storage.path(file_name)
+    except NotImplementedError:
+        # The storage isn't on the local file system, so the file has to be copied
+        with open(path, "rb") as f:
+            default_storage.save(file_name, File(f))
+        os.remove(path)
+        return
+    os.replace(path, target)
+
+
+def finalize_upload(upload_id, checksum: str = None) -> UserFile:
+    """
+    Finish an upload: move the file into place and attach it to the user file (replacing its previous file).
+
+    :param upload_id: The id of the upload
+    :param checksum: The SHA-256 checksum calculated by the client, if given the upload fails when it doesn't match
+    :return: The updated user file
+    """
+    with transaction.atomic():
+        upload = FileUpload.objects.select_for_update().select_related("user_file").get(pk=upload_id)
+        if upload.received != upload.size:
+            raise UploadException(f"Only {upload.received} of {upload.size} bytes have been received")
+
+        with _digests_lock:
+            received, digest = _digests.pop(upload.pk, (None, None))
+        if received == upload.size:
+            file_checksum = digest.hexdigest()
+        else:
+            with open(partial_path(upload), "rb") as f:
+                file_checksum = compute_checksum(f)
+        if checksum is not None and checksum.lower() != file_checksum:
+            raise UploadException("The checksum of the uploaded file doesn't match")
+
+        user_file = upload.user_file
+        previous_file_name = user_file.file_name
+        file_name = str(uuid.uuid4())
+        _store(partial_path(upload), file_name)
+        user_file.file_name = file_name
+        user_file.checksum = file_checksum
+        user_file.original_file_name = upload.original_file_name
+        ingest.reset_ingested(user_file)
+        user_file.save()
+        upload.delete()
+
+    if previous_file_name is not None and default_storage.exists(previous_file_name):
+        default_storage.delete(previous_file_name)
+    return user_file
+
+
+def remove_partial_upload(upload: FileUpload):
+    """
+    Remove the temporary file of an upload (if it still exists).
+    """
+    try:
+        os.remove(partial_path(upload))
+    except FileNotFoundError:
+        pass
+    with _digests_lock:
+        _digests.pop(upload.pk, None)
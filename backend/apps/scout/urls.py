@@ -10,6 +10,7 @@ router.register(r'datasourcefolder', views.datasources.DataSourceFolderViewSet)
 router.register(r'recipe', views.wrangler.RecipeViewSet)
 router.register(r'recipefolder', views.wrangler.RecipeFolderViewSet)
 router.register(r'transformation', views.wrangler.TransformationViewSet)
+router.register(r'recipe_run', views.wrangler.RecipeRunViewSet)
 router.register(r'join', views.datasources.JoinViewSet)
 router.register(r'datasource_file', views.datasources.UserFileViewSet)
 router.register(r'project', views.iam.ProjectViewSet)
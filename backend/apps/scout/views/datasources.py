@@ -1,33 +1,28 @@
+import io
 import json
-import mimetypes
 import os
 import uuid
-from wsgiref.util import FileWrapper
 
 from django.conf import settings
-from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 
-from rest_framework import views, response
+from rest_framework import views, response, status
 from rest_framework import permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.parsers import FileUploadParser
 from rest_framework.response import Response
 
-import data_scout
-
+from .. import downloads, ingest, schemas, snapshots, uploads
+from ..fingerprints import compute_checksum
 from ..views.iam import ProjectModelView
-from ..serializers import DataSourceSerializer, UserFileSerializer, DataSourceFolderSerializer, JoinSerializer
-from ..models import DataSource, UserFile, DataSourceFolder, Join
-
-
-def _is_int(val):
-    try:
-        int(val)
-        return True
-    except:
-        return False
+from ..serializers import DataSourceSerializer, UserFileSerializer, DataSourceFolderSerializer, JoinSerializer, \
+    DataSourceSummarySerializer, JoinSummarySerializer, FileUploadSerializer
+from ..models import DataSource, UserFile, DataSourceFolder, Join, FileUpload
+from ..registry import metadata_response
+from ..trees import attach_folder_tree
 
 
 class DataSourceViewSet(ProjectModelView):
@@ -36,51 +31,39 @@ class DataSourceViewSet(ProjectModelView):
     """
     queryset = DataSource.objects.all()
     serializer_class = DataSourceSerializer
+    summary_serializer_class = DataSourceSummarySerializer
 
-    def _make_schema(self, request):
-        """
-        Generate a schema for this data source (column names and types).
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        schemas.request_schema(serializer.instance)
 
-        :param request:
-        :return:
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        schemas.request_schema(serializer.instance)
+
+    @action(detail=True, methods=["get"], url_path="schema")
+    def schema_status(self, request, pk=None):
+        """
+        Get the schema of the data source and the status of its inference, to poll until it's ready.
         """
-        # We try if the data source actually works and what the data schema looks like
-        definition = {"use_sample": True,
-                      "sampling_technique": "top",
-                      "column_types": True}
-        data_source = {"source": request.data["source"], "kwargs": json.loads(request.data["kwargs"])}
-
-        scout = data_scout.scout.Scout()
-        ds = scout.get_data_source(data_source["source"])
-        # Sometimes a data source is created that isn't ready to be tested (e.g. because the files still need to be
-        # uploaded.
-        ready = True
-        for field_name, field in ds.fields.items():
-            if field["type"] == "file":
-                if field_name in data_source["kwargs"] and _is_int(data_source["kwargs"][field_name]):
-                    user_file = UserFile.objects.get(pk=data_source["kwargs"][field_name])
-                    data_source["kwargs"][field_name] = os.path.join(settings.MEDIA_ROOT, user_file.file_name)
-                else:
-                    ready = False
-        if ready:
-            definition["data_source"] = data_source
-            definition["pipeline"] = []
-            records, columns = scout.execute_json(definition, data_scout.executor.PandasExecutor)
-            request.data["schema"] = json.dumps(columns[-1])
-        return request
-
-    def update(self, request, *args, **kwargs):
-        request = self._make_schema(request)
-        return super().update(request, *args, **kwargs)
-
-    def create(self, request, *args, **kwargs):
-        request = self._make_schema(request)
-        return super().create(request, *args, **kwargs)
+        serializer = DataSourceSerializer(self.get_object(),
+                                          fields=["id", "schema", "schema_status", "schema_messages"])
+        return Response(serializer.data)
+
+
+UPLOAD_ID_PATTERN = r"(?P<upload_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})"
 
 
 class UserFileViewSet(ProjectModelView):
     """
     API endpoint that allows user files to be viewed or edited.
+
+    Large files are uploaded in chunks (see the uploads module):
+    - POST uploads/ with the "size" and "original_file_name" (and optionally "chunk_size") of the file starts an upload
+    - PUT uploads/<upload id>/<chunk index>/ sends a chunk (the raw bytes)
+    - GET uploads/<upload id>/ returns the state of the upload, including the next chunk to send (to resume an upload)
+    - POST uploads/<upload id>/finalize/ (optionally with the "checksum" of the file) attaches the file
+    - DELETE uploads/<upload id>/ cancels the upload
     """
     queryset = UserFile.objects.all()
     serializer_class = UserFileSerializer
@@ -93,21 +76,77 @@ class UserFileViewSet(ProjectModelView):
         Retrieve the user file. If the "output" get parameter is set to file, it will return a raw file. If it's set to
         JSON (which is the default), it will return the userfile object as JSON.
         """
-        user_file = get_object_or_404(self.queryset, pk=pk)
+        user_file = self.get_object()
         if request.query_params.get("output", "json") == "file":
-            with default_storage.open(user_file.file_name) as f:
-                res = HttpResponse(FileWrapper(f), content_type=mimetypes.guess_type(user_file.original_file_name))
-                res['Content-Disposition'] = f"attachment; filename={user_file.original_file_name}"
-                return res
+            if user_file.file_name is None:
+                return Response({"detail": "No file has been uploaded (yet)."}, status=status.HTTP_404_NOT_FOUND)
+            etag = f'"{user_file.checksum}"' if user_file.checksum else None
+            return downloads.file_response(request, user_file.file_name, user_file.original_file_name or
+                                           user_file.file_name, etag=etag)
         else:
             serializer = self.serializer_class(user_file)
             return Response(serializer.data)
     # TODO: Add some sort of on delete to delete the accompanying file
 
     def get_queryset(self):
-        queryset = self.queryset.filter(project=self.request.user.profile.project.project)
+        queryset = self.queryset.filter(project=self.request.user.profile.project.project_id)
         return queryset
 
+    def _get_upload(self, upload_id: str) -> FileUpload:
+        return get_object_or_404(FileUpload, pk=upload_id, user_file=self.get_object())
+
+    @action(detail=True, methods=["post"], url_path="uploads")
+    def start_upload(self, request, pk=None):
+        """
+        Start a chunked upload.
+        """
+        user_file = self.get_object()
+        try:
+            size = int(request.data["size"])
+            chunk_size = int(request.data["chunk_size"]) if request.data.get("chunk_size") is not None else None
+            upload = uploads.start_upload(user_file, str(request.data["original_file_name"]), size, chunk_size)
+        except (KeyError, TypeError, ValueError, uploads.UploadException) as e:
+            raise ValidationError({"detail": f"Invalid upload: {e}"})
+        return Response(FileUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=["get", "delete"], url_path=f"uploads/{UPLOAD_ID_PATTERN}")
+    def upload(self, request, upload_id: str, pk=None):
+        """
+        Get the state of a chunked upload, or cancel it.
+        """
+        upload = self._get_upload(upload_id)
+        if request.method == "DELETE":
+            upload.delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(FileUploadSerializer(upload).data)
+
+    @action(detail=True, methods=["put"], url_path=f"uploads/{UPLOAD_ID_PATTERN}/(?P<chunk>[0-9]+)")
+    def upload_chunk(self, request, upload_id: str, chunk: str, pk=None):
+        """
+        Receive a chunk of an upload. The body is streamed to disk. A chunk that doesn't follow the last received one
+        results in a conflict, which contains the state of the upload so the client can continue from there.
+        """
+        upload = self._get_upload(upload_id)
+        try:
+            upload = uploads.write_chunk(upload.pk, int(chunk), request.stream or io.BytesIO())
+        except uploads.UploadException as e:
+            return Response({"detail": str(e), "upload": FileUploadSerializer(self._get_upload(upload_id)).data},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(FileUploadSerializer(upload).data)
+
+    @action(detail=True, methods=["post"], url_path=f"uploads/{UPLOAD_ID_PATTERN}/finalize")
+    def finalize_upload(self, request, upload_id: str, pk=None):
+        """
+        Finish a chunked upload and attach the file to the user file.
+        """
+        upload = self._get_upload(upload_id)
+        try:
+            user_file = uploads.finalize_upload(upload.pk, request.data.get("checksum"))
+        except uploads.UploadException as e:
+            return Response({"detail": str(e), "upload": FileUploadSerializer(self._get_upload(upload_id)).data},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(UserFileSerializer(user_file).data)
+
 
 class UserFileUploadView(views.APIView):
     """
@@ -133,10 +172,14 @@ class UserFileUploadView(views.APIView):
         if user_file.file_name is not None and default_storage.exists(user_file.file_name):
             default_storage.delete(user_file.file_name)
 
+        # The file is streamed to the storage, so it's never loaded into memory as a whole
         file_obj = request.data['file']
-        default_storage.save(file_name, ContentFile(file_obj.read()))
+        user_file.checksum = compute_checksum(file_obj)
+        file_obj.seek(0)
+        default_storage.save(file_name, file_obj)
         user_file.file_name = file_name
         user_file.original_file_name = request.data['file'].name
+        ingest.reset_ingested(user_file)
         user_file.save()
 
         serializer = UserFileSerializer(user_file, many=False)
@@ -150,13 +193,7 @@ class DataSourceTypesView(views.APIView):
         """
         Get an overview of all available data source types.
         """
-        scout = data_scout.scout.Scout()
-        data_source_types = scout.data_sources
-        serialized = []
-        for data_source_type in data_source_types.values():
-            serialized.append({"name": data_source_type.__name__, "fields": data_source_type.fields})
-
-        return response.Response(serialized)
+        return metadata_response(request, "data_source_types")
 
 
 class DataSourceFolderViewSet(ProjectModelView):
@@ -166,34 +203,72 @@ class DataSourceFolderViewSet(ProjectModelView):
     queryset = DataSourceFolder.objects.all()
     serializer_class = DataSourceFolderSerializer
 
+    def prepare_objects(self, objects: list):
+        """
+        Fetch the folders, data sources and joins of the project at once and assemble the folder tree in memory.
+        """
+        projects = {obj.project_id for obj in objects}
+        joins = Join.objects.filter(project__in=projects, parent__isnull=False) \
+            .select_related("data_source_left", "data_source_right", "recipe_left", "recipe_right") \
+            .prefetch_related("recipe_left__transformations", "recipe_right__transformations")
+        attach_folder_tree(objects, list(DataSourceFolder.objects.filter(project__in=projects)), {
+            "children": (DataSource, list(DataSource.objects.filter(project__in=projects, parent__isnull=False))),
+            "child_joins": (Join, list(joins)),
+        })
+
 
 class JoinViewSet(ProjectModelView):
     """
     API endpoint that allows joins to be viewed or edited.
     """
-    queryset = Join.objects.all()
+    queryset = Join.objects.select_related("data_source_left", "data_source_right", "recipe_left", "recipe_right") \
+        .prefetch_related("recipe_left__transformations", "recipe_right__transformations")
     serializer_class = JoinSerializer
+    summary_serializer_class = JoinSummarySerializer
+
+    def get_queryset(self):
+        queryset = super(JoinViewSet, self).get_queryset()
+        if self.is_summary():
+            # The summary doesn't contain the data sources and recipes
+            queryset = queryset.select_related(None).prefetch_related(None)
+        return queryset
 
 
-def _data_source_to_dict(data_source: DataSource, scout: data_scout.scout.Scout):
+def _data_source_to_dict(data_source: DataSource, scout: "data_scout.scout.Scout", snapshot: bool = False,
+                         ingested: bool = False):
     """
     Convert a data source object to a dictionary.
 
     :param data_source: The data source to convert
     :param scout: An initialized data scout Scout object
+    :param snapshot: If True, samples of uploaded files are read from a snapshot (see snapshots.install)
+    :param ingested: If True, all data is read from the ingested copy of the file, if there is one (see ingest.install)
     :return:
     """
-    data_source = {"source": data_source.source, "kwargs": json.loads(data_source.kwargs)}
+    data_source_id = data_source.id
+    source = data_source.source
+    kwargs = json.loads(data_source.kwargs)
+    data_source = {"source": source, "kwargs": dict(kwargs)}
     ds = scout.get_data_source(data_source["source"])
+    user_files = []
     for field_name, field in ds.fields.items():
         if field["type"] == "file":
             user_file = UserFile.objects.get(pk=data_source["kwargs"][field_name])
             data_source["kwargs"][field_name] = os.path.join(settings.MEDIA_ROOT, user_file.file_name)
+            user_files.append(user_file)
+    # Only samples of uploaded files are snapshotted, the fingerprint of a snapshot can't tell when the data in a
+    # database (e.g. SQL or BigQuery) changed
+    if snapshot and len(user_files) > 0:
+        data_source = snapshots.snapshot_definition(data_source_id, data_source)
+    if ingested and len(user_files) == 1:
+        path = ingest.ingested_path(user_files[0], source, kwargs)
+        if path is not None:
+            data_source = ingest.ingested_definition(path, data_source)
     return data_source
 
 
-def _data_source_to_pipeline(data_source: DataSource, scout: data_scout.scout.Scout, use_sample=True, column_types=True,
-                             sampling_technique: str = 'top'):
+def _data_source_to_pipeline(data_source: DataSource, scout: "data_scout.scout.Scout", use_sample=True,
+                             column_types=True, sampling_technique: str = 'top', snapshot: bool = False):
     """
     Convert a data source to a pipeline element.
 
@@ -202,6 +277,7 @@ def _data_source_to_pipeline(data_source: DataSource, scout: data_scout.scout.Sc
     :param use_sample: If True sample the dataset, if False use all data.
     :param column_types: If True return the column types as well (more overhead), if False then don't include them
     :param sampling_technique: The sampling technique to use
+    :param snapshot: If True, samples are read from a snapshot (see snapshots.install)
     :return:
     """
     # data_source = get_object_or_404(DataSource, pk=data_source)
@@ -209,9 +285,6 @@ def _data_source_to_pipeline(data_source: DataSource, scout: data_scout.scout.Sc
         "use_sample": use_sample,
         "sampling_technique": sampling_technique,
         "column_types": column_types,
-        "data_source": _data_source_to_dict(data_source, scout),
+        "data_source": _data_source_to_dict(data_source, scout, snapshot, not use_sample),
         "pipeline": []
     }
-
-
-
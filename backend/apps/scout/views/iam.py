@@ -3,8 +3,9 @@ from django.contrib.auth.models import User
 from rest_framework import viewsets, views, response, status, generics, permissions
 from rest_framework.response import Response
 
+from ..pagination import ProjectCursorPagination
 from ..views.permissions import ProjectPermission, UserProfilePermission
-from ..serializers import UserProjectSerializer, UserProfileSerializer, UserProjectCreateSerializer, \
+from ..serializers import SparseFieldsMixin, UserProjectSerializer, UserProfileSerializer, UserProjectCreateSerializer, \
     UserProfileUpdateSerializer, ProjectFullSerializer, UserSerializer, ChangePasswordSerializer, UserDetailSerializer, \
     CreateUserSerializer
 from ..models import UserProject, UserProfile, Project
@@ -13,8 +14,16 @@ from ..models import UserProject, UserProfile, Project
 class ProjectModelView(viewsets.ModelViewSet):
     """
     Base viewset for project related resources. This should be extended by those viewsets.
+
+    When reading, the "fields" get parameter (a comma separated list of field names) limits the fields that are
+    returned and "summary=1" returns the compact representation of a resource (if it has one).
+
+    Lists are paginated using a cursor (see ProjectCursorPagination).
     """
     permission_classes = [permissions.IsAuthenticated, ProjectPermission]
+    pagination_class = ProjectCursorPagination
+    # The serializer of the compact representation, None if the resource doesn't have one
+    summary_serializer_class = None
 
     def list(self, request, *args, **kwargs):
         """
@@ -26,18 +35,73 @@ class ProjectModelView(viewsets.ModelViewSet):
         :return:
         """
         queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        objects = list(queryset) if page is None else page
 
-        for obj in queryset:
+        for obj in objects:
             self.check_object_permissions(request, obj)
 
-        page = self.paginate_queryset(queryset)
+        self.prepare_objects(objects)
+        serializer = self.get_serializer(objects, many=True)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve an object.
 
-        serializer = self.get_serializer(queryset, many=True)
+        :param request:
+        :param args:
+        :param kwargs:
+        :return:
+        """
+        instance = self.get_object()
+        self.prepare_objects([instance])
+        serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+    def prepare_objects(self, objects: list):
+        """
+        Prepare objects before they're serialized, e.g. by attaching related objects that were fetched in bulk. This
+        does nothing by default.
+
+        :param objects: The objects that will be serialized
+        :return:
+        """
+        pass
+
+    def is_summary(self) -> bool:
+        """
+        Check if the compact representation of the resource was requested.
+
+        :return:
+        """
+        return self.summary_serializer_class is not None and self.request.method in permissions.SAFE_METHODS and \
+            self.request.query_params.get("summary", "0") == "1"
+
+    def get_sparse_fields(self):
+        """
+        Get the fields that were requested using the "fields" get parameter.
+
+        :return: A list of field names or None if all fields should be returned
+        """
+        fields = self.request.query_params.get("fields")
+        if fields is None or self.request.method not in permissions.SAFE_METHODS:
+            return None
+        return [name.strip() for name in fields.split(",") if len(name.strip()) > 0]
+
+    def get_serializer_class(self):
+        if self.is_summary():
+            return self.summary_serializer_class
+        return super(ProjectModelView, self).get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_sparse_fields()
+        if fields is not None and issubclass(self.get_serializer_class(), SparseFieldsMixin):
+            kwargs["fields"] = fields
+        return super(ProjectModelView, self).get_serializer(*args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         """
         Create a project.
@@ -68,7 +132,7 @@ class ProjectModelView(viewsets.ModelViewSet):
 
         :return:
         """
-        queryset = self.queryset.filter(project=self.request.user.profile.project.project)
+        queryset = self.queryset.filter(project=self.request.user.profile.project.project_id)
         return queryset
 
 
@@ -134,7 +198,7 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     This view allows user profiles to be viewed and edited.
     """
     permission_classes = [permissions.IsAuthenticated, UserProfilePermission]
-    queryset = UserProfile.objects.all()
+    queryset = UserProfile.objects.select_related("project__project")
     serializer_class = UserProfileSerializer
 
     def update(self, request, *args, **kwargs):
@@ -167,7 +231,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
     """
     permission_classes = [permissions.IsAuthenticated, ProjectPermission]
 
-    queryset = Project.objects.all()
+    queryset = Project.objects.prefetch_related("users__user")
     serializer_class = ProjectFullSerializer
 
 
@@ -175,7 +239,7 @@ class UserProjectViewSet(ProjectModelView):
     """
     This view allows user projects to be viewed and edited.
     """
-    queryset = UserProject.objects.all()
+    queryset = UserProject.objects.select_related("project")
     serializer_class = UserProjectSerializer
 
     def get_queryset(self):
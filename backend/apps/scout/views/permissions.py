@@ -1,6 +1,39 @@
+from typing import Dict
+
 from rest_framework import permissions
 from django.core.exceptions import FieldDoesNotExist
 
+from ..models import UserProject
+
+EDIT_ROLES = ('owner', 'admin', 'editor')
+
+
+def project_roles(request) -> Dict[int, str]:
+    """
+    Get the roles of the current user in its projects. These are loaded once per request, so checking the permissions
+    of a list of objects doesn't need a query per object.
+
+    :param request: The request
+    :return: A dict of project id -> role
+    """
+    roles = getattr(request, "_project_roles", None)
+    if roles is None:
+        roles = dict(UserProject.objects.filter(user=request.user).values_list("project_id", "role"))
+        request._project_roles = roles
+    return roles
+
+
+def has_project_permission(request, project_id: int) -> bool:
+    """
+    Check if the current user is allowed to perform the request in the given project. Viewers can only read objects.
+
+    :param request: The request
+    :param project_id: The id of the project the object belongs to
+    :return: True if the user is allowed to perform the request
+    """
+    role = project_roles(request).get(project_id)
+    return role is not None and (request.method in permissions.SAFE_METHODS or role in EDIT_ROLES)
+
 
 class ProjectPermission(permissions.BasePermission):
     """
@@ -10,19 +43,12 @@ class ProjectPermission(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         try:
             obj._meta.get_field("project")
-            users = obj.project.users.all()
+            project_id = obj.project_id
         except FieldDoesNotExist:
             # The "Project" object itself doesn't have a project field
-            users = obj.users.all()
-        user_permissions = [up
-                            for up in users
-                            if up.user == request.user and (request.method in permissions.SAFE_METHODS or
-                                                            up.role in ('owner', 'admin', 'editor'))]
+            project_id = obj.pk
 
-        if len(user_permissions) == 0 and not request.user.is_staff:
-            return False
-        else:
-            return True
+        return has_project_permission(request, project_id) or request.user.is_staff
 
 
 class UserProfilePermission(permissions.BasePermission):
@@ -43,10 +69,4 @@ class TransformationPermission(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
-        users = obj.recipe.project.users.all()
-        user_permissions = [up
-                            for up in users
-                            if up.user == request.user and (request.method in permissions.SAFE_METHODS or
-                                                            up.role in ('owner', 'admin', 'editor'))]
-
-        return len(user_permissions) != 0
+        return has_project_permission(request, obj.recipe.project_id)
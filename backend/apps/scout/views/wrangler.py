@@ -1,23 +1,32 @@
+import hashlib
 import json
 import logging
-from django.http import JsonResponse, HttpResponse
+from typing import List, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_vary_headers
 
 from rest_framework import viewsets, views, response, status
 from rest_framework import permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-import data_scout
-import math
-import numpy as np
-
 from .datasources import _data_source_to_pipeline, _data_source_to_dict
+from .. import downloads, fingerprints, previews
 from .iam import ProjectModelView
 from .permissions import TransformationPermission
-from ..serializers import RecipeSerializer, TransformationSerializer, TransformationSerializerUpdate, RecipeFolderSerializer
-from ..models import Recipe, Transformation, RecipeFolder
-from django.core.exceptions import ObjectDoesNotExist
+from ..serializers import RecipeSerializer, TransformationSerializer, RecipeFolderSerializer, RecipeRunSerializer, \
+    RecipeSummarySerializer
+from ..models import Recipe, Transformation, RecipeFolder, RecipeRun
 
+from ..cache import is_cacheable
+from ..registry import registry, metadata_response
+from ..trees import attach_folder_tree
 from ..variable_logger import VariableLogger
 
 
@@ -31,13 +40,7 @@ class TransformationTypesView(views.APIView):
         """
         Get all transformation types.
         """
-        scout = data_scout.scout.Scout()
-        transformation_types = list(scout.transformations.values())
-        serialized = []
-        for transformation_type in transformation_types:
-            serialized.append({"name": transformation_type.__name__, "fields": transformation_type.fields})
-
-        return response.Response(serialized)
+        return metadata_response(request, "transformation_types")
 
 
 class RecipeViewSet(ProjectModelView):
@@ -47,6 +50,7 @@ class RecipeViewSet(ProjectModelView):
     """
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
+    summary_serializer_class = RecipeSummarySerializer
 
     def get_queryset(self):
         """
@@ -54,11 +58,98 @@ class RecipeViewSet(ProjectModelView):
         a parent folder are returned.
         """
         orphans_only = self.request.query_params.get("orphans_only", 0) == 1
-        queryset = self.queryset.filter(project=self.request.user.profile.project.project)
+        queryset = self.queryset.filter(project=self.request.user.profile.project.project_id)
         if orphans_only:
             queryset = queryset.filter(parent=None)
+        if self.is_summary():
+            runs = RecipeRun.objects.filter(recipe=OuterRef("pk")).order_by("-created", "-id")
+            queryset = queryset.annotate(step_count=Count("transformations"),
+                                         last_run_id=Subquery(runs.values("id")[:1]),
+                                         last_run_status=Subquery(runs.values("status")[:1]),
+                                         last_run_finished=Subquery(runs.values("finished")[:1]))
+        elif self.action in ("list", "retrieve") and "transformations" in (self.get_sparse_fields() or
+                                                                             ["transformations"]):
+            queryset = queryset.prefetch_related("transformations")
         return queryset
 
+    @action(detail=True)
+    def fingerprint(self, request, pk=None):
+        """
+        Get the content fingerprint of a recipe. The fingerprint changes whenever the result of the recipe might change.
+        """
+        return Response({"fingerprint": _recipe_fingerprint(self.get_object(), registry.scout())})
+
+    @action(detail=True, methods=["post"], url_path="transformations")
+    def edit_transformations(self, request, pk=None):
+        """
+        Apply a list of operations to the transformations of a recipe, in a single transaction. Either all operations
+        are applied, or (if one of them fails) none of them. The body should contain a list of "operations":
+        - {"op": "create", "transformation": ..., "kwargs": ..., "previous": ..., "ref": ...}
+        - {"op": "update", "id": ..., "transformation": ..., "kwargs": ..., "previous": ...}
+        - {"op": "move", "id": ..., "previous": ...}
+        - {"op": "delete", "id": ...}
+        "previous" works the same as for a single transformation (leave it out to keep the position, or to append a
+        created transformation). A created transformation can be given a "ref", which can be used as "previous" or "id"
+        by later operations. The response contains the transformations, the pipeline and the fingerprint of the recipe.
+        """
+        recipe = self.get_object()
+        operations = request.data.get("operations") if isinstance(request.data, dict) else None
+        if not isinstance(operations, list):
+            raise ValidationError({"operations": "A list of operations is required."})
+        for i, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                raise ValidationError({"operation": i, "errors": {"non_field_errors": "This should be an object."}})
+            for key in ("id", "ref", "previous"):
+                # These are looked up, so they have to be ids or refs
+                if operation.get(key) is not None and not isinstance(operation[key], (int, str)):
+                    raise ValidationError({"operation": i, "errors": {key: "This should be a string or an integer."}})
+
+        refs = {}
+
+        def resolve(value):
+            return refs.get(value, value) if isinstance(value, str) else value
+
+        with transaction.atomic():
+            Transformation.lock_recipe(recipe.pk)
+            transformations = {transformation.pk: transformation for transformation in recipe.transformations.all()}
+            for i, operation in enumerate(operations):
+                op = operation.get("op")
+                data = {key: value for key, value in operation.items() if key not in ("op", "id", "ref")}
+                if "previous" in data:
+                    data["previous"] = resolve(data["previous"])
+                if op == "create":
+                    serializer = TransformationSerializer(data={**data, "recipe": recipe.pk})
+                else:
+                    instance = transformations.get(resolve(operation.get("id")))
+                    if instance is None:
+                        raise ValidationError({"operation": i, "errors": {"id": "Unknown transformation."}})
+                    if op == "delete":
+                        instance.delete()
+                        del transformations[resolve(operation.get("id"))]
+                        continue
+                    elif op == "move" and "previous" not in data:
+                        raise ValidationError({"operation": i, "errors": {"previous": "This field is required."}})
+                    elif op not in ("update", "move"):
+                        raise ValidationError({"operation": i, "errors": {"op": f"Unknown operation {op}."}})
+                    serializer = TransformationSerializer(instance, data={**data, "recipe": recipe.pk}, partial=True)
+                if not serializer.is_valid():
+                    raise ValidationError({"operation": i, "errors": serializer.errors})
+                transformation = serializer.save()
+                transformations[transformation.pk] = transformation
+                if op == "create" and "ref" in operation:
+                    refs[operation["ref"]] = transformation.pk
+
+        try:
+            fingerprint = _recipe_fingerprint(recipe, registry.scout())
+        except ValueError:
+            # The recipe doesn't have an input yet
+            fingerprint = None
+        return Response({
+            "transformations": TransformationSerializer(recipe.transformations.all(), many=True).data,
+            "pipeline": _get_pipeline(recipe),
+            "fingerprint": fingerprint,
+        })
+
 
 class RecipeFolderViewSet(ProjectModelView):
     """
@@ -75,46 +166,58 @@ class RecipeFolderViewSet(ProjectModelView):
         a parent folder are returned.
         """
         orphans_only = int(self.request.query_params.get("orphans_only", 0)) == 1
-        queryset = self.queryset.filter(project=self.request.user.profile.project.project)
+        queryset = self.queryset.filter(project=self.request.user.profile.project.project_id)
         if orphans_only:
             queryset = queryset.filter(parent=None)
         return queryset
 
+    def prepare_objects(self, objects: list):
+        """
+        Fetch the folders and recipes of the project at once and assemble the folder tree in memory.
+        """
+        projects = {obj.project_id for obj in objects}
+        recipes = Recipe.objects.filter(project__in=projects, parent__isnull=False).prefetch_related("transformations")
+        attach_folder_tree(objects, list(RecipeFolder.objects.filter(project__in=projects)), {
+            "children": (Recipe, list(recipes)),
+        })
+
 
 class TransformationViewSet(viewsets.ModelViewSet):
     """
-    API endpoint that allows transformations to be viewed or edited.
+    API endpoint that allows transformations to be viewed or edited. Transformations are ordered by their order key, so
+    deleting one doesn't require updating the others.
     """
     permission_classes = [permissions.IsAuthenticated, TransformationPermission]
-    queryset = Transformation.objects.all()
+    queryset = Transformation.objects.select_related("recipe")
     serializer_class = TransformationSerializer
 
-    def destroy(self, request, *args, **kwargs):
-        """
-        Delete a transformation. If this transformation is followed by another, it will take care of that before deletion.
-        """
-        transformation = self.get_object()
-        try:
-            transformation_next = transformation.next.get()
-            transformation_next.previous = transformation.previous
-            transformation_next.save()
-        except ObjectDoesNotExist as e:
-            pass
-        transformation.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
-
-    def get_serializer_class(self):
-        """
-        Get the serializer class. In order to update we need a different serializer that doesn't use the next related
-        name.
-        """
 
-        serializer_class = self.serializer_class
+class RecipeRunViewSet(ProjectModelView):
+    """
+    API endpoint that allows recipes to be run on all data. Creating a run puts it in the queue, a worker (started with
+    "manage.py run_worker") executes it. Poll a run to follow its status and progress.
+    """
+    queryset = RecipeRun.objects.all()
+    serializer_class = RecipeRunSerializer
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
 
-        if self.request.method == 'PUT':
-            serializer_class = TransformationSerializerUpdate
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user, project=serializer.validated_data["recipe"].project)
 
-        return serializer_class
+    def retrieve(self, request, pk=None, **kwargs):
+        """
+        Retrieve the run. If the "output" get parameter is set to file, the result is returned as a CSV file. If it's
+        set to JSON (which is the default), it will return the run object as JSON.
+        """
+        run = self.get_object()
+        if request.query_params.get("output", "json") == "file":
+            if run.result_file is None:
+                return Response({"detail": "This run doesn't have a result (yet)."}, status=status.HTTP_404_NOT_FOUND)
+            return downloads.file_response(request, run.result_file, f"{run.recipe.name}-{run.pk}.csv",
+                                           content_type="text/csv")
+        else:
+            serializer = self.get_serializer(run)
+            return Response(serializer.data)
 
 
 def _get_pipeline(recipe: Recipe):
@@ -124,65 +227,115 @@ def _get_pipeline(recipe: Recipe):
     :param recipe: The flow to transform to a JSON file
     :return:
     """
-    try:
-        transformation = recipe.transformations.filter(previous__isnull=True).get()
-    except ObjectDoesNotExist as e:
-        transformation = None
+    return [{"transformation": transformation, "kwargs": json.loads(kwargs)}
+            for transformation, kwargs in recipe.transformations.values_list("transformation", "kwargs")]
 
-    pipeline = []
-    while transformation is not None:
-        # Execute the transformation on the data set
-        try:
-            pipeline.append({"transformation": transformation.transformation,
-                             "kwargs": json.loads(transformation.kwargs)})
-            transformation = transformation.next.get()
-        except ObjectDoesNotExist:
-            # When there's no next transformation we're done
-            break
-    return pipeline
 
+def _recipe_cache_tags(recipe: Recipe, _resolved: dict = None) -> Tuple[List[str], List[str]]:
+    """
+    Get the tags of all objects the results of a recipe depend on. These are used to invalidate cached results.
 
-class CleanJSON:
+    :param recipe: The recipe
+    :param _resolved: The tags of the recipes visited so far (recipe id -> tags), every upstream recipe is visited once
+    :return: A list of tags for the input of the recipe and a list with one tag per transformation step (in order)
     """
-    This transformation cleans to object to present valid JSON. It's NOT meant to be used by the user. This is only for
-    internal usage.
+    _resolved = {} if _resolved is None else _resolved
+    if recipe.pk in _resolved:
+        return _resolved[recipe.pk]
+    # Mark the recipe as visited before following its inputs, so a cycle ends here
+    _resolved[recipe.pk] = ([], [])
+    source_tags = []
+    if recipe.input_id is not None:
+        source_tags.append(f"data_source:{recipe.input_id}")
+    elif recipe.input_join is not None:
+        join = recipe.input_join
+        source_tags.append(f"join:{join.id}")
+        for data_source_id, upstream_recipe in ((join.data_source_left_id, join.recipe_left),
+                                                (join.data_source_right_id, join.recipe_right)):
+            if data_source_id is not None:
+                source_tags.append(f"data_source:{data_source_id}")
+            elif upstream_recipe is not None:
+                upstream_source_tags, upstream_step_tags = _recipe_cache_tags(upstream_recipe, _resolved)
+                source_tags += upstream_source_tags + upstream_step_tags
+        source_tags = list(dict.fromkeys(source_tags))
+
+    step_tags = [f"transformation:{transformation_id}"
+                 for transformation_id in recipe.transformations.values_list("id", flat=True)]
+    _resolved[recipe.pk] = (source_tags, step_tags)
+    return source_tags, step_tags
+
+
+def _clean_json(df_records: "pandas.DataFrame") -> "pandas.DataFrame":
     """
-    def __call__(self, row, index: int):
-        for key, value in row.items():
-            if value is math.nan or (isinstance(value, float) and np.isnan(value)):
-                row[key] = "NaN"
-
-        return row, index
+    Replace all NaN values by the string "NaN", so the data can be presented as valid JSON. This works column-wise,
+    instead of checking every value of every record.
 
-
-def _recipe_to_pipeline(recipe: Recipe, scout: data_scout.scout.Scout, use_sample=True, column_types=True):
+    :param df_records: The data frame to clean
+    :return: A cleaned copy of the data frame (or the data frame itself if there was nothing to clean)
+    """
+    import pandas as pd
+
+    cleaned = {}
+    for i, (_, column) in enumerate(df_records.items()):
+        if pd.api.types.is_float_dtype(column.dtype) or pd.api.types.is_string_dtype(column.dtype):
+            # For object columns this also matches None, which should stay None. NaN is the only value not equal to
+            # itself, so we use that instead.
+            values = column.to_numpy(dtype=object)
+            mask = values != values if column.dtype == object else column.isna().to_numpy()
+            if mask.any():
+                cleaned[i] = column.astype(object).where(~mask, "NaN")
+    if len(cleaned) == 0:
+        return df_records
+    # Columns are replaced by position, because names don't have to be unique. The columns are passed as series, so
+    # they keep their types (recent pandas versions would turn object arrays containing None into string columns).
+    # They all share the index of the data frame, so nothing is realigned.
+    result = pd.DataFrame({i: cleaned.get(i, column) for i, (_, column) in enumerate(df_records.items())})
+    result.columns = df_records.columns
+    return result
+
+
+def _recipe_to_pipeline(recipe: Recipe, scout: "data_scout.scout.Scout", use_sample=True, column_types=True,
+                        snapshot: bool = False, _resolved: dict = None, _resolving: set = None):
     """
-    Convert a Recipe object to a complete pipeline definition, including the data source.
+    Convert a Recipe object to a complete pipeline definition, including the data source. Recipes used by joins are
+    converted once, a recipe that's used multiple times (e.g. on both sides of a join) shares its definition.
 
     :param recipe: The recipe to convert
     :param scout: An initialized data scout Scout object
     :param use_sample: If True sample the dataset, if False use all data.
     :param column_types: If True return the column types as well (more overhead), if False then don't include them
+    :param snapshot: If True, samples are read from snapshots (see snapshots.install)
+    :param _resolved: The definitions of the recipes converted so far (recipe id -> definition)
+    :param _resolving: The ids of the recipes that are being converted, used to detect cycles
     :return:
     """
+    _resolved = {} if _resolved is None else _resolved
+    _resolving = set() if _resolving is None else _resolving
+    if recipe.pk in _resolved:
+        return _resolved[recipe.pk]
+    if recipe.pk in _resolving:
+        raise ValueError(f"Recipe {recipe.name} (indirectly) uses itself as input")
+    _resolving.add(recipe.pk)
 
     if recipe.input is not None:
-        data_source = _data_source_to_dict(recipe.input, scout)
+        data_source = _data_source_to_dict(recipe.input, scout, snapshot, not use_sample)
     elif recipe.input_join is not None:
         # If the input to this flow is a join, we need to construct it.
         if recipe.input_join.data_source_left is not None:
             data_source_left = _data_source_to_pipeline(recipe.input_join.data_source_left, scout, use_sample,
-                                                        column_types)
+                                                        column_types, snapshot=snapshot)
         elif recipe.input_join.recipe_left is not None:
-            data_source_left = _recipe_to_pipeline(recipe.input_join.recipe_left, scout, use_sample, column_types)
+            data_source_left = _recipe_to_pipeline(recipe.input_join.recipe_left, scout, use_sample, column_types,
+                                                   snapshot, _resolved, _resolving)
         else:
             raise ValueError("You need a data source OR a pipeline on the left")
 
         if recipe.input_join.data_source_right is not None:
             data_source_right = _data_source_to_pipeline(recipe.input_join.data_source_right, scout, use_sample,
-                                                         column_types)
+                                                         column_types, snapshot=snapshot)
         elif recipe.input_join.recipe_right is not None:
-            data_source_right = _recipe_to_pipeline(recipe.input_join.recipe_right, scout, use_sample, column_types)
+            data_source_right = _recipe_to_pipeline(recipe.input_join.recipe_right, scout, use_sample, column_types,
+                                                    snapshot, _resolved, _resolving)
         else:
             raise ValueError("You need a data source OR a pipeline on the right")
 
@@ -206,12 +359,139 @@ def _recipe_to_pipeline(recipe: Recipe, scout: data_scout.scout.Scout, use_sampl
         "data_source": data_source,
         "pipeline": _get_pipeline(recipe)
     }
+    _resolving.discard(recipe.pk)
+    _resolved[recipe.pk] = definition
     return definition
 
 
+def _recipe_fingerprint(recipe: Recipe, scout: "data_scout.scout.Scout") -> str:
+    """
+    Calculate the content fingerprint of a recipe: a hash of its complete definition (including joins and nested
+    recipes) and the checksums of the uploaded files it reads.
+
+    :param recipe: The recipe
+    :param scout: An initialized data scout Scout object
+    :return: The hexadecimal fingerprint
+    """
+    return fingerprints.definition_fingerprint(_recipe_to_pipeline(recipe, scout))
+
+
+# The number of rows serialized at once when streaming data as NDJSON
+NDJSON_CHUNK_SIZE = 1000
+
+
+def _ndjson_frames(header: dict, df_records):
+    """
+    Generate the NDJSON representation of a preview. The first line is a header containing everything except the
+    records, every following line contains one record (as a list of values).
+
+    :param header: The header object
+    :param df_records: The data frame containing the records
+    :return: A generator of chunks of lines
+    """
+    yield json.dumps(header, cls=DjangoJSONEncoder) + "\n"
+    for start in range(0, len(df_records), NDJSON_CHUNK_SIZE):
+        chunk = _clean_json(df_records.iloc[start:start + NDJSON_CHUNK_SIZE]).to_dict(orient="split")["data"]
+        yield "".join(json.dumps(record, cls=DjangoJSONEncoder) + "\n" for record in chunk)
+
+
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+# The number of rows per record batch when streaming data as Arrow IPC
+ARROW_BATCH_SIZE = 64 * 1024
+
+
+class _ChunkSink:
+    """
+    File-like object that collects everything written to it, so the written chunks can be yielded by a generator.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_table(df_records):
+    """
+    Convert a data frame to an Arrow table. Object columns that Arrow can't type (e.g. with mixed types) are converted
+    to strings, all other columns keep their data type.
+
+    :param df_records: The data frame
+    :return: The Arrow table (with string column names)
+    """
+    import pyarrow as pa
+
+    arrays = []
+    for _, column in df_records.items():
+        try:
+            arrays.append(pa.Array.from_pandas(column))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            arrays.append(pa.Array.from_pandas(column.map(lambda value: None if value is None else str(value))))
+    return pa.Table.from_arrays(arrays, names=[str(name) for name in df_records.columns])
+
+
+def _arrow_frames(metadata: dict, df_records):
+    """
+    Generate the Arrow IPC stream of a preview. Everything except the records (messages, column types, etc.) is stored
+    as JSON in the schema metadata, the records are sent as record batches.
+
+    :param metadata: The metadata object
+    :param df_records: The data frame containing the records, None for an empty stream
+    :return: A generator of chunks of the stream
+    """
+    import pyarrow as pa
+
+    table = pa.table({}) if df_records is None else _arrow_table(df_records)
+    table = table.replace_schema_metadata({key: json.dumps(value, cls=DjangoJSONEncoder)
+                                           for key, value in metadata.items()})
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        yield sink.pop()
+        for batch in table.to_batches(max_chunksize=ARROW_BATCH_SIZE):
+            writer.write_batch(batch)
+            yield sink.pop()
+    yield sink.pop()
+
+
+def _variant_etag(fingerprint: str, variant: dict) -> str:
+    """
+    Get the ETag of one representation of a result: the same recipe returns different content depending on e.g. the
+    format or the window that was requested, so those are part of the tag.
+
+    :param fingerprint: The fingerprint of the recipe
+    :param variant: Everything that determines the representation of the result
+    :return: The (quoted) ETag
+    """
+    variant_hash = hashlib.sha256(json.dumps(variant, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return f'"{fingerprint}-{variant_hash}"'
+
+
 def data(request, recipe: int):
     """
-    Load the data and execute a pipeline.
+    Load the data and execute a pipeline. A DELETE request cancels the preview of this recipe that's still running.
+    Use ?format=ndjson to stream the result as newline delimited JSON: a header line containing the messages and column
+    types, followed by one line per record. Use ?orient=columns to receive the data column-wise ({"columns": {name:
+    [values]}}) instead of as a list of records. Use ?offset=, ?limit= and ?columns= (comma separated) to only receive
+    part of the result, the total number of rows is returned as well. Use ?format=arrow (or an Accept header of
+    application/vnd.apache.arrow.stream) to stream the result as Arrow IPC, keeping the data types of all columns. The
+    messages, column types, etc. are stored in the schema metadata.
+    Successful responses have an ETag made of the fingerprint of the recipe and the requested format, orient and
+    window. If it matches the If-None-Match header nothing is executed and 304 Not Modified is returned. Data read
+    from a database instead of uploaded files doesn't get an ETag.
 
     :param request:
     :param recipe: The id of the recipe
@@ -222,56 +502,134 @@ def data(request, recipe: int):
     logger.addHandler(variable_logger.log_handler)
     logger.setLevel(logging.INFO)
 
-    success = True
-    records_export, columns = [], []
+    recipe = get_object_or_404(Recipe, pk=recipe)
+    pool = previews.get_pool()
+    if request.method == "DELETE":
+        if pool is not None:
+            pool.cancel(recipe.pk)
+        return HttpResponse(status=status.HTTP_204_NO_CONTENT)
+
+    ndjson = request.GET.get("format") == "ndjson"
+    arrow = request.GET.get("format") == "arrow" or ARROW_CONTENT_TYPE in request.META.get("HTTP_ACCEPT", "")
+    scout = registry.scout(logger)
+    definition = _recipe_to_pipeline(recipe, scout, use_sample=True, column_types=True, snapshot=True)
+    # The fingerprint can't tell when the data in a database (e.g. SQL or BigQuery) changed, so those results don't
+    # get an ETag
+    etag = None
+    if is_cacheable(definition["data_source"]):
+        etag = _variant_etag(fingerprints.definition_fingerprint(definition), {
+            "format": "arrow" if arrow else "ndjson" if ndjson else "json",
+            "orient": request.GET.get("orient"),
+            "offset": request.GET.get("offset"),
+            "limit": request.GET.get("limit"),
+            "columns": request.GET.get("columns"),
+        })
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            logger.removeHandler(variable_logger.log_handler)
+            # The format can be chosen with the Accept header
+            patch_vary_headers(not_modified, ["Accept"])
+            return not_modified
+    # Steps that were executed before (e.g. everything before the transformation that was just edited) are taken
+    # from the cache
+    source_tags, step_tags = _recipe_cache_tags(recipe)
     try:
-        scout = data_scout.scout.Scout(logger=logger)
-        recipe = get_object_or_404(Recipe, pk=recipe)
-        definition = _recipe_to_pipeline(recipe, scout, use_sample=True, column_types=True)
-        records, columns = scout.execute_json(definition, data_scout.executor.PandasExecutor)
-
-        # After running the script, we store the new data schema
-        recipe.schema = json.dumps(columns[-1])
-        recipe.save()
-
-        records_export = []
-        clean_func = CleanJSON()
-        for i, record in enumerate(records):
-            records_export.append(list(clean_func(record, i)[0].values()))
+        window = {
+            "offset": max(int(request.GET.get("offset", 0)), 0),
+            "limit": max(int(request.GET["limit"]), 0) if "limit" in request.GET else None,
+            "columns": request.GET["columns"].split(",") if "columns" in request.GET else None,
+        }
+    except ValueError:
+        return JsonResponse({"success": False, "messages": [
+            {"code": logging.ERROR, "type": "error", "message": "The offset and limit should be integers"}
+        ]}, status=status.HTTP_400_BAD_REQUEST)
+    task = {"definition": definition, "source_tags": source_tags, "step_tags": step_tags, "window": window}
+    try:
+        result = previews.execute_preview(task) if pool is None else pool.run(recipe.pk, task)
+    except previews.PreviewException as e:
+        logger.error(str(e))
+        result = {"success": False, "messages": variable_logger.contents()}
+    finally:
+        logger.removeHandler(variable_logger.log_handler)
+
+    if not result["success"]:
+        if arrow:
+            return StreamingHttpResponse(_arrow_frames({"success": False, "messages": result["messages"]}, None),
+                                         content_type=ARROW_CONTENT_TYPE)
+        if ndjson:
+            return StreamingHttpResponse(_ndjson_frames({"success": False, "messages": result["messages"]}, []),
+                                         content_type="application/x-ndjson")
+        return JsonResponse({"success": False, "messages": result["messages"]})
+
+    # After running the script, we store the new data schema (only if it changed, previews are requested all the time)
+    columns = result["columns"]
+    schema = json.dumps(columns[-1])
+    if recipe.schema != schema:
+        Recipe.objects.filter(pk=recipe.pk).update(schema=schema)
+
+    if arrow:
+        metadata = {"success": True, "messages": result["messages"], "column_types": columns,
+                    "total_rows": result["total_rows"], "offset": window["offset"]}
+        res = StreamingHttpResponse(_arrow_frames(metadata, result["data"]), content_type=ARROW_CONTENT_TYPE)
+        if etag is not None:
+            res["ETag"] = etag
+        patch_vary_headers(res, ["Accept"])
+        return res
 
-    except data_scout.exceptions.PipelineException as e:
-        success = False
-        logger.error(f"Transformation: {e.transformation}: {type(e.original_exception).__name__} {e.original_exception}")
+    if ndjson:
+        header = {"success": True, "messages": result["messages"], "column_types": columns,
+                  "column_names": [str(name) for name in result["data"].columns], "total_rows": result["total_rows"],
+                  "offset": window["offset"]}
+        res = StreamingHttpResponse(_ndjson_frames(header, result["data"]), content_type="application/x-ndjson")
+        if etag is not None:
+            res["ETag"] = etag
+        patch_vary_headers(res, ["Accept"])
+        return res
 
-    if not success:
-        return JsonResponse({"success": False, "messages": variable_logger.contents()})
+    df_records = _clean_json(result["data"])
+    if request.GET.get("orient") == "columns":
+        data_export = {"columns": {name: column.tolist() for name, column in df_records.items()}}
+    else:
+        data_export = {"records": df_records.to_dict(orient="split")["data"]}
 
-    return JsonResponse({"success": True, "messages": variable_logger.contents(), "data": {
-        'records': records_export,
+    res = JsonResponse({"success": True, "messages": result["messages"], "data": {
+        **data_export,
         "column_types": columns,
-        "column_names": list(columns[-1].keys())
+        "column_names": [str(name) for name in df_records.columns],
+        "total_rows": result["total_rows"],
+        "offset": window["offset"],
     }})
+    if etag is not None:
+        res["ETag"] = etag
+    patch_vary_headers(res, ["Accept"])
+    return res
 
 
 def pipeline(request, recipe: int):
     """
     Export a complete pipeline as either Python code or as a JSON definition, depending on the "output" get parameter.
+    The fingerprint of the recipe and the output are used as ETag (see data).
 
     :param request:
     :param recipe:
     :return:
     """
-    scout = data_scout.scout.Scout()
+    scout = registry.scout()
     recipe = get_object_or_404(Recipe, pk=recipe)
     definition = _recipe_to_pipeline(recipe, scout)
+    etag = _variant_etag(fingerprints.definition_fingerprint(definition), {"output": request.GET.get("output")})
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
     if request.GET.get("output") == "python":
-        scout = data_scout.scout.Scout()
+        import data_scout
         code, _ = scout.execute_json(definition, data_scout.executor.CodeExecutor)
         res = HttpResponse(code, content_type='text/x-python')
         res['Content-Disposition'] = 'attachment; filename="pipeline.py"'
-        return res
     else:
-        return JsonResponse(definition)
+        res = JsonResponse(definition)
+    res["ETag"] = etag
+    return res
 
 
 def meta_transformations(request):
@@ -281,8 +639,4 @@ def meta_transformations(request):
     :param request:
     :return:
     """
-    scout = data_scout.scout.Scout()
-    return JsonResponse({
-        key: {"title": transformation.title, "key": transformation.key, "fields": transformation.fields}
-        for key, transformation in scout.transformations.items()}
-    )
+    return metadata_response(request, "transformations")
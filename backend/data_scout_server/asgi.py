@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'data_scout_server.settings')
 
 application = get_asgi_application()
+
+# Start the preview workers now, instead of when the first preview is requested
+from apps.scout import previews  # noqa: E402
+previews.warm_up()
@@ -74,12 +74,37 @@ WSGI_APPLICATION = 'data_scout_server.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': 'data_scout',
+# SQLite is fine for development. In production, use PostgreSQL by setting the SCOUT_DB_* environment variables (or by
+# editing the settings below). Connections are kept open for CONN_MAX_AGE seconds, instead of opening a new one for
+# every request.
+
+if os.environ.get('SCOUT_DB_ENGINE', 'sqlite') == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('SCOUT_DB_NAME', 'data_scout'),
+            'USER': os.environ.get('SCOUT_DB_USER', 'data_scout'),
+            'PASSWORD': os.environ.get('SCOUT_DB_PASSWORD', ''),
+            'HOST': os.environ.get('SCOUT_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('SCOUT_DB_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('SCOUT_DB_CONN_MAX_AGE', 600)),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': 'data_scout',
+            'CONN_MAX_AGE': int(os.environ.get('SCOUT_DB_CONN_MAX_AGE', 600)),
+            'OPTIONS': {
+                # The number of seconds to wait for a lock held by another connection
+                'timeout': 20,
+            },
+        }
     }
-}
+
+# Run SQLite in write-ahead logging mode, so reads and writes don't block each other
+SCOUT_SQLITE_WAL = True
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -132,3 +157,46 @@ REST_FRAMEWORK = {
 
 MEDIA_ROOT = os.path.join(BASE_DIR, "uploads")
 MEDIA_URL = '/media/'
+
+# The maximum size (in bytes) of the in-memory cache of intermediate recipe results. This cache is kept per process.
+SCOUT_RESULT_CACHE_SIZE = 256 * 1024 * 1024
+
+# The default number of processes started by "manage.py run_worker", which executes recipe runs on all data
+SCOUT_WORKER_PROCESSES = 2
+# Runs that take longer than this (in seconds) are marked as failed by the workers, None to disable
+SCOUT_RUN_TIMEOUT = 24 * 60 * 60
+
+# Previews are executed in a pool of worker processes (per web server process). Set the number of processes to 0 to
+# execute previews in the web server process itself. The timeout is in seconds, the memory limit in bytes.
+SCOUT_PREVIEW_PROCESSES = 2
+SCOUT_PREVIEW_TIMEOUT = 60
+SCOUT_PREVIEW_MEMORY_LIMIT = 4 * 1024 * 1024 * 1024
+# Start the preview processes when the web server loads the application, instead of on the first preview
+SCOUT_PREVIEW_WARM_UP = True
+
+# The maximum number of join inputs (data sources or upstream recipes) that are executed at the same time, per process.
+# Use 1 to execute the inputs of a join one after another.
+SCOUT_JOIN_PARALLELISM = 4
+
+# The number of objects per page of the project resources (data sources, recipes, etc.). Clients can ask for larger
+# pages, up to the maximum page size, using the "page_size" get parameter.
+SCOUT_PAGE_SIZE = 100
+SCOUT_MAX_PAGE_SIZE = 1000
+
+# The size (in bytes) of the chunks of file uploads. Clients can ask for other chunk sizes, up to the maximum.
+SCOUT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+SCOUT_UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Let the reverse proxy send downloaded files instead of the Python worker: None, "x-accel-redirect" (nginx, which
+# needs an internal location serving the media root at SCOUT_SENDFILE_PREFIX) or "x-sendfile" (Apache, lighttpd).
+SCOUT_SENDFILE = None
+SCOUT_SENDFILE_PREFIX = "/protected-media/"
+
+# The number of threads that run short background tasks (like inferring the schemas of data sources) in the web server.
+# With 0, these tasks run in the request that triggers them.
+SCOUT_BACKGROUND_THREADS = 2
+
+# Parse uploaded files into Parquet files once (done by the run workers), so running a recipe on all data doesn't parse
+# the original files again. The ingested data is split into files of at most SCOUT_INGEST_PART_ROWS rows.
+SCOUT_INGEST = True
+SCOUT_INGEST_PART_ROWS = 1000000
@@ -98,14 +98,9 @@ export class WranglerComponent extends React.Component<PageProps, WranglerState>
      * Receive the recipe (receiveRecipe callback).
      */
     public receiveRecipe(body: { [key: string]: any }) {
-        let transformation = body.transformations.filter((item: any) => item["previous"] === null)[0];
-        let transformations = [];
-        while (transformation !== undefined) {
-            let nextId = transformation["id"];
-            transformations.push(transformation);
-            transformation = body.transformations.filter((item: any) => item["previous"] !== null && item["previous"] === nextId)[0];
-        }
-        // Add the position to the now ordered array and assign it to the recipe body object
+        // The transformations are already ordered by the server
+        let transformations = body.transformations;
+        // Add the position to the ordered array and assign it to the recipe body object
         body["transformations"] = transformations.map((value: any, index: number) => {value["pos"] = index; return value;});
         this.setState({ recipeObject: body as Recipe });
     }
@@ -275,29 +270,17 @@ export class WranglerComponent extends React.Component<PageProps, WranglerState>
             let t = this.getTransformations();
             let oldIdx = event.oldIndex;
             let newIdx = event.newIndex;
-            let indicesToUpdate: number[] = [oldIdx, newIdx];
-            if (t.length > oldIdx + 1) {
-                t[oldIdx + 1].previous = t[oldIdx].previous;
-                indicesToUpdate.push(oldIdx + 1)
-            }
-            if (event.oldIndex < event.newIndex) {
+            // The server places a transformation directly after its "previous" one, so only the moved one is updated
+            if (oldIdx < newIdx) {
                 // We're moving the element down in the list
                 t[oldIdx].previous = t[newIdx].id;
-                if (t.length > newIdx + 1) {
-                    t[newIdx + 1].previous = t[oldIdx].id;
-                    indicesToUpdate.push(newIdx + 1)
-                }
             } else {
                 // We're moving the element up in the list
-                t[oldIdx].previous = t[newIdx].previous;
-                t[newIdx].previous = t[oldIdx].id;
-            }
-            let transformationsUpdating = [];
-            for (let idx of indicesToUpdate) {
-                transformationsUpdating.push(t[idx].id);
-                t[idx]['next'] = undefined;
-                this.wranglerService.putTransformation(t[idx].id, t[idx], this.finishUpdateOrdering)
+                t[oldIdx].previous = newIdx > 0 ? t[newIdx - 1].id : null;
             }
+            let transformationsUpdating = [t[oldIdx].id];
+            t[oldIdx]['next'] = undefined;
+            this.wranglerService.putTransformation(t[oldIdx].id, t[oldIdx], this.finishUpdateOrdering)
             this.setState({ transformationsUpdating: transformationsUpdating });
         }
     }
@@ -95,6 +95,9 @@ export class APICaller {
         } else if (body instanceof File) {
             properties = { method: type, headers: this.getHeaders(), body: body };
             properties["headers"]["Content-Type"] = "multipart/form-data";
+        } else if (body instanceof Blob) {
+            properties = { method: type, headers: this.getHeaders(), body: body };
+            properties["headers"]["Content-Type"] = "application/octet-stream";
         } else {
             properties = { method: type, headers: this.getHeaders(), body: JSON.stringify(body) };
         }
@@ -150,6 +153,26 @@ export class APICaller {
             });
     }
 
+    /**
+     * Get all results of a paginated list, by following the "next" links of the pages.
+     * @param url The URL of the list
+     * @param callback The callback, which gets the last page with the results of all pages
+     * @param results The results of the previous pages
+     */
+    public callList(url: string, callback: (body: {}) => void, results: {}[] = []) {
+        this.call(url, "GET", {}, (body: { [key: string]: any }) => {
+            if (!Array.isArray(body["results"])) {
+                callback(body);
+            } else if (body["next"]) {
+                // The API returns absolute URLs, while we're calling it relative to the current origin (and proxy)
+                let next = new URL(body["next"], window.location.href);
+                this.callList(next.pathname + next.search, callback, results.concat(body["results"]));
+            } else {
+                callback({ ...body, "results": results.concat(body["results"]) });
+            }
+        });
+    }
+
     public callDownloadFile(url) {
         let properties = this._prepareCall("GET", {}, {});
 
@@ -211,7 +234,7 @@ export class UserService extends APICaller {
     }
 
     public getUserProjects(callback: (body: {}) => void) {
-        this.call("/scout/api/user_project/", "GET", {}, callback);
+        this.callList("/scout/api/user_project/", callback);
     }
 
     // TODO: Move this to its own service
@@ -275,7 +298,7 @@ export class DataSourceService extends APICaller {
     }
 
     get(callback: (body: {}) => void) {
-        this.call("/scout/api/datasource/", "GET", {}, callback);
+        this.callList("/scout/api/datasource/", callback);
     }
 
     save(data: { [key: string]: any }, callback: (body: {}) => void) {
@@ -294,8 +317,33 @@ export class DataSourceService extends APICaller {
         }
     }
 
+    /**
+     * Upload a file in chunks. The server tells which chunk it expects next, so the upload continues from there.
+     * @param file The file to upload
+     * @param id The id of the user file object to attach the file to
+     * @param callback The callback, which gets the updated user file object
+     */
     uploadFile(file: File, id, callback: (body: {}) => void) {
-        this.call(`/scout/api/datasource_file/${id}/upload`, "PUT", file, callback, false, { "Content-Disposition": `attachment; filename="${file.name}"` });
+        this.call(`/scout/api/datasource_file/${id}/uploads/`, "POST", { size: file.size, original_file_name: file.name },
+            (upload: { [key: string]: any }) => this.uploadChunks(file, id, upload, callback));
+    }
+
+    private uploadChunks(file: File, id, upload: { [key: string]: any }, callback: (body: {}) => void) {
+        let url = `/scout/api/datasource_file/${id}/uploads/${upload["id"]}/`;
+        if (upload["received"] >= upload["size"]) {
+            this.call(`${url}finalize/`, "POST", {}, callback);
+        } else {
+            let start = upload["next_chunk"] * upload["chunk_size"];
+            this.call(`${url}${upload["next_chunk"]}/`, "PUT", file.slice(start, start + upload["chunk_size"]), (body: { [key: string]: any }) => {
+                // When the server expected another chunk, it sends the state of the upload along
+                let state = "upload" in body ? body["upload"] : body;
+                if ("next_chunk" in state) {
+                    this.uploadChunks(file, id, state, callback);
+                } else {
+                    this.addToast({ intent: Intent.DANGER, message: `Couldn't upload ${file.name}` });
+                }
+            });
+        }
     }
 
     downloadUserFile(id) {
@@ -307,7 +355,7 @@ export class DataSourceService extends APICaller {
     }
 
     getFolders(callback: (body: {}) => void) {
-        this.call("/scout/api/datasourcefolder/?orphans_only=1", "GET", {}, callback);
+        this.callList("/scout/api/datasourcefolder/?orphans_only=1", callback);
     }
 
     saveFolder(data: { [key: string]: any }, callback: (body: {}) => void) {
@@ -327,15 +375,15 @@ export class DataSourceService extends APICaller {
 export class RecipeService extends APICaller {
 
     getDataSources(callback: (body: {}) => void) {
-        this.call("/scout/api/datasource/", "GET", {}, callback);
+        this.callList("/scout/api/datasource/", callback);
     }
 
     getJoins(callback: (body: {}) => void) {
-        this.call("/scout/api/join/", "GET", {}, callback);
+        this.callList("/scout/api/join/", callback);
     }
 
     get(callback: (body: {}) => void) {
-        this.call("/scout/api/recipe/", "GET", {}, callback);
+        this.callList("/scout/api/recipe/", callback);
     }
 
     save(data: { [key: string]: any }, callback: (body: {}) => void) {
@@ -359,7 +407,7 @@ export class RecipeService extends APICaller {
     }
 
     getFolders(callback: (body: {}) => void) {
-        this.call("/scout/api/recipefolder/?orphans_only=1", "GET", {}, callback);
+        this.callList("/scout/api/recipefolder/?orphans_only=1", callback);
     }
 
     saveFolder(data: { [key: string]: any }, callback: (body: {}) => void) {
@@ -380,7 +428,7 @@ export class RecipeService extends APICaller {
 export class WranglerService extends APICaller {
 
     get(callback: (body: {}) => void) {
-        this.call("/scout/api/datasource/", "GET", {}, callback);
+        this.callList("/scout/api/datasource/", callback);
     }
 
     getRecipe(recipe: number, callback: (body: {}) => void) {
@@ -433,15 +481,15 @@ export class WranglerService extends APICaller {
 export class JoinService extends APICaller {
 
     get(callback: (body: {}) => void) {
-        this.call("/scout/api/join/", "GET", {}, callback);
+        this.callList("/scout/api/join/", callback);
     }
 
     getDataSources(callback: (body: {}) => void) {
-        this.call("/scout/api/datasource/", "GET", {}, callback);
+        this.callList("/scout/api/datasource/", callback);
     }
 
     getRecipes(callback: (body: {}) => void) {
-        this.call("/scout/api/recipe/", "GET", {}, callback);
+        this.callList("/scout/api/recipe/", callback);
     }
 
     save(data: { [key: string]: any }, callback: (body: {}) => void) {
@@ -463,7 +511,7 @@ export class JoinService extends APICaller {
 export class SettingsService extends APICaller {
 
     get(callback: (body: {}) => void) {
-        this.call("/scout/api/join/", "GET", {}, callback);
+        this.callList("/scout/api/join/", callback);
     }
 
     getProjects(callback: (body: {}) => void) {